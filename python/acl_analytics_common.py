@@ -0,0 +1,599 @@
+# -*- coding: utf-8 -*-
+"""
+acl_analytics_common.py contains the helpers shared by the ACL analytics scripts
+ (vm_policies_overview.py and shared_domain_vports_acl_analytics.py).
+
+It is not meant to be run on its own, the scripts import it from the same
+ folder. The paging and streaming output helpers it uses are part of
+ vspk_examples_common.py.
+
+--- Version history ---
+2026-10-18 - 1.0.0 - Caching entity name resolver
+2026-10-18 - 1.1.0 - Stats ID index of the ACL entry templates
+2026-10-18 - 1.2.0 - Rate limiter shared by worker threads
+2026-10-18 - 1.3.0 - Index of the VMs of an enterprise by UUID
+2026-10-18 - 1.4.0 - SQLite report snapshot for incremental runs
+2026-10-18 - 1.5.0 - Streaming NDJSON and CSV output with optional gzip compression
+2026-10-18 - 1.6.0 - Table driven ACL row builder and shared ether type and protocol tables
+2026-10-18 - 1.7.0 - Moved the paging and streaming output helpers to vspk_examples_common.py
+"""
+from __future__ import division
+
+from builtins import object, str
+from collections import Counter, OrderedDict
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from vspk_examples_common import get_all_pages
+
+logger = logging.getLogger(__name__)
+
+ether_types = {
+    '0x0800': 'IPv4',
+    '0x0806': 'ARP',
+    '0x0842': 'Wake-on-LAN',
+    '0x22F3': 'IETF TRILL',
+    '0x6003': 'DECnet Phase IV',
+    '0x8035': 'RARP',
+    '0x809B': 'AppleTalk ',
+    '0x80F3': 'AARP',
+    '0x8100': '802.1Q and 802.1aq',
+    '0x8137': 'IPX',
+    '0x8204': 'QNX Qnet',
+    '0x86DD': 'IPv6',
+    '0x8808': 'Ethernet flow control',
+    '0x8819': 'CobraNet',
+    '0x8847': 'MPLS unicast',
+    '0x8848': 'MPLS multicast',
+    '0x8863': 'PPPoE Discovery Stage',
+    '0x8864': 'PPPoE Session Stage',
+    '0x8870': 'Jumbo Frames (proposed)',
+    '0x887B': 'HomePlug 1.0 MME',
+    '0x888E': 'EAP over LAN (IEEE 802.1X)',
+    '0x8892': 'PROFINET Protocol',
+    '0x889A': 'HyperSCSI (SCSI over Ethernet)',
+    '0x88A2': 'ATA over Ethernet',
+    '0x88A4': 'EtherCAT Protocol',
+    '0x88A8': 'Provider Bridging (IEEE 802.1ad) ',
+    '0x88AB': 'Ethernet Powerlink',
+    '0x88CC': 'LLDP',
+    '0x88CD': 'SERCOS III',
+    '0x88E1': 'HomePlug AV MME',
+    '0x88E3': 'Media Redundancy Protocol (IEC62439-2)',
+    '0x88E5': 'MAC security (IEEE 802.1AE)',
+    '0x88E7': 'Provider Backbone Bridges (PBB) (IEEE 802.1ah)',
+    '0x88F7': 'Precision Time Protocol (PTP) over Ethernet (IEEE 1588)',
+    '0x8902': 'IEEE 802.1ag Connectivity Fault Management (CFM) Protocol ',
+    '0x8906': 'FCoE',
+    '0x8914': 'FCoE Initialization Protocol',
+    '0x8915': 'RoCE',
+    '0x891D': 'TTE',
+    '0x892F': 'HSR',
+    '0x9000': 'Ethernet Configuration Testing Protocol'
+}
+
+protocols = {
+    '0': 'HOPOPT',
+    '1': 'ICMP',
+    '2': 'IGMP',
+    '3': 'GGP',
+    '4': 'IPv4',
+    '5': 'ST',
+    '6': 'TCP',
+    '7': 'CBT',
+    '8': 'EGP',
+    '9': 'IGP',
+    '10': 'BBN-RCC-MON',
+    '11': 'NVP-II',
+    '12': 'PUP',
+    '13': 'ARGUS',
+    '14': 'EMCON',
+    '15': 'XNET',
+    '16': 'CHAOS',
+    '17': 'UDP',
+    '18': 'MUX',
+    '19': 'DCN-MEAS',
+    '20': 'HMP',
+    '21': 'PRM',
+    '22': 'XNS-IDP',
+    '23': 'TRUNK-1',
+    '24': 'TRUNK-2',
+    '25': 'LEAF-1',
+    '26': 'LEAF-2',
+    '27': 'RDP',
+    '28': 'IRTP',
+    '29': 'ISO-TP4',
+    '30': 'NETBLT',
+    '31': 'MFE-NSP',
+    '32': 'MERIT-INP',
+    '33': 'DCCP',
+    '34': '3PC',
+    '35': 'IDPR',
+    '36': 'XTP',
+    '37': 'DDP',
+    '38': 'IDPR-CMTP',
+    '39': 'TP++',
+    '40': 'IL',
+    '41': 'IPv6',
+    '42': 'SDRP',
+    '43': 'IPv6-Route',
+    '44': 'IPv6-Frag',
+    '45': 'IDRP',
+    '46': 'RSVP',
+    '47': 'GRE',
+    '48': 'DSR',
+    '49': 'BNA',
+    '50': 'ESP',
+    '51': 'AH',
+    '52': 'I-NLSP',
+    '53': 'SWIPE',
+    '54': 'NARP',
+    '55': 'MOBILE',
+    '56': 'TLSP',
+    '57': 'SKIP',
+    '58': 'IPv6-ICMP',
+    '59': 'IPv6-NoNxt',
+    '60': 'IPv6-Opts',
+    '62': 'CFTP',
+    '64': 'SAT-EXPAK',
+    '65': 'KRYPTOLAN',
+    '66': 'RVD',
+    '67': 'IPPC',
+    '69': 'SAT-MON',
+    '70': 'VISA',
+    '71': 'IPCV',
+    '72': 'CPNX',
+    '73': 'CPHB',
+    '74': 'WSN',
+    '75': 'PVP',
+    '76': 'BR-SAT-MON',
+    '77': 'SUN-ND',
+    '78': 'WB-MON',
+    '79': 'WB-EXPAK',
+    '80': 'ISO-IP',
+    '81': 'VMTP',
+    '82': 'SECURE-VMTP',
+    '83': 'VINES',
+    '84': 'IPTM',
+    '85': 'NSFNET-IGP',
+    '86': 'DGP',
+    '87': 'TCF',
+    '88': 'EIGRP',
+    '89': 'OSPFIGP',
+    '90': 'Sprite-RPC',
+    '91': 'LARP',
+    '92': 'MTP',
+    '93': 'AX.25',
+    '94': 'IPIP',
+    '95': 'MICP',
+    '96': 'SCC-SP',
+    '97': 'ETHERIP',
+    '98': 'ENCAP',
+    '100': 'GMTP',
+    '101': 'IFMP',
+    '102': 'PNNI',
+    '103': 'PIM',
+    '104': 'ARIS',
+    '105': 'SCPS',
+    '106': 'QNX',
+    '107': 'A/N',
+    '108': 'IPComp',
+    '109': 'SNP',
+    '110': 'Compaq-Peer',
+    '111': 'IPX-in-IP',
+    '112': 'VRRP',
+    '113': 'PGM',
+    '115': 'L2TP',
+    '116': 'DDX',
+    '117': 'IATP',
+    '118': 'STP',
+    '119': 'SRP',
+    '120': 'UTI',
+    '121': 'SMP',
+    '122': 'SM',
+    '123': 'PTP',
+    '124': 'ISIS over IPv4',
+    '125': 'FIRE',
+    '126': 'CRTP',
+    '127': 'CRUDP',
+    '128': 'SSCOPMCE',
+    '129': 'IPLT',
+    '130': 'SPS',
+    '131': 'PIPE',
+    '132': 'SCTP',
+    '133': 'FC',
+    '134': 'RSVP-E2E-IGNORE',
+    '135': 'Mobility Header',
+    '136': 'UDPLite',
+    '137': 'MPLS-in-IP',
+    '138': 'manet',
+    '139': 'HIP',
+    '140': 'Shim6',
+    '141': 'WESP',
+    '142': 'ROHC',
+    '255': 'Reserved'
+}
+
+
+class RateLimiter(object):
+    """
+    Spreads calls from multiple threads so at most max_rate calls per second
+    are started.
+    """
+
+    def __init__(self, max_rate):
+        self.interval = 1.0 / max_rate
+        self._next_time = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Blocks until the next call is allowed
+        """
+
+        with self._lock:
+            now = time.time()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class EntityResolver(object):
+    """
+    Resolves the name of an entity by its REST name and ID. Results, including
+    entities which do not exist, are kept in an LRU cache with a TTL, so each
+    entity is only fetched once.
+    """
+
+    def __init__(self, nc, max_size=10000, ttl=3600):
+        self.nc = nc
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, rest_name, entity_id):
+        """
+        Returns the name of the entity, or None if there is no fetcher for the
+        REST name or the entity does not exist
+        """
+
+        if not rest_name:
+            return None
+
+        key = (rest_name.lower(), entity_id)
+        now = time.time()
+        with self._lock:
+            if key in self._cache:
+                name, expires = self._cache.pop(key)
+                if expires > now:
+                    self._cache[key] = (name, expires)
+                    self.hits += 1
+                    return name
+            self.misses += 1
+
+        name = None
+        fetcher = self.nc.user.fetcher_for_rest_name(key[0])
+        if fetcher is not None:
+            logger.debug('Fetching %s with ID %s' % (key[0], entity_id))
+            entity = fetcher.get_first(filter='ID == "%s"' % entity_id)
+            if entity is not None:
+                name = entity.name
+
+        with self._lock:
+            self._cache[key] = (name, now + self.ttl)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return name
+
+    def log_statistics(self):
+        """
+        Logs the hit and miss counters of the cache
+        """
+
+        logger.info('Entity resolver cache: %s hits, %s misses, %s cached entities' % (self.hits, self.misses, len(self._cache)))
+
+
+class ACLEntryTemplateIndex(object):
+    """
+    Index of all ingress, egress and advanced forwarding ACL entry templates by
+    their stats ID, which is what the policy decision entries point to.
+    """
+
+    fetcher_names = {
+        'Ingress': 'ingress_acl_entry_templates',
+        'Egress': 'egress_acl_entry_templates',
+        'Forward': 'ingress_adv_fwd_entry_templates'
+    }
+
+    def __init__(self, nc, page_size=500):
+        self.nc = nc
+        self.page_size = page_size
+        self._index = dict((acl_type, {}) for acl_type in self.fetcher_names)
+        self._lock = threading.Lock()
+
+    def prefetch(self):
+        """
+        Fetches all the ACL entry templates once and indexes them by stats ID
+        """
+
+        for acl_type, fetcher_name in self.fetcher_names.items():
+            logger.debug('Prefetching all %s ACL entry templates' % acl_type)
+            fetcher = getattr(self.nc.user, fetcher_name)
+            for acl_rule in get_all_pages(fetcher, self.page_size):
+                if acl_rule.stats_id:
+                    self._index[acl_type][str(acl_rule.stats_id)] = acl_rule
+            logger.info('Indexed %s %s ACL entry templates' % (len(self._index[acl_type]), acl_type))
+
+    def signatures(self):
+        """
+        Returns the last updated date of each indexed ACL entry template, keyed
+        by ACL type and stats ID
+        """
+
+        with self._lock:
+            return dict(('%s:%s' % (acl_type, stats_id), acl_rule.last_updated_date) for acl_type in self._index for stats_id, acl_rule in self._index[acl_type].items() if acl_rule is not None)
+
+    def lookup(self, acl_type, stats_id):
+        """
+        Returns the ACL entry template of the ACL type (Ingress, Egress or Forward)
+        with the stats ID, templates created after the prefetch are fetched and
+        added to the index
+        """
+
+        stats_id = str(stats_id)
+        with self._lock:
+            if stats_id in self._index[acl_type]:
+                return self._index[acl_type][stats_id]
+
+        logger.debug('%s ACL entry template with stats ID %s not in the index, fetching it' % (acl_type, stats_id))
+        acl_rule = getattr(self.nc.user, self.fetcher_names[acl_type]).get_first(filter='statsID == "%s"' % stats_id)
+        with self._lock:
+            self._index[acl_type][stats_id] = acl_rule
+        return acl_rule
+
+
+class VMIndex(object):
+    """
+    Index of the VMs of an enterprise by UUID. All VMs are fetched in pages on
+    the first lookup, VMs missing from the index are fetched individually.
+    """
+
+    def __init__(self, enterprise, page_size=500):
+        self.enterprise = enterprise
+        self.page_size = page_size
+        self._index = None
+        self._lock = threading.Lock()
+
+    def lookup(self, uuid):
+        """
+        Returns the VM with the UUID, or None if it does not exist
+        """
+
+        with self._lock:
+            if self._index is None:
+                logger.debug('Prefetching all VMs of enterprise %s' % self.enterprise.name)
+                self._index = dict((vm.uuid, vm) for vm in get_all_pages(self.enterprise.vms, self.page_size))
+                logger.info('Indexed %s VMs of enterprise %s' % (len(self._index), self.enterprise.name))
+            if uuid in self._index:
+                return self._index[uuid]
+
+        logger.debug('VM with UUID %s not in the index, fetching it' % uuid)
+        vm = self.enterprise.vms.get_first(filter='UUID == "%s"' % uuid)
+        with self._lock:
+            self._index[uuid] = vm
+        return vm
+
+
+def diff_outputs(previous_outputs, outputs):
+    """
+    Returns the added and removed outputs as a list of (change, output) tuples
+    """
+
+    previous_counter = Counter(json.dumps(output, sort_keys=True) for output in previous_outputs)
+    counter = Counter(json.dumps(output, sort_keys=True) for output in outputs)
+    changes = []
+    for output in sorted((counter - previous_counter).elements()):
+        changes.append(('Added', json.loads(output)))
+    for output in sorted((previous_counter - counter).elements()):
+        changes.append(('Removed', json.loads(output)))
+    return changes
+
+
+class ReportSnapshot(object):
+    """
+    SQLite store of the report rows per VM interface of the previous run,
+    together with the last updated date of the VM interface and the ACL entry
+    templates its rows are based on.
+    """
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._seen = set()
+        self._connection.execute('CREATE TABLE IF NOT EXISTS interfaces (id TEXT PRIMARY KEY, last_updated_date TEXT, template_keys TEXT, outputs TEXT)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS templates (key TEXT PRIMARY KEY, last_updated_date TEXT)')
+
+    def compare_templates(self, signatures):
+        """
+        Compares the ACL entry template signatures with the previous run and
+        stores the new ones. Returns the keys of the changed and removed
+        templates, or None if templates were added, as it is unknown which VM
+        interfaces they apply to.
+        """
+
+        signatures = dict((key, json.dumps(last_updated_date)) for key, last_updated_date in signatures.items())
+        with self._lock:
+            previous_signatures = dict(self._connection.execute('SELECT key, last_updated_date FROM templates').fetchall())
+            self._connection.execute('DELETE FROM templates')
+            self._connection.executemany('INSERT INTO templates (key, last_updated_date) VALUES (?, ?)', list(signatures.items()))
+
+        if len(previous_signatures) > 0 and set(signatures) - set(previous_signatures):
+            logger.info('%s ACL entry templates were added since the snapshot' % len(set(signatures) - set(previous_signatures)))
+            return None
+        return set(key for key in previous_signatures if signatures.get(key) != previous_signatures[key])
+
+    def get_current_outputs(self, interface_id, last_updated_date, stale_template_keys):
+        """
+        Returns the stored outputs of the VM interface if it did not change and
+        none of its ACL entry templates are stale, otherwise None
+        """
+
+        if stale_template_keys is None:
+            return None
+
+        with self._lock:
+            stored = self._connection.execute('SELECT last_updated_date, template_keys, outputs FROM interfaces WHERE id = ?', (interface_id,)).fetchone()
+            if stored is None or stored[0] != json.dumps(last_updated_date) or set(json.loads(stored[1])) & stale_template_keys:
+                return None
+            self._seen.add(interface_id)
+        return json.loads(stored[2])
+
+    def save_interface(self, interface_id, last_updated_date, template_keys, outputs):
+        """
+        Stores the outputs of the VM interface and returns its previous outputs
+        """
+
+        with self._lock:
+            stored = self._connection.execute('SELECT outputs FROM interfaces WHERE id = ?', (interface_id,)).fetchone()
+            self._connection.execute('INSERT OR REPLACE INTO interfaces (id, last_updated_date, template_keys, outputs) VALUES (?, ?, ?, ?)', (interface_id, json.dumps(last_updated_date), json.dumps(sorted(template_keys)), json.dumps(outputs)))
+            self._seen.add(interface_id)
+        return json.loads(stored[0]) if stored is not None else []
+
+    def keep_interface(self, interface_id):
+        """
+        Keeps the stored outputs of a VM interface which could not be handled
+        in this run, clearing its last updated date so the next run fetches it
+        again
+        """
+
+        with self._lock:
+            self._connection.execute('UPDATE interfaces SET last_updated_date = NULL WHERE id = ?', (interface_id,))
+            self._seen.add(interface_id)
+
+    def remove_unseen(self):
+        """
+        Removes the VM interfaces which were not handled in this run and returns
+        their outputs
+        """
+
+        removed_outputs = []
+        with self._lock:
+            for interface_id, outputs in self._connection.execute('SELECT id, outputs FROM interfaces').fetchall():
+                if interface_id not in self._seen:
+                    removed_outputs.extend(json.loads(outputs))
+                    self._connection.execute('DELETE FROM interfaces WHERE id = ?', (interface_id,))
+        return removed_outputs
+
+    def close(self):
+        """
+        Commits the snapshot and closes it
+        """
+
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+
+class ACLRowBuilder(object):
+    """
+    Builds the report rows of the ingress, egress and advanced forwarding
+    entries of a policy decision. The fields taken from an ACL entry template
+    are computed once per version of the template and reused for every row
+    pointing to it. The source and destination names are resolved for every
+    row, so the TTL of the entity resolver applies to them.
+    """
+
+    # ACL type, policy decision attribute, template ID key of the entries and whether the template has a stateful flag
+    acl_types = (
+        ('Ingress', 'ingress_acls', 'aclTemplateEntryId', True),
+        ('Egress', 'egress_acls', 'aclTemplateEntryId', True),
+        ('Forward', 'ingress_adv_fwd', 'ingressAdvFwdTemplateEntryId', False)
+    )
+
+    def __init__(self, acl_entry_template_index, entity_resolver):
+        self.acl_entry_template_index = acl_entry_template_index
+        self.entity_resolver = entity_resolver
+        self._template_fields = {}
+
+    def _get_template(self, acl_type, stats_id, stateful):
+        """
+        Returns the ACL entry template with the stats ID and its fields, or None
+        if it does not exist. The fields are computed again when the last
+        updated date of the template changes.
+        """
+
+        acl_rule = self.acl_entry_template_index.lookup(acl_type, stats_id)
+        if not acl_rule:
+            return None
+
+        key = (acl_type, stats_id)
+        cached = self._template_fields.get(key)
+        if cached is None or cached[0] is not acl_rule or cached[1] != acl_rule.last_updated_date:
+            logger.debug('Found a matching %s ACL Template Entry: %s' % (acl_type, acl_rule.description))
+            fields = {
+                'Ether type': acl_rule.ether_type,
+                'Protocol': acl_rule.protocol,
+                'Source type': acl_rule.location_type,
+                'Destination type': acl_rule.network_type,
+                'Source port': acl_rule.source_port,
+                'Destination port': acl_rule.destination_port,
+                'DSCP': acl_rule.dscp,
+                'Action': acl_rule.action
+            }
+            if stateful:
+                fields['Stateful'] = acl_rule.stateful
+            cached = (acl_rule, acl_rule.last_updated_date, fields)
+            self._template_fields[key] = cached
+        return cached[0], cached[2]
+
+    def build(self, policy_decisions, base_fields, template_keys=None):
+        """
+        Returns the rows of all entries of the policy decisions, starting from
+        the base fields, which have to contain the VM name. The keys of the
+        referenced ACL entry templates are added to template_keys if given.
+        """
+
+        rows = []
+        for acl_type, attribute, template_id_key, stateful in self.acl_types:
+            entries = getattr(policy_decisions, attribute)[0]['entries']
+            logger.debug('Handling %s %s ACL entries' % (len(entries), acl_type))
+            for entry in entries:
+                # Using minimal information from the policy decision entry itself
+                row = dict(base_fields)
+                row['ACL type'] = acl_type
+                row['Ether type'] = entry['etherType']
+                row['Protocol'] = entry['protocol']
+                row['Source type'] = 'VM'
+                row['Source name'] = base_fields['VM Name']
+                row['Destination type'] = entry['destinationType']
+                row['Destination name'] = entry['destinationValue']
+                row['Source port'] = entry['sourcePort']
+                row['Destination port'] = entry['destinationPort'] if 'destinationPort' in entry else entry['destPort']
+                row['DSCP'] = entry['DSCP']
+                row['Stateful'] = ''
+                row['Action'] = entry['actionDetails']['actionType']
+
+                # The template entry ID points to the stats ID of an ACL Entry Template in the current version (bug report generated)
+                stats_id = entry[template_id_key]
+                if stats_id:
+                    if template_keys is not None:
+                        template_keys.add('%s:%s' % (acl_type, stats_id))
+                    template = self._get_template(acl_type, str(stats_id), stateful)
+                    if template is not None:
+                        acl_rule, template_fields = template
+                        row.update(template_fields)
+                        source_name = self.entity_resolver.resolve(acl_rule.location_type, acl_rule.location_id)
+                        if source_name is not None:
+                            row['Source name'] = source_name
+                        destination_name = self.entity_resolver.resolve(acl_rule.network_type, acl_rule.network_id)
+                        if destination_name is not None:
+                            row['Destination name'] = destination_name
+                rows.append(row)
+        return rows
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+acl_row_builder_benchmark.py is a micro-benchmark of the row construction of the
+ ACL analytics scripts (vm_policies_overview.py and
+ shared_domain_vports_acl_analytics.py).
+
+It builds the rows of synthetic policy decisions once with the per ACL type
+ blocks the scripts used before, and once with the shared ACLRowBuilder,
+ including the ether type and protocol translation of handle_output. No VSD
+ connection is needed, the ACL entry templates and entity names are served
+ from memory.
+
+--- Version history ---
+2026-10-18 - 1.0.0 - First version
+
+ --- Usage ---
+run 'acl_row_builder_benchmark.py -h' for an overview
+"""
+from __future__ import division, print_function
+
+from builtins import object, range, str
+import argparse
+import timeit
+
+from acl_analytics_common import ACLEntryTemplateIndex, ACLRowBuilder, EntityResolver, ether_types, protocols
+
+
+class SyntheticObject(object):
+    """
+    Object with the given attributes, standing in for VSD entities
+    """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class SyntheticFetcher(object):
+    """
+    Fetcher returning a fixed list of objects
+    """
+
+    def __init__(self, objects):
+        self.objects = objects
+
+    def get(self, filter=None, page=None, page_size=None, commit=True):
+        if page:
+            return []
+        return self.objects
+
+    def get_first(self, filter=None):
+        return SyntheticObject(name=filter.split('"')[1])
+
+
+class SyntheticUser(object):
+    """
+    User object serving the synthetic ACL entry templates and entity names
+    """
+
+    def __init__(self, templates):
+        self.ingress_acl_entry_templates = SyntheticFetcher(templates)
+        self.egress_acl_entry_templates = SyntheticFetcher(templates)
+        self.ingress_adv_fwd_entry_templates = SyntheticFetcher(templates)
+
+    def fetcher_for_rest_name(self, rest_name):
+        return SyntheticFetcher([])
+
+
+def get_args():
+    """
+    Supports the command-line arguments listed below.
+    """
+
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the row construction of the ACL analytics scripts.")
+    parser.add_argument('-e', '--entries', required=False, help='The amount of entries per ACL type in each policy decision (default = 50)', dest='entries', type=int, default=50)
+    parser.add_argument('-i', '--interfaces', required=False, help='The amount of VM interfaces per run (default = 100)', dest='interfaces', type=int, default=100)
+    parser.add_argument('-r', '--repeat', required=False, help='The amount of runs of each implementation, the fastest run is reported (default = 5)', dest='repeat', type=int, default=5)
+    parser.add_argument('-t', '--templates', required=False, help='The amount of distinct ACL entry templates (default = 200)', dest='templates', type=int, default=200)
+    args = parser.parse_args()
+    return args
+
+
+def build_policy_decisions(entries, templates):
+    """
+    Returns a policy decision with the amount of entries per ACL type, half of
+    them pointing to one of the templates
+    """
+
+    def entry(i, template_id_key):
+        return {
+            'etherType': '0x0800',
+            'protocol': '6',
+            'destinationType': 'ANY',
+            'destinationValue': None,
+            'sourcePort': '*',
+            'destPort': '80',
+            'destinationPort': '80',
+            'DSCP': '*',
+            'actionDetails': {'actionType': 'FORWARD'},
+            'aclTemplateEntryId': str(i % templates) if template_id_key == 'aclTemplateEntryId' and i % 2 == 0 else None,
+            'ingressAdvFwdTemplateEntryId': str(i % templates) if template_id_key == 'ingressAdvFwdTemplateEntryId' and i % 2 == 0 else None
+        }
+
+    return SyntheticObject(
+        ingress_acls=[{'entries': [entry(i, 'aclTemplateEntryId') for i in range(entries)]}],
+        egress_acls=[{'entries': [entry(i, 'aclTemplateEntryId') for i in range(entries)]}],
+        ingress_adv_fwd=[{'entries': [entry(i, 'ingressAdvFwdTemplateEntryId') for i in range(entries)]}]
+    )
+
+
+def translate_output(output):
+    """
+    Ether type and protocol translation of handle_output
+    """
+
+    output['Ether type'] = ether_types.get(output['Ether type'], output['Ether type'])
+    output['Protocol'] = protocols.get(output['Protocol'], output['Protocol'])
+
+
+def legacy_translate_output(output):
+    """
+    Ether type and protocol translation of handle_output before the row builder
+    """
+
+    if output['Ether type'] in list(ether_types.keys()):
+        output['Ether type'] = ether_types[output['Ether type']]
+
+    if output['Protocol'] in list(protocols.keys()):
+        output['Protocol'] = protocols[output['Protocol']]
+
+
+def legacy_build(policy_decisions, vm_name, mac, acl_entry_template_index, entity_resolver):
+    """
+    Row construction of the scripts before the row builder, with one block per
+    ACL type
+    """
+
+    rows = []
+    for acl_type, attribute, template_id_key, stateful in ACLRowBuilder.acl_types:
+        for entry in getattr(policy_decisions, attribute)[0]['entries']:
+            acl_rule = None
+
+            output = {
+                'VM Name': vm_name,
+                'Interface MAC': mac,
+                'ACL type': acl_type,
+                'Ether type': entry['etherType'],
+                'Protocol': entry['protocol'],
+                'Source type': 'VM',
+                'Source name': vm_name,
+                'Destination type': entry['destinationType'],
+                'Destination name': entry['destinationValue'],
+                'Source port': entry['sourcePort'],
+                'Destination port': entry['destinationPort'],
+                'DSCP': entry['DSCP'],
+                'Stateful': '',
+                'Action': entry['actionDetails']['actionType']
+            }
+
+            if entry[template_id_key]:
+                acl_rule = acl_entry_template_index.lookup(acl_type, entry[template_id_key])
+
+            if acl_rule:
+                output['Ether type'] = acl_rule.ether_type
+                output['Protocol'] = acl_rule.protocol
+                output['Source type'] = acl_rule.location_type
+                source_name = entity_resolver.resolve(acl_rule.location_type, acl_rule.location_id)
+                if source_name is not None:
+                    output['Source name'] = source_name
+                output['Destination type'] = acl_rule.network_type
+                destination_name = entity_resolver.resolve(acl_rule.network_type, acl_rule.network_id)
+                if destination_name is not None:
+                    output['Destination name'] = destination_name
+                output['Source port'] = acl_rule.source_port
+                output['Destination port'] = acl_rule.destination_port
+                output['DSCP'] = acl_rule.dscp
+                if stateful:
+                    output['Stateful'] = acl_rule.stateful
+                output['Action'] = acl_rule.action
+
+            legacy_translate_output(output)
+            rows.append(output)
+    return rows
+
+
+def main():
+    """
+    Main function running the benchmark
+    """
+
+    # Handling arguments
+    args = get_args()
+
+    templates = [SyntheticObject(
+        stats_id=str(i),
+        description='Rule %s' % i,
+        ether_type='0x0800',
+        protocol='17',
+        location_type='POLICYGROUP',
+        location_id='pg-%s' % (i % 10),
+        network_type='SUBNET',
+        network_id='subnet-%s' % (i % 10),
+        source_port='*',
+        destination_port='53',
+        dscp='*',
+        stateful=True,
+        action='FORWARD',
+        last_updated_date=0
+    ) for i in range(args.templates)]
+    nc = SyntheticObject(user=SyntheticUser(templates))
+    acl_entry_template_index = ACLEntryTemplateIndex(nc=nc)
+    acl_entry_template_index.prefetch()
+    policy_decisions = build_policy_decisions(args.entries, args.templates)
+    rows_per_run = args.interfaces * args.entries * len(ACLRowBuilder.acl_types)
+
+    def run_legacy():
+        entity_resolver = EntityResolver(nc=nc)
+        for i in range(args.interfaces):
+            legacy_build(policy_decisions, 'vm-%s' % i, 'mac-%s' % i, acl_entry_template_index, entity_resolver)
+
+    def run_builder():
+        acl_row_builder = ACLRowBuilder(acl_entry_template_index=acl_entry_template_index, entity_resolver=EntityResolver(nc=nc))
+        for i in range(args.interfaces):
+            for output in acl_row_builder.build(policy_decisions=policy_decisions, base_fields={'VM Name': 'vm-%s' % i, 'Interface MAC': 'mac-%s' % i}):
+                translate_output(output)
+
+    legacy_time = min(timeit.repeat(run_legacy, number=1, repeat=args.repeat))
+    builder_time = min(timeit.repeat(run_builder, number=1, repeat=args.repeat))
+
+    print('%s rows per run, fastest of %s runs' % (rows_per_run, args.repeat))
+    print('Per ACL type blocks: %.3f s, %.2f us per row' % (legacy_time, legacy_time * 1e6 / rows_per_run))
+    print('ACLRowBuilder:       %.3f s, %.2f us per row' % (builder_time, builder_time * 1e6 / rows_per_run))
+    print('Speedup:             %.2fx' % (legacy_time / builder_time))
+    return 0
+
+
+# Start program
+if __name__ == "__main__":
+    main()
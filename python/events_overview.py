@@ -2,12 +2,18 @@
 """
 event_overview produces a table with information on the events for each enterprise the user has access to. Output can also be given in JSON format.
 
+The events are filtered on their received time by VSD and fetched page by page. With the stream option, each event is written as NDJSON or CSV as soon as its page is fetched, optionally gzip compressed into the output file, so memory usage does not grow with the amount of events.
+
+With a single worker, the default, the enterprises are handled one after the other and the streamed events are grouped per enterprise, in the order VSD returns them. With more than one worker, the events of multiple enterprises are fetched concurrently and merged in order of their received time. The events of each enterprise are then kept in memory until all enterprises are fetched. The table output is always sorted on the timestamp.
+
 --- Author ---
 Philippe Dellaert <philippe.dellaert@nuagenetworks.net>
 
 --- Version history ---
 2016-01-26 - 1.0
 2020-07-06 - 1.1 - Migrated to v6 API
+2026-10-18 - 1.2 - Fetch the events page by page and stream them as NDJSON or CSV
+2026-10-18 - 1.3 - Fetch the events of multiple enterprises concurrently and merge them in order of their received time
 
 --- Usage ---
 run 'python event_overview.py -h' for an overview
@@ -28,15 +34,23 @@ python event_overview.py -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S
 ---- Extended JSON output ----
 python event_overview.py -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -e -j
 
+---- Stream the events of the last day as gzip compressed CSV ----
+python event_overview.py -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -t 1d --stream csv -o events.csv.gz -z
+
+---- Stream the events of all enterprises of the last day as NDJSON, fetching 16 enterprises concurrently ----
+python event_overview.py -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -t 1d --stream ndjson -w 16
+
 """
 from __future__ import division
 from __future__ import print_function
 
 from builtins import str
 from past.utils import old_div
+from multiprocessing.pool import ThreadPool
 import argparse
 import datetime
 import getpass
+import heapq
 import json
 import logging
 import re
@@ -45,6 +59,8 @@ import time
 from prettytable import PrettyTable
 from vspk import v6 as vsdk
 
+from vspk_examples_common import StreamingOutput, iterate_all_pages, open_output
+
 
 def get_args():
     """
@@ -58,16 +74,64 @@ def get_args():
     parser.add_argument('-l', '--log-file', required=False, help='File to log to (default = stdout)', dest='logfile', type=str)
     parser.add_argument('-E', '--nuage-enterprise', required=True, help='The enterprise with which to connect to the Nuage VSD/SDK host', dest='nuage_enterprise', type=str)
     parser.add_argument('-H', '--nuage-host', required=True, help='The Nuage VSD/SDK endpoint to connect to', dest='nuage_host', type=str)
+    parser.add_argument('-o', '--output-file', required=False, help='File to write the output to (default = stdout)', dest='output_file', type=str)
     parser.add_argument('-P', '--nuage-port', required=False, help='The Nuage VSD/SDK server port to connect to (default = 8443)', dest='nuage_port', type=int, default=8443)
     parser.add_argument('-p', '--nuage-password', required=False, help='The password with which to connect to the Nuage VSD/SDK host. If not specified, the user is prompted at runtime for a password', dest='nuage_password', type=str)
+    parser.add_argument('--page-size', required=False, help='The amount of events to fetch per request (default = 500)', dest='page_size', type=int, default=500)
+    parser.add_argument('--stream', required=False, help='Stream each event as soon as it is fetched, in NDJSON or CSV format, instead of printing everything at the end. With a single worker the events are grouped per enterprise, they are only ordered by received time with more than one worker', dest='stream_format', type=str, choices=['ndjson', 'csv'])
     parser.add_argument('-u', '--nuage-user', required=True, help='The username with which to connect to the Nuage VSD/SDK host', dest='nuage_username', type=str)
     parser.add_argument('-S', '--disable-SSL-certificate-verification', required=False, help='Disable SSL certificate verification on connect (deprecated)', dest='nosslcheck', action='store_true')
     parser.add_argument('-t', '--time', required=False, help='Indication of how far back in the past the events list should go. Can be set in seconds, minutes (add m), hours (add h) or days (add d) (examples: 60, 60m, 60h or 60d, default is 3600 seconds)', dest='time_difference', type=str, default='3600')
     parser.add_argument('-v', '--verbose', required=False, help='Enable verbose output', dest='verbose', action='store_true')
+    parser.add_argument('-w', '--workers', required=False, help='The amount of enterprises to fetch the events of concurrently. With more than one worker, the events of all enterprises are merged in order of their received time (default = 1)', dest='workers', type=int, default=1)
+    parser.add_argument('-z', '--gzip', required=False, help='Compress the output file with gzip, requires an output file', dest='gzip', action='store_true')
     args = parser.parse_args()
     return args
 
 
+def get_events(enterprise, check_time, end_time, page_size):
+    """
+    Yields the events of an enterprise received from the check time until before the end time (in milliseconds), fetching them page by page without keeping them in the fetcher of the enterprise. The fixed end time keeps the pages stable while new events arrive.
+    """
+
+    return iterate_all_pages(enterprise.event_logs, page_size, filter="eventReceivedTime >= '%s' and eventReceivedTime < '%s'" % (check_time, end_time), commit=False)
+
+
+def get_all_events(enterprises, check_time, end_time, page_size):
+    """
+    Yields the enterprise and event of the events of each enterprise, one enterprise after the other
+    """
+
+    logger = logging.getLogger(__name__)
+    for enterprise in enterprises:
+        logger.debug('Gathering events for enterprise %s' % enterprise.name)
+        for event in get_events(enterprise, check_time, end_time, page_size):
+            yield enterprise, event
+
+
+def get_enterprise_events(enterprise, check_time, end_time, page_size):
+    """
+    Returns the enterprise, its events sorted on their received time and the time it took to fetch them
+    """
+
+    start_time = time.time()
+    events = sorted(get_events(enterprise, check_time, end_time, page_size), key=lambda event: event.event_received_time)
+    return enterprise, events, time.time() - start_time
+
+
+def merge_events(enterprise_events):
+    """
+    Yields the enterprise and event of the sorted events of each enterprise, merged in order of their received time with a k-way heap merge
+    """
+
+    def decorate(index, enterprise, events):
+        for position, event in enumerate(events):
+            yield event.event_received_time, index, position, enterprise, event
+
+    for _, _, _, enterprise, event in heapq.merge(*[decorate(index, enterprise, events) for index, (enterprise, events) in enumerate(enterprise_events)]):
+        yield enterprise, event
+
+
 def main():
     """
     Main function to handle vcenter vm names and the mapping to a policy group
@@ -77,6 +141,7 @@ def main():
     args                = get_args()
     debug               = args.debug
     extended            = args.extended
+    compress            = args.gzip
     json_output         = args.json_output
     log_file            = None
     if args.logfile:
@@ -88,9 +153,13 @@ def main():
     if args.nuage_password:
         nuage_password  = args.nuage_password
     nuage_username      = args.nuage_username
+    output_file         = args.output_file
+    page_size           = args.page_size
+    stream_format       = args.stream_format
     #nosslcheck          = args.nosslcheck
     time_difference     = args.time_difference
     verbose             = args.verbose
+    workers             = args.workers
 
     # Logging settings
     if debug:
@@ -103,6 +172,10 @@ def main():
     logging.basicConfig(filename=log_file, format='%(asctime)s %(levelname)s %(message)s', level=log_level)
     logger = logging.getLogger(__name__)
 
+    if compress and not output_file:
+        logger.critical('The gzip option requires an output file')
+        return 1
+
     # Validating time_difference input
     time_check = re.compile('^([0-9]+)([m|h|d]?)$')
     time_matches = time_check.match(time_difference)
@@ -139,7 +212,14 @@ def main():
         logger.critical('Caught exception: %s' % str(e))
         return 1
 
-    if json_output:
+    output_stream = open_output(output_file=output_file, compress=compress)
+    if stream_format:
+        logger.debug('%s streaming output enabled, not setting up an output table' % stream_format.upper())
+        fields = ['Enterprise', 'Timestamp', 'Date/Time', 'Type', 'Entity', 'Entity parent']
+        if extended:
+            fields.append('Extended info')
+        output_parser = StreamingOutput(stream=output_stream, stream_format=stream_format, fields=fields)
+    elif json_output:
         logger.debug('JSON output enabled, not setting up an output table')
         json_object = []
     elif extended:
@@ -149,37 +229,73 @@ def main():
         logger.debug('Setting up basic output table')
         pt = PrettyTable(['Enterprise', 'Timestamp', 'Date/Time', 'Type', 'Entity', 'Entity parent'])
 
-    unix_check_time = time.time() - time_diff
-    logger.debug('Gathering all events from after UNIX timestamp %s' % unix_check_time)
-
-    for ent in nc.user.enterprises.get():
-        logger.debug('Gathering events for enterprise %s' % ent.name)
-        for event in ent.event_logs.get(filter="eventReceivedTime >= '%s'" % int(unix_check_time * 1000)):
-            logger.debug('Found event of type %s with timestamp %s' % (event.type, event.event_received_time))
-            clean_time = datetime.datetime.fromtimestamp(int(old_div(event.event_received_time, 1000))).strftime('%Y-%m-%d %H:%M:%S')
-
-            if json_output:
-                json_dict = {
-                    'Enterprise': ent.name,
-                    'Timestamp': event.event_received_time,
-                    'Date/Time': clean_time,
-                    'Type': event.type,
-                    'Entity': event.entity_type,
-                    'Entity parent': event.entity_parent_type
-                }
-                if extended:
-                    json_dict['Extended info'] = event.entities
-                json_object.append(json_dict)
-            elif extended:
-                pt.add_row([ent.name, event.event_received_time, clean_time, event.type, event.entity_type, event.entity_parent_type, json.dumps(event.entities)])
-            else:
-                pt.add_row([ent.name, event.event_received_time, clean_time, event.type, event.entity_type, event.entity_parent_type])
+    unix_end_time = time.time()
+    unix_check_time = unix_end_time - time_diff
+    logger.debug('Gathering all events from after UNIX timestamp %s until UNIX timestamp %s' % (unix_check_time, unix_end_time))
+
+    check_time = int(unix_check_time * 1000)
+    end_time = int(unix_end_time * 1000)
+    enterprises = nc.user.enterprises.get()
+    if workers > 1:
+        logger.info('Gathering events for %s enterprises with %s workers' % (len(enterprises), workers))
+        start_time = time.time()
+        enterprise_events = []
+        pool = ThreadPool(workers)
+        try:
+            for ent, events, fetch_time in pool.imap_unordered(lambda ent: get_enterprise_events(ent, check_time, end_time, page_size), enterprises):
+                logger.info('Fetched %s events for enterprise %s in %.3f seconds' % (len(events), ent.name, fetch_time))
+                enterprise_events.append((ent, events))
+        finally:
+            pool.close()
+            pool.join()
+        logger.info('Fetched the events of %s enterprises in %.3f seconds' % (len(enterprises), time.time() - start_time))
+        enterprise_events = merge_events(enterprise_events)
+    else:
+        enterprise_events = get_all_events(enterprises, check_time, end_time, page_size)
+
+    for ent, event in enterprise_events:
+        logger.debug('Found event of type %s with timestamp %s' % (event.type, event.event_received_time))
+        clean_time = datetime.datetime.fromtimestamp(int(old_div(event.event_received_time, 1000))).strftime('%Y-%m-%d %H:%M:%S')
+
+        if stream_format:
+            output = {
+                'Enterprise': ent.name,
+                'Timestamp': event.event_received_time,
+                'Date/Time': clean_time,
+                'Type': event.type,
+                'Entity': event.entity_type,
+                'Entity parent': event.entity_parent_type
+            }
+            if extended:
+                output['Extended info'] = event.entities if stream_format == 'ndjson' else json.dumps(event.entities)
+            output_parser.write(output)
+        elif json_output:
+            json_dict = {
+                'Enterprise': ent.name,
+                'Timestamp': event.event_received_time,
+                'Date/Time': clean_time,
+                'Type': event.type,
+                'Entity': event.entity_type,
+                'Entity parent': event.entity_parent_type
+            }
+            if extended:
+                json_dict['Extended info'] = event.entities
+            json_object.append(json_dict)
+        elif extended:
+            pt.add_row([ent.name, event.event_received_time, clean_time, event.type, event.entity_type, event.entity_parent_type, json.dumps(event.entities)])
+        else:
+            pt.add_row([ent.name, event.event_received_time, clean_time, event.type, event.entity_type, event.entity_parent_type])
 
     logger.debug('Printing output')
-    if json_output:
-        print(json.dumps(json_object, sort_keys=True, indent=4))
+    if stream_format:
+        logger.info('Streamed %s events' % output_parser.count)
+    elif json_output:
+        print(json.dumps(json_object, sort_keys=True, indent=4), file=output_stream)
     else:
-        print(pt.get_string(sortby='Timestamp'))
+        print(pt.get_string(sortby='Timestamp'), file=output_stream)
+
+    if output_file:
+        output_stream.close()
 
     return 0
 
@@ -4,12 +4,29 @@ gather_statistics.py will gather statistics on one ore more Domains, L2 Domains,
 
 The user can specify which statistics to gather, if none are specified, all of them will be gathered. Data can be presented as a table, or as JSON.
 
+The statistics policies of all entities are fetched once before the statistics are gathered. The resulting data collection frequencies can be stored in a cache file, which is reused by subsequent runs as long as it is not older than its TTL.
+
+For large amounts of entities, the data can also be streamed as newline delimited JSON (NDJSON) or CSV. In that case each entity is written as soon as its statistics are gathered, so memory usage does not grow with the amount of entities.
+
+The statistics can also be exposed to Prometheus. In exporter mode, the script keeps gathering the statistics every interval in the background and serves the most recent datapoint of each statistic type from memory on the /metrics HTTP endpoint.
+
+For fleet wide analysis, the datapoints can be stored as NumPy arrays per statistic type in a compact columnar .npz file. Totals, rates, percentiles and maximums are calculated for all entities at once and stored in the same file, and the top talkers per statistic type are printed.
+
+The script can also keep running and gather the statistics every interval using the same session. The list of entities is refreshed periodically and for each entity only the statistics since its last successful gathering are requested. The end of the last successful gathering per entity can be stored in a checkpoint file, so a restart (or a run from cron) continues where the previous one stopped.
+
 --- Author ---
 Philippe Dellaert <philippe.dellaert@nuagenetworks.net>
 
 --- Version history ---
 2016-01-26 - 1.0
 2020-07-06 - 1.1 - Migrate to v6 API
+2026-10-18 - 1.2 - Concurrent statistics gathering with a pool of workers
+2026-10-18 - 1.3 - Streaming NDJSON and CSV output
+2026-10-18 - 1.4 - Statistics policy prefetch and cache
+2026-10-18 - 1.5 - Continuous gathering with incremental time windows
+2026-10-18 - 1.6 - Prometheus exporter mode
+2026-10-18 - 1.7 - Columnar NumPy output with fleet wide summaries
+2026-10-18 - 1.8 - Paged bulk fetch of vm-interfaces for VMs
 
 --- Usage ---
 run 'python gather_statistics.py -h' for an overview
@@ -32,23 +49,58 @@ python gather_statistics.py -e SUBNET -E csp -H 10.167.43.64 -P 443 -p csproot -
 
 ---- Gather BYTES_IN and BYTES_OUT statistics for the last hour on all VMs with tabled output ----
 python gather_statistics.py -e VM -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -s BYTES_IN -s BYTES_OUT
+
+---- Gather all statistics for the last hour on all SUBNETS with json output, using 20 concurrent workers ----
+python gather_statistics.py -e SUBNET -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -j -w 20
+
+---- Stream all statistics for the last hour on all VMs as NDJSON to a file ----
+python gather_statistics.py -e VM -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -w 20 --stream ndjson -o stats.ndjson
+
+---- Gather all statistics for the last minute on all SUBNETS, caching the statistics policies for a day ----
+python gather_statistics.py -e SUBNET -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -j -t 60 -c /var/tmp/subnet_policies.json -C 86400
+
+---- Keep streaming all statistics on all VMs every minute, continuing from the checkpoint file after a restart ----
+python gather_statistics.py -e VM -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -w 20 --stream ndjson -i 60 -k /var/tmp/vm_checkpoints.json
+
+---- Expose all statistics on all SUBNETS to Prometheus on port 9477, refreshed every minute ----
+python gather_statistics.py -e SUBNET -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -w 20 -i 60 --exporter-port 9477
+
+---- Store a day of BYTES_IN and BYTES_OUT statistics on all VMs in a columnar file and show the top 20 talkers ----
+python gather_statistics.py -e VM -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -w 20 -t 1d -s BYTES_IN -s BYTES_OUT --columnar vm_stats.npz --top 20
 """
 from __future__ import division
 from __future__ import print_function
 
+from future import standard_library
+standard_library.install_aliases()
 from builtins import str
 from past.utils import old_div
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from multiprocessing.pool import ThreadPool
+from socketserver import ThreadingMixIn
 import argparse
+import csv
 import datetime
 import getpass
 import json
 import logging
+import os
 import re
+import sys
+import threading
 import time
 
 from prettytable import PrettyTable
 from vspk import v6 as vsdk
 
+from vspk_examples_common import get_all_pages
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 statistics_valid_types = [
     'BYTES_IN',
     'BYTES_OUT',
@@ -73,6 +125,135 @@ entity_valid_types = [
     'VM'
 ]
 
+logger = None
+metrics_snapshot = ''
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server handling each request in a separate thread
+    """
+
+    daemon_threads = True
+
+
+class ColumnarStatistics(object):
+    """
+    Stores the datapoints of each statistic type as NumPy arrays and calculates summaries over all entities
+    """
+
+    def __init__(self, statistic_types):
+        self.statistic_types = statistic_types
+        self.ids = []
+        self.names = []
+        self.start_timestamps = []
+        self.end_timestamps = []
+        self.datapoints = dict((statistic_type, []) for statistic_type in statistic_types)
+
+    def add(self, entity_id, output_name, start_timestamp, end_timestamp, stats_data):
+        self.ids.append(entity_id)
+        self.names.append(output_name)
+        self.start_timestamps.append(start_timestamp)
+        self.end_timestamps.append(end_timestamp)
+        for statistic_type in self.statistic_types:
+            # Missing datapoints are stored as NaN
+            values = [np.nan if value is None else value for value in stats_data.get(statistic_type) or []]
+            self.datapoints[statistic_type].append(np.asarray(values, dtype=np.float64))
+
+    def summarize(self):
+        """
+        Calculates the total, rate per second, p50, p95 and maximum of each statistic type per entity
+        """
+
+        durations = np.maximum(np.asarray(self.end_timestamps, dtype=np.float64) - np.asarray(self.start_timestamps, dtype=np.float64), 1)
+        summaries = {}
+        for statistic_type in self.statistic_types:
+            series = self.datapoints[statistic_type]
+            summary = dict((key, np.full(len(series), np.nan)) for key in ['total', 'rate', 'p50', 'p95', 'max'])
+
+            # Series of the same length are stacked, so each group is calculated at once
+            lengths = np.asarray([len(values) for values in series], dtype=np.int64)
+            for length in np.unique(lengths):
+                if length == 0:
+                    continue
+                indices = np.nonzero(lengths == length)[0]
+                stacked = np.vstack([series[index] for index in indices])
+                valid = ~np.all(np.isnan(stacked), axis=1)
+                indices = indices[valid]
+                stacked = stacked[valid]
+                if len(indices) == 0:
+                    continue
+                summary['total'][indices] = np.nansum(stacked, axis=1)
+                summary['p50'][indices], summary['p95'][indices] = np.nanpercentile(stacked, [50, 95], axis=1)
+                summary['max'][indices] = np.nanmax(stacked, axis=1)
+            summary['rate'] = summary['total'] / durations
+            summaries[statistic_type] = summary
+        return summaries
+
+    def save(self, columnar_file, summaries):
+        """
+        Saves the datapoints and summaries to a compressed .npz file, the datapoints of all entities are concatenated per statistic type with offsets per entity
+        """
+
+        arrays = {
+            'ids': np.asarray(self.ids, dtype=np.str_),
+            'names': np.asarray(self.names, dtype=np.str_),
+            'start_timestamps': np.asarray(self.start_timestamps, dtype=np.int64),
+            'end_timestamps': np.asarray(self.end_timestamps, dtype=np.int64)
+        }
+        for statistic_type in self.statistic_types:
+            series = self.datapoints[statistic_type]
+            arrays['%s_offsets' % statistic_type] = np.concatenate([[0], np.cumsum([len(values) for values in series])]).astype(np.int64)
+            arrays[statistic_type] = np.concatenate(series) if series else np.empty(0, dtype=np.float64)
+            for key, values in summaries[statistic_type].items():
+                arrays['%s_%s' % (statistic_type, key)] = values
+        np.savez_compressed(columnar_file, **arrays)
+
+    def top_talkers(self, summaries, top):
+        """
+        Returns the entities with the highest totals per statistic type
+        """
+
+        talkers = []
+        for statistic_type in self.statistic_types:
+            summary = summaries[statistic_type]
+            totals = np.where(np.isnan(summary['total']), -np.inf, summary['total'])
+            for rank, index in enumerate(np.argsort(-totals, kind='stable')[:top]):
+                if np.isinf(totals[index]):
+                    break
+                talkers.append({
+                    'Statistic': statistic_type,
+                    'Rank': rank + 1,
+                    'Name': self.names[index],
+                    'Total': float(summary['total'][index]),
+                    'Rate (/s)': round(float(summary['rate'][index]), 3),
+                    'p50': float(summary['p50'][index]),
+                    'p95': float(summary['p95'][index]),
+                    'Max': float(summary['max'][index])
+                })
+        return talkers
+
+
+class MetricsHTTPHandler(BaseHTTPRequestHandler):
+    """
+    Serves the last gathered statistics snapshot in the Prometheus text format on /metrics
+    """
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = metrics_snapshot.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('Exporter request from %s: %s' % (self.client_address[0], format % args))
+
 
 def get_args():
     """
@@ -80,34 +261,349 @@ def get_args():
     """
 
     parser = argparse.ArgumentParser(description="Tool to gather statistics on domains, zones, subnets or vports within a certain time frame.")
+    parser.add_argument('--columnar', required=False, help='Store the datapoints as NumPy arrays per statistic type in this .npz file, together with the total, rate, p50, p95 and maximum per entity, and print the top talkers (requires numpy)', dest='columnar_file', type=str)
+    parser.add_argument('-c', '--policy-cache', required=False, help='File in which the data collection frequencies of the statistics policies are cached between runs', dest='policy_cache', type=str)
+    parser.add_argument('-C', '--policy-cache-ttl', required=False, help='The amount of seconds the statistics policy cache is valid (default = 3600)', dest='policy_cache_ttl', type=int, default=3600)
     parser.add_argument('-d', '--debug', required=False, help='Enable debug output', dest='debug', action='store_true')
     parser.add_argument('-e', '--entity-type', required=True, help='The type of entity to gather the statistics for, can be DOMAIN, ZONE, SUBNET or VM.', dest='entity_type', type=str, choices=entity_valid_types)
     parser.add_argument('-j', '--json', required=False, help='Print as JSON, not as a table', dest='json_output', action='store_true')
+    parser.add_argument('-i', '--interval', required=False, help='Keep running and gather the statistics every interval seconds, only requesting the statistics since the last successful gathering of each entity', dest='interval', type=int)
+    parser.add_argument('-k', '--checkpoint-file', required=False, help='File in which the end timestamp of the last successful gathering of each entity is stored, the next gathering starts from that timestamp', dest='checkpoint_file', type=str)
     parser.add_argument('-l', '--log-file', required=False, help='File to log to (default = stdout)', dest='logfile', type=str)
+    parser.add_argument('-o', '--output-file', required=False, help='File to write the output to (default = stdout)', dest='output_file', type=str)
     parser.add_argument('-n', '--entity-name', required=False, help='Entity name to provide statistics for. If not specified all entities of the entiy-type will be used', dest='entity_name', type=str)
+    parser.add_argument('--exporter-address', required=False, help='The address on which the Prometheus exporter listens (default = 127.0.0.1)', dest='exporter_address', type=str, default='127.0.0.1')
+    parser.add_argument('--exporter-port', required=False, help='Run as a Prometheus exporter serving the statistics on /metrics on this port, the statistics are gathered every interval (default interval = 60)', dest='exporter_port', type=int)
     parser.add_argument('-E', '--nuage-enterprise', required=True, help='The enterprise with which to connect to the Nuage VSD/SDK host', dest='nuage_enterprise', type=str)
     parser.add_argument('-H', '--nuage-host', required=True, help='The Nuage VSD/SDK endpoint to connect to', dest='nuage_host', type=str)
+    parser.add_argument('-r', '--entity-refresh', required=False, help='When running with an interval, the amount of seconds after which the list of entities is refreshed (default = 600)', dest='entity_refresh', type=int, default=600)
+    parser.add_argument('--page-size', required=False, help='The amount of vm-interfaces to fetch per request when gathering statistics on all VMs, and of statistics policies to fetch per request when prefetching them (default = 500)', dest='page_size', type=int, default=500)
     parser.add_argument('-P', '--nuage-port', required=False, help='The Nuage VSD/SDK server port to connect to (default = 8443)', dest='nuage_port', type=int, default=8443)
     parser.add_argument('-p', '--nuage-password', required=False, help='The password with which to connect to the Nuage VSD/SDK host. If not specified, the user is prompted at runtime for a password', dest='nuage_password', type=str)
+    parser.add_argument('--top', required=False, help='The amount of top talkers per statistic type to print with the columnar output (default = 10)', dest='top', type=int, default=10)
     parser.add_argument('-u', '--nuage-user', required=True, help='The username with which to connect to the Nuage VSD/SDK host', dest='nuage_username', type=str)
     parser.add_argument('-s', '--statistic-type', required=False, help='The type of statistics to gather. If not specified, all are used. Can be specified multiple times. Possible values are: BYTES_IN, BYTES_OUT, EGRESS_BYTE_COUNT, EGRESS_PACKET_COUNT, INGRESS_BYTE_COUNT, INGRESS_PACKET_COUNT, PACKETS_DROPPED_BY_RATE_LIMIT, PACKETS_IN, PACKETS_IN_DROPPED, PACKETS_IN_ERROR, PACKETS_OUT, PACKETS_OUT_DROPPED, PACKETS_OUT_ERROR', dest='statistic_types', type=str, choices=statistics_valid_types, action='append')
+    parser.add_argument('--stream', required=False, help='Stream the output per entity as soon as its statistics are gathered, in NDJSON or CSV format, instead of printing everything at the end', dest='stream_format', type=str, choices=['ndjson', 'csv'])
     parser.add_argument('-S', '--disable-SSL-certificate-verification', required=False, help='Disable SSL certificate verification on connect (deprecated)', dest='nosslcheck', action='store_true')
-    parser.add_argument('-t', '--time', required=False, help='Indication of how far back in the past the statistics should go. Can be set in seconds, minutes (add m), hours (add h) or days (add d) (examples: 60, 60m, 60h or 60d, default is 3600 seconds)', dest='time_difference', type=str, default='3600')
+    parser.add_argument('-t', '--time', required=False, help='Indication of how far back in the past the statistics should go for entities without a checkpoint. Can be set in seconds, minutes (add m), hours (add h) or days (add d) (examples: 60, 60m, 60h or 60d, default is 3600 seconds)', dest='time_difference', type=str, default='3600')
     parser.add_argument('-v', '--verbose', required=False, help='Enable verbose output', dest='verbose', action='store_true')
+    parser.add_argument('-w', '--workers', required=False, help='The amount of concurrent workers gathering statistics, output order is kept (default = 1)', dest='workers', type=int, default=1)
     args = parser.parse_args()
     return args
 
 
+def get_entity_data_frequency(entity, output_type):
+    """
+    Fetches the data collection frequency of the statistics policy of an entity, returns None if the entity has no statistics policy
+    """
+
+    logger.debug('Looking for a statistics policy on %s %s' % (output_type, entity.name))
+    entity_stat_policies = entity.statistics_policies.get()
+    if len(entity_stat_policies) > 0:
+        logger.debug('Found at least one statistics policy on %s %s, getting data collection frequency' % (output_type, entity.name))
+        return entity_stat_policies[0].data_collection_frequency
+    return None
+
+
+def get_data_frequencies(nc, entities, entity_type, output_type, policy_cache, policy_cache_ttl, page_size, pool):
+    """
+    Builds an index of entity ID to the data collection frequency of its statistics policy (None if it has none), using the cache file if it is still valid
+    """
+
+    data_frequencies = {}
+    cache_time = int(time.time())
+    if entity_type == 'VM':
+        logger.debug('VM interfaces have no statistics policies, using default data collection frequency')
+        return data_frequencies
+
+    # Loading the cache
+    if policy_cache and os.path.isfile(policy_cache):
+        logger.debug('Loading statistics policy cache %s' % policy_cache)
+        try:
+            with open(policy_cache, 'r') as cache_file:
+                cache = json.load(cache_file)
+            if cache['entity_type'] == entity_type and cache_time - cache['timestamp'] < policy_cache_ttl:
+                data_frequencies = cache['frequencies']
+                cache_time = cache['timestamp']
+                logger.info('Loaded %s data collection frequencies from the statistics policy cache' % len(data_frequencies))
+            else:
+                logger.info('Statistics policy cache %s is expired or for another entity type, ignoring it' % policy_cache)
+        except (IOError, KeyError, ValueError) as e:
+            logger.warning('Unable to load statistics policy cache %s, ignoring it: %s' % (policy_cache, str(e)))
+
+    missing_entities = [entity for entity in entities if entity.id not in data_frequencies]
+    if len(missing_entities) == 0:
+        return data_frequencies
+
+    # Prefetching the statistics policies of the entity type in pages, a complete prefetch also tells which entities have none. Falling back to a fetch per entity if it is not possible
+    policy_fetcher = nc.user.fetcher_for_rest_name('statisticspolicy')
+    unresolved_entities = missing_entities
+    if policy_fetcher is not None:
+        logger.debug('Prefetching all statistics policies of %ss in pages of %s' % (output_type, page_size))
+        missing_ids = set(entity.id for entity in missing_entities)
+        try:
+            for policy in get_all_pages(policy_fetcher, page_size, filter='parentType == "%s"' % entity_type.lower()):
+                if policy.parent_id in missing_ids and policy.parent_id not in data_frequencies:
+                    data_frequencies[policy.parent_id] = policy.data_collection_frequency
+        except Exception as e:
+            logger.warning('Unable to prefetch all statistics policies, fetching them per %s: %s' % (output_type, str(e)))
+            unresolved_entities = [entity for entity in missing_entities if entity.id not in data_frequencies]
+        else:
+            for entity in missing_entities:
+                data_frequencies.setdefault(entity.id, None)
+            unresolved_entities = []
+    else:
+        logger.debug('Unable to prefetch all statistics policies, fetching them per %s' % output_type)
+    if len(unresolved_entities) > 0:
+        fetch_function = partial(get_entity_data_frequency, output_type=output_type)
+        map_function = pool.map if pool is not None else map
+        for entity, entity_data_freq in zip(unresolved_entities, map_function(fetch_function, unresolved_entities)):
+            data_frequencies[entity.id] = entity_data_freq
+    logger.info('Fetched data collection frequencies for %s %ss' % (len(missing_entities), output_type))
+
+    # Saving the cache
+    if policy_cache:
+        logger.debug('Saving statistics policy cache %s' % policy_cache)
+        try:
+            with open(policy_cache, 'w') as cache_file:
+                json.dump({
+                    'entity_type': entity_type,
+                    'timestamp': cache_time,
+                    'frequencies': data_frequencies
+                }, cache_file)
+        except IOError as e:
+            logger.warning('Unable to save statistics policy cache %s: %s' % (policy_cache, str(e)))
+
+    return data_frequencies
+
+
+def get_vm_interfaces_page(page, nc, page_size, fetcher=None):
+    """
+    Fetches a single page of all the vm-interfaces the user has access to, with a new fetcher unless one is given
+    """
+
+    logger.debug('Fetching page %s of the vm-interfaces' % page)
+    if fetcher is None:
+        fetcher = vsdk.NUVMInterfacesFetcher.fetcher_with_object(parent_object=nc.user)
+    return fetcher.get(page=page, page_size=page_size)
+
+
+def get_all_vm_interfaces(nc, page_size, pool):
+    """
+    Fetches all the vm-interfaces the user has access to in pages, the pages after the first one are fetched concurrently if a pool is available
+    """
+
+    first_page_fetcher = vsdk.NUVMInterfacesFetcher.fetcher_with_object(parent_object=nc.user)
+    vm_interfaces = get_vm_interfaces_page(0, nc=nc, page_size=page_size, fetcher=first_page_fetcher)
+    total_count = first_page_fetcher.current_total_count
+    if total_count is None:
+        # Without a total count, keep fetching until a page is not full
+        page = 1
+        page_vm_interfaces = vm_interfaces
+        while len(page_vm_interfaces) == page_size:
+            page_vm_interfaces = get_vm_interfaces_page(page, nc=nc, page_size=page_size)
+            vm_interfaces.extend(page_vm_interfaces)
+            page += 1
+        return vm_interfaces
+
+    pages = list(range(1, int(old_div(total_count + page_size - 1, page_size))))
+    fetch_function = partial(get_vm_interfaces_page, nc=nc, page_size=page_size)
+    map_function = pool.map if pool is not None else map
+    for page_vm_interfaces in map_function(fetch_function, pages):
+        vm_interfaces.extend(page_vm_interfaces)
+    return vm_interfaces
+
+
+def get_entities(nc, entity_type, output_type, entity_name, page_size, pool):
+    """
+    Gets the entities matching the search, for VMs all their vm-interfaces are returned. Also returns an index of VM ID to VM name
+    """
+
+    search_query = 'name == "%s"' % entity_name if entity_name else None
+    logger.debug('Getting %ss matching the search' % output_type)
+    entities = nc.user.fetcher_for_rest_name(entity_type.lower()).get(filter=search_query)
+    vm_names = {}
+
+    if entity_type == 'VM' and entities:
+        vms = entities
+        entities = []
+        vm_names = dict((vm.id, vm.name) for vm in vms)
+        if entity_name:
+            logger.debug('Getting the vm-interfaces of the matching VMs')
+            for vm in vms:
+                entities.extend(vm.vm_interfaces.get())
+        else:
+            # Joining all vm-interfaces to their VM, in the order of the VMs
+            logger.debug('Getting all vm-interfaces in pages of %s' % page_size)
+            vm_interfaces_per_vm = {}
+            for vm_interface in get_all_vm_interfaces(nc=nc, page_size=page_size, pool=pool):
+                vm_interfaces_per_vm.setdefault(vm_interface.parent_id, []).append(vm_interface)
+            for vm in vms:
+                entities.extend(vm_interfaces_per_vm.get(vm.id, []))
+
+    # Skipping BackHaul entities
+    if entity_type != 'VM':
+        logger.debug('Skipping BackHaul %ss' % output_type)
+        entities = [entity for entity in entities if 'BackHaul' not in entity.name]
+
+    return entities, vm_names
+
+
+def get_entity_statistics(entity, data_frequencies, output_type, stat_start_times, stat_end_time, stat_metric_types_str):
+    """
+    Gathers the statistics of a single entity, returns the amount of datapoints, the statistics data (None if the request failed) and the latency of the request in seconds
+    """
+
+    request_start_time = time.time()
+    stat_start_time = stat_start_times[entity.id]
+
+    # Getting stats collection frequency
+    entity_data_freq = data_frequencies.get(entity.id) or 60
+    logger.debug('Data collection frequency for %s %s is %s' % (output_type, entity.name, entity_data_freq))
+
+    num_data_points = max(1, int(old_div(stat_end_time - stat_start_time, entity_data_freq)))
+
+    # Collecting statistics
+    logger.debug('Collecting %s datapoints of statistics %s on %s %s from timestamp %s to timestamp %s' % (num_data_points, stat_metric_types_str, output_type, entity.name, stat_start_time, stat_end_time))
+    try:
+        stats_data = entity.statistics.get_first(query_parameters={
+            'startTime': stat_start_time,
+            'endTime': stat_end_time,
+            'numberOfDataPoints': num_data_points,
+            'metricTypes': stat_metric_types_str
+        }).stats_data
+    except Exception as e:
+        logger.error('Unable to gather statistics on %s %s: %s' % (output_type, entity.name, str(e)))
+        stats_data = None
+
+    latency = time.time() - request_start_time
+    logger.info('Gathered statistics on %s %s in %.3f seconds' % (output_type, entity.name, latency))
+
+    return num_data_points, stats_data, latency
+
+
+def gather_statistics_records(entities, vm_names, entity_type, output_type, data_frequencies, checkpoints, time_diff, stat_end_time, stat_metric_types_str, pool):
+    """
+    Gathers the statistics on all entities, yields the entity and its output record in the order of the entities
+    """
+
+    # Each entity continues from its checkpoint, or goes back time_diff seconds
+    stat_start_times = {}
+    for entity in entities:
+        stat_start_times[entity.id] = int(checkpoints.get(entity.id, stat_end_time - time_diff))
+
+    gather_function = partial(get_entity_statistics, data_frequencies=data_frequencies, output_type=output_type, stat_start_times=stat_start_times, stat_end_time=stat_end_time, stat_metric_types_str=stat_metric_types_str)
+    if pool is not None:
+        results = pool.imap(gather_function, entities)
+    else:
+        results = (gather_function(entity) for entity in entities)
+
+    latency_count = 0
+    latency_total = 0
+    latency_max = 0
+    for entity, result in zip(entities, results):
+        num_data_points, stats_data, latency = result
+        latency_count += 1
+        latency_total += latency
+        latency_max = max(latency_max, latency)
+        if stats_data is None:
+            continue
+
+        # Determining name
+        output_name = entity.name
+        if entity_type == "VM":
+            output_name = '%s %s' % (vm_names.get(entity.parent_id), entity.mac)
+
+        stat_start_time = stat_start_times[entity.id]
+        record = {
+            output_type: output_name,
+            'Start timestamp': stat_start_time,
+            'End timestamp': stat_end_time,
+            'Start date/time': datetime.datetime.fromtimestamp(stat_start_time).strftime('%Y-%m-%d %H:%M:%S'),
+            'End date/time': datetime.datetime.fromtimestamp(stat_end_time).strftime('%Y-%m-%d %H:%M:%S'),
+            '# datapoints': num_data_points
+        }
+        record.update(stats_data)
+        yield entity, record
+
+    if latency_count > 0:
+        logger.info('Gathered statistics on %s %ss, average latency %.3f seconds, maximum latency %.3f seconds' % (latency_count, output_type, old_div(latency_total, latency_count), latency_max))
+
+
+def build_metrics_snapshot(exporter_records, entity_type, statistic_types, scrape_time):
+    """
+    Builds the Prometheus text format snapshot with the most recent datapoint of each statistic type per entity
+    """
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    lines = []
+    for statistic_type in statistic_types:
+        metric_name = 'nuage_%s' % statistic_type.lower()
+        lines.append('# HELP %s Most recent %s datapoint gathered from the Nuage VSD' % (metric_name, statistic_type))
+        lines.append('# TYPE %s gauge' % metric_name)
+        for entity_id, output_name, stats_data in exporter_records:
+            datapoints = [datapoint for datapoint in stats_data.get(statistic_type) or [] if datapoint is not None]
+            if len(datapoints) == 0:
+                continue
+            lines.append('%s{entity_type="%s",id="%s",name="%s"} %s' % (metric_name, entity_type, escape(entity_id), escape(output_name), datapoints[-1]))
+
+    lines.append('# HELP nuage_statistics_last_gathering_timestamp_seconds Time of the last statistics gathering')
+    lines.append('# TYPE nuage_statistics_last_gathering_timestamp_seconds gauge')
+    lines.append('nuage_statistics_last_gathering_timestamp_seconds %s' % scrape_time)
+    lines.append('# HELP nuage_statistics_entities Amount of entities with statistics in the last gathering')
+    lines.append('# TYPE nuage_statistics_entities gauge')
+    lines.append('nuage_statistics_entities{entity_type="%s"} %s' % (entity_type, len(exporter_records)))
+    return '%s\n' % '\n'.join(lines)
+
+
+def load_checkpoints(checkpoint_file):
+    """
+    Loads the end timestamps of the last successful gathering per entity ID
+    """
+
+    if not checkpoint_file or not os.path.isfile(checkpoint_file):
+        return {}
+
+    logger.debug('Loading checkpoint file %s' % checkpoint_file)
+    try:
+        with open(checkpoint_file, 'r') as checkpoint_fh:
+            return json.load(checkpoint_fh)
+    except (IOError, ValueError) as e:
+        logger.warning('Unable to load checkpoint file %s, ignoring it: %s' % (checkpoint_file, str(e)))
+        return {}
+
+
+def save_checkpoints(checkpoint_file, checkpoints):
+    """
+    Saves the end timestamps of the last successful gathering per entity ID
+    """
+
+    logger.debug('Saving checkpoint file %s' % checkpoint_file)
+    try:
+        with open('%s.tmp' % checkpoint_file, 'w') as checkpoint_fh:
+            json.dump(checkpoints, checkpoint_fh)
+        os.rename('%s.tmp' % checkpoint_file, checkpoint_file)
+    except (IOError, OSError) as e:
+        logger.warning('Unable to save checkpoint file %s: %s' % (checkpoint_file, str(e)))
+
+
 def main():
     """
     Main function to handle statistics
     """
+    global logger, metrics_snapshot
 
     # Handling arguments
     args                = get_args()
     debug               = args.debug
     entity_type         = args.entity_type
     json_output         = args.json_output
+    stream_format       = args.stream_format
+    output_file         = None
+    if args.output_file:
+        output_file     = args.output_file
     log_file            = None
     if args.logfile:
         log_file        = args.logfile
@@ -127,6 +623,29 @@ def main():
 #    nosslcheck          = args.nosslcheck
     time_difference     = args.time_difference
     verbose             = args.verbose
+    workers             = args.workers
+    policy_cache        = None
+    if args.policy_cache:
+        policy_cache    = args.policy_cache
+    policy_cache_ttl    = args.policy_cache_ttl
+    interval            = None
+    if args.interval:
+        interval        = args.interval
+    checkpoint_file     = None
+    if args.checkpoint_file:
+        checkpoint_file = args.checkpoint_file
+    entity_refresh      = args.entity_refresh
+    exporter_address    = args.exporter_address
+    exporter_port       = None
+    if args.exporter_port:
+        exporter_port   = args.exporter_port
+        if interval is None:
+            interval    = 60
+    columnar_file       = None
+    if args.columnar_file:
+        columnar_file   = args.columnar_file
+    top                 = args.top
+    page_size           = args.page_size
 
     # Logging settings
     if debug:
@@ -139,6 +658,26 @@ def main():
     logging.basicConfig(filename=log_file, format='%(asctime)s %(levelname)s %(message)s', level=log_level)
     logger = logging.getLogger(__name__)
 
+    # Validating workers input
+    if workers < 1:
+        logger.critical('The amount of workers %s is an invalid value, exiting' % workers)
+        return 1
+
+    # Validating columnar input
+    if columnar_file and np is None:
+        logger.critical('Columnar output requires numpy, which is not installed, exiting')
+        return 1
+
+    # Validating page size input
+    if page_size < 1:
+        logger.critical('The page size %s is an invalid value, exiting' % page_size)
+        return 1
+
+    # Validating interval input
+    if interval is not None and interval < 1:
+        logger.critical('The interval %s is an invalid value, exiting' % interval)
+        return 1
+
     # Validating time_difference input
     time_check = re.compile('^([0-9]+)([m|h|d]?)$')
     time_matches = time_check.match(time_difference)
@@ -175,22 +714,8 @@ def main():
         logger.critical('Caught exception: %s' % str(e))
         return 1
 
-    # Getting entities & defining output fields
-    output_type = None
-    entities = []
+    # Defining output fields
     output_type = entity_type.capitalize()
-    search_query = 'name == "%s"' % entity_name if entity_name else None
-    logger.debug('Getting %ss matching the search' % output_type)
-    entities = nc.user.fetcher_for_rest_name(entity_type.lower()).get(filter=search_query)
-
-    if entity_type == 'VM' and entities:
-        vms = entities
-        entities = []
-        for vm in vms:
-            for vm_interface in vm.vm_interfaces.get():
-                entities.append(vm_interface)
-
-    # Filling output fields
     output_fields = [
         output_type,
         'Start timestamp',
@@ -201,85 +726,158 @@ def main():
     ]
     output_fields.extend(statistic_types)
 
-    # Verifying if there are enities
-    if len(entities) == 0:
-        logger.critical('No matching entities found of type %s' % entity_type)
-        return 1
-
     # Starting output
-    if json_output:
-        logger.debug('JSON output enabled, not setting up an output table')
-        json_object = []
-    else:
-        logger.debug('Setting up output table')
-        pt = PrettyTable(output_fields)
+    output_stream = sys.stdout
+    if output_file:
+        logger.debug('Writing output to file %s' % output_file)
+        output_stream = open(output_file, 'w')
+
+    if stream_format == 'csv':
+        logger.debug('CSV streaming output enabled, writing header')
+        csv_writer = csv.DictWriter(output_stream, fieldnames=output_fields, extrasaction='ignore')
+        csv_writer.writeheader()
+        output_stream.flush()
 
     # Setting general values
-    stat_end_time = int(time.time())
-    stat_start_time = int(stat_end_time - time_diff)
     stat_metric_types_str = ','.join(statistic_types)
-    entity_data_freq = 60
+    checkpoints = load_checkpoints(checkpoint_file)
+    entities = None
+    entity_refresh_time = 0
+
+    pool = None
+    if workers > 1:
+        logger.debug('Gathering statistics with %s concurrent workers' % workers)
+        pool = ThreadPool(processes=workers)
+
+    # Starting the exporter, which serves the last snapshot while the statistics are gathered
+    exporter_server = None
+    if exporter_port is not None:
+        logger.info('Starting Prometheus exporter on %s:%s' % (exporter_address, exporter_port))
+        exporter_server = ThreadingHTTPServer((exporter_address, exporter_port), MetricsHTTPHandler)
+        exporter_thread = threading.Thread(target=exporter_server.serve_forever)
+        exporter_thread.daemon = True
+        exporter_thread.start()
 
-    for entity in entities:
-        if entity_type != 'VM' and 'BackHaul' in entity.name:
-            logger.debug('Found a BackHaul %s, skipping' % output_type)
-            continue
-
-        # Getting stats collection frequency
-        if entity_type != 'VM':
-            logger.debug('Looking for a statistics policy on %s %s' % (output_type, entity.name))
-            entity_stat_policies = entity.statistics_policies.get()
-            if len(entity_stat_policies) > 0:
-                logger.debug('Found at least one statistics policy on %s %s, getting data collection frequency' % (output_type, entity.name))
-                entity_data_freq = entity_stat_policies[0].data_collection_frequency
-            logger.debug('Data collection frequency for %s %s saved as %s' % (output_type, entity.name, entity_data_freq))
-
-        num_data_points = int(old_div(time_diff, entity_data_freq))
-
-        # Collecting statistics
-        logger.debug('Collecting %s datapoints of statistics %s on %s %s from timestamp %s to timestamp %s' % (num_data_points, stat_metric_types_str, output_type, entity.name, stat_start_time, stat_end_time))
-        stats_data = entity.statistics.get_first(query_parameters={
-            'startTime': stat_start_time,
-            'endTime': stat_end_time,
-            'numberOfDataPoints': num_data_points,
-            'metricTypes': stat_metric_types_str
-        }).stats_data
-
-        # Determining name
-        output_name = entity.name
-        if entity_type == "VM":
-            output_name = '%s %s' % (entity.parent.name, entity.mac)
-
-        # Generating output row
-        if json_output:
-            json_dict = {
-                output_type: output_name,
-                'Start timestamp': stat_start_time,
-                'End timestamp': stat_end_time,
-                'Start date/time': datetime.datetime.fromtimestamp(stat_start_time).strftime('%Y-%m-%d %H:%M:%S'),
-                'End date/time': datetime.datetime.fromtimestamp(stat_end_time).strftime('%Y-%m-%d %H:%M:%S'),
-                '# datapoints': num_data_points
-            }
-            json_dict.update(stats_data)
-            json_object.append(json_dict)
-        else:
-            row = [
-                output_name,
-                stat_start_time,
-                stat_end_time,
-                datetime.datetime.fromtimestamp(stat_start_time).strftime('%Y-%m-%d %H:%M:%S'),
-                datetime.datetime.fromtimestamp(stat_end_time).strftime('%Y-%m-%d %H:%M:%S'),
-                num_data_points
-            ]
-            for statistic_type in statistic_types:
-                row.append(stats_data[statistic_type])
-            pt.add_row(row)
-
-    logger.debug('Printing output')
-    if json_output:
-        print(json.dumps(json_object, sort_keys=True, indent=4))
-    else:
-        print(pt.get_string())
+    try:
+        while True:
+            scrape_start_time = time.time()
+            try:
+                # Getting entities & stats collection frequencies
+                if entities is None or scrape_start_time >= entity_refresh_time:
+                    entities, vm_names = get_entities(nc=nc, entity_type=entity_type, output_type=output_type, entity_name=entity_name, page_size=page_size, pool=pool)
+                    entity_refresh_time = scrape_start_time + entity_refresh
+                    logger.info('Found %s %ss' % (len(entities), output_type))
+
+                    # Dropping the checkpoints of removed entities
+                    entity_ids = set(entity.id for entity in entities)
+                    for entity_id in [entity_id for entity_id in checkpoints if entity_id not in entity_ids]:
+                        del checkpoints[entity_id]
+
+                    data_frequencies = get_data_frequencies(nc=nc, entities=entities, entity_type=entity_type, output_type=output_type, policy_cache=policy_cache, policy_cache_ttl=policy_cache_ttl, page_size=page_size, pool=pool)
+
+                # Verifying if there are enities
+                if len(entities) == 0 and interval is None:
+                    logger.critical('No matching entities found of type %s' % entity_type)
+                    return 1
+                elif len(entities) == 0:
+                    logger.warning('No matching entities found of type %s' % entity_type)
+
+                if exporter_server is not None:
+                    logger.debug('Exporter enabled, not setting up an output table')
+                    exporter_records = []
+                elif columnar_file:
+                    logger.debug('Columnar output enabled, not setting up an output table')
+                    columnar_statistics = ColumnarStatistics(statistic_types)
+                elif stream_format == 'ndjson':
+                    logger.debug('NDJSON streaming output enabled, not setting up an output table')
+                elif stream_format == 'csv':
+                    logger.debug('CSV streaming output enabled, not setting up an output table')
+                elif json_output:
+                    logger.debug('JSON output enabled, not setting up an output table')
+                    json_object = []
+                else:
+                    logger.debug('Setting up output table')
+                    pt = PrettyTable(output_fields)
+
+                # Gathering statistics
+                for entity, record in gather_statistics_records(entities=entities, vm_names=vm_names, entity_type=entity_type, output_type=output_type, data_frequencies=data_frequencies, checkpoints=checkpoints, time_diff=time_diff, stat_end_time=int(scrape_start_time), stat_metric_types_str=stat_metric_types_str, pool=pool):
+                    checkpoints[entity.id] = record['End timestamp']
+
+                    if exporter_server is not None:
+                        exporter_records.append((entity.id, record[output_type], dict((statistic_type, record.get(statistic_type)) for statistic_type in statistic_types)))
+                    elif columnar_file:
+                        columnar_statistics.add(entity.id, record[output_type], record['Start timestamp'], record['End timestamp'], record)
+                    elif stream_format == 'ndjson':
+                        output_stream.write('%s\n' % json.dumps(record, sort_keys=True))
+                        output_stream.flush()
+                    elif stream_format == 'csv':
+                        # Datapoint lists are written as a JSON array in a single column
+                        csv_writer.writerow(dict((key, json.dumps(value) if isinstance(value, list) else value) for key, value in record.items()))
+                        output_stream.flush()
+                    elif json_output:
+                        json_object.append(record)
+                    else:
+                        pt.add_row([record[output_field] for output_field in output_fields])
+
+                if exporter_server is not None:
+                    logger.debug('Updating exporter snapshot')
+                    metrics_snapshot = build_metrics_snapshot(exporter_records=exporter_records, entity_type=entity_type, statistic_types=statistic_types, scrape_time=int(scrape_start_time))
+                elif columnar_file:
+                    logger.debug('Calculating summaries and saving columnar file %s' % columnar_file)
+                    summaries = columnar_statistics.summarize()
+                    columnar_statistics.save(columnar_file, summaries)
+                    talkers = columnar_statistics.top_talkers(summaries, top)
+                    if json_output:
+                        print(json.dumps(talkers, sort_keys=True, indent=4), file=output_stream)
+                    else:
+                        talkers_fields = ['Statistic', 'Rank', 'Name', 'Total', 'Rate (/s)', 'p50', 'p95', 'Max']
+                        talkers_pt = PrettyTable(talkers_fields)
+                        for talker in talkers:
+                            talkers_pt.add_row([talker[talkers_field] for talkers_field in talkers_fields])
+                        print(talkers_pt.get_string(), file=output_stream)
+                    output_stream.flush()
+                elif stream_format is None:
+                    logger.debug('Printing output')
+                    if json_output:
+                        print(json.dumps(json_object, sort_keys=True, indent=4), file=output_stream)
+                    else:
+                        print(pt.get_string(), file=output_stream)
+                    output_stream.flush()
+
+                if checkpoint_file:
+                    save_checkpoints(checkpoint_file, checkpoints)
+
+            except Exception as e:
+                if interval is None:
+                    raise
+                logger.error('Gathering statistics failed, restarting the Nuage session: %s' % str(e))
+                try:
+                    nc.reset()
+                    nc.start()
+                except Exception as e:
+                    logger.error('Could not reconnect to Nuage host %s: %s' % (nuage_host, str(e)))
+
+            if interval is None:
+                break
+
+            sleep_time = scrape_start_time + interval - time.time()
+            if sleep_time > 0:
+                logger.debug('Sleeping %.3f seconds until the next gathering' % sleep_time)
+                time.sleep(sleep_time)
+
+    except KeyboardInterrupt:
+        logger.info('Received interrupt, finishing up')
+
+    finally:
+        if exporter_server is not None:
+            exporter_server.shutdown()
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        if output_file:
+            output_stream.close()
 
     return 0
 
@@ -8,7 +8,19 @@ At the start, the tool will investigate the specified domain and will create a s
 
 Once a flow log messages is sent to the tool from a VRS, the tool will investigate the flow and will implement a matching ACL rule entry.
 
-The ACL rule entry will be created using either Policy Groups, Zones or Subnets, depending on the type specified at runtime. If the destination of the traffic is outside of the domain, a network macro for the destination will be created and used in the rule.
+The tool accepts flow logs over persistent TCP connections, and optionally over UDP, and queues every line in a bounded queue from which a pool of workers handles them. A full queue blocks the TCP connections, pushing back on the senders, and drops UDP messages. Counters of the received, blocked, dropped and handled messages are logged at a regular interval.
+
+The subnets, policy groups, vPorts, VM interfaces and network macros are loaded at the start with concurrent paged requests for the whole domain, and the policy group memberships with one request per policy group, instead of several requests per vPort. Every VM interface IP of a vPort is mapped. Afterwards, the create, update and delete events of the push center for vPorts, VM interfaces, subnets, zones, policy groups and network macros are applied to the loaded topology, so new VMs are known without a restart.
+
+Messages of flows which are already known are recognised with a single search for the addresses and ports and skipped, only messages of new flows are fully parsed.
+
+At the start, the learned flows are rebuilt from the existing learned entries of the Ingress Learning ACLs, fetched in pages, so a restart does not create any rule twice. The next priority continues after the highest learned priority and skips the priorities of the other entries in the ACL. If a state file is specified, the learned flows and the next priority are also saved to it, at most every state interval after committing a batch, after each compaction and on shutdown, and loaded at the start.
+
+The flow log handler only parses and deduplicates the flows, the ACL rule entries (and network macros) are created on VSD in the background by a committer, which takes the queued flows in batches, creates each batch concurrently and retries failed creations. This way a VSD round-trip never blocks the reception of flow logs.
+
+If a compaction interval is specified, the learned entries are regularly compacted: the flows with the same source, destination type, protocol and source port are grouped, their destination ports are merged into ranges and their /32 network macros into covering prefixes. The compacted entries are created before the entries they replace are deleted, and they are compacted again with the newer flows at the next interval. By default only adjacent ports and addresses are merged, so no extra traffic is allowed, a shorter prefix length widens the network macros further.
+
+The ACL rule entry will be created using either Policy Groups, Zones or Subnets, depending on the type specified at runtime. If the destination of the traffic is outside of the domain, the most specific existing network macro containing the destination is used, found with a longest prefix match index of the network macros, otherwise a /32 network macro for the destination will be created and used in the rule. Network macros with a prefix shorter than /24 are not used, unless specified otherwise at runtime.
 
 The tool can either specify 'any' as source port, or, if specified at runtime, the tool will be very strict and create a rule with the source port set to the one used in the flow. In most cases this strict policy is a bit overkill: most client connections use a random port, using a strict policy for source port would block the next traffic attempt because it is a different source port.
 
@@ -19,6 +31,14 @@ Philippe Dellaert <philippe.dellaert@nuagenetworks.net>
 
 --- Version history ---
 2016-01-22 - 1.0 - Only Ingress rules for now
+2026-10-18 - 1.1 - Create the learned ACL entries asynchronously in batches
+2026-10-18 - 1.2 - Threaded TCP and UDP syslog ingestion with bounded queues and counters
+2026-10-18 - 1.3 - Skip messages of known flows before running the regular expressions
+2026-10-18 - 1.4 - Persist the learned flows and warm start from the existing learned ACL entries
+2026-10-18 - 1.5 - Load the topology of the domain with concurrent paged bulk requests
+2026-10-18 - 1.6 - Follow the changes of the topology through the push center
+2026-10-18 - 1.7 - Compact the learned ACL entries into entries with port ranges and network macro prefixes
+2026-10-18 - 1.8 - Use the most specific existing network macro for destinations outside the domain
 
 --- VRS configuration ---
 To configure your VRS, you have to edit the (r)syslog configuration to send everything matching 'ACLAUDIT' to the server running this tool on port 514 via a TCP connection.
@@ -26,6 +46,9 @@ To configure your VRS, you have to edit the (r)syslog configuration to send ever
 Example rsyslogd rule if the tool is running on 10.167.43.23:
     :msg,contains,"ACLAUDIT" @@10.167.43.23:514
 
+If the tool is started with the --udp option, the flow logs can also be sent over UDP with a single @:
+    :msg,contains,"ACLAUDIT" @10.167.43.23:514
+
 --- Limitations ---
 - When working with Policy Groups, it will only use one of the PG's for the rule
 - If POLICYGROUP is specified as type, and a VM has no Policy Group assigned, no rule will be created
@@ -41,189 +64,386 @@ http://github.com/nuagenetworks/vspk-examples/blob/master/docs/nuage_acl_learner
 --- Example ---
 ---- Set non-strict source port rules using Policy Groups ----
 python nuage_acl_learner.py -d -D "Main Customer Domain" -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -t POLICYGROUP
+
+---- Compact the learned rules every 10 minutes, merging network macros up to /24 ----
+python nuage_acl_learner.py -d -D "Main Customer Domain" -E csp -H 10.167.43.64 -P 443 -p csproot -u csproot -S -t POLICYGROUP --compact-interval 600 --compact-prefix-length 24
 """
 
 from future import standard_library
 standard_library.install_aliases()
-from builtins import str
+from builtins import range, str
 import argparse
 import getpass
+import ipaddress
+import json
 import logging
+from multiprocessing.pool import ThreadPool
+import os
+import queue
 import re
-import string
+import socket
 import socketserver
+import struct
+import threading
 import time
 
 from vspk import v6 as vsdk
 
+from vspk_examples_common import get_all_pages
+
 # Global variables
 nc = None
 nc_enterprise = None
 nc_domain = None
 nc_subnetmap = {}
+nc_zoneids = set()
 nc_policygroupmap = {}
 nc_vportmap = {}
+nc_vportinfomap = {}
+nc_vminterfacemap = {}
 nc_networkmacromap = {}
+nc_networkmacroindex = None
 ingress_learning_acl = None
 egress_learning_acl = None
 logger = None
 configuration = {}
 flows = {}
+compacted_entries = {}
+flows_lock = threading.Lock()
+network_macro_lock = threading.Lock()
+network_macro_creations = {}
+acl_entry_queue = None
+reserved_priorities = set()
+ingest_queue = None
+push_queue = None
+counters = {}
+counters_lock = threading.Lock()
 ip_regex = re.compile('.*dir: (\w+).*ipv4\(src=([\d\.]+)[^,]*,dst=([\d\.]+)[^,]*,proto=(\w+).*')
 traffic_regex = re.compile('.*(tcp|udp)\(src=(\d+)[^,]*,dst=(\d+)[^\)]*\).*')
+learned_description_regex = re.compile('^Learned - (tcp|udp) ([\d\.]+):(\S+) to ([\d\.]+):(\d+)$')
+flow_id_regex = re.compile('ipv4\(src=([\d\.]+),dst=([\d\.]+),[^\)]*\),(tcp|udp)\(src=(\d+),dst=(\d+)\)')
 
 
 class ACLTCPHandler(socketserver.StreamRequestHandler):
     """
-    Will handle ACL log messages and create appropriate ACLs
+    Will read ACL log messages line by line from a (persistent) TCP connection and queue them for handling
     """
 
     def handle(self):
-        global flows, nc_networkmacromap, configuration
+        global ingest_queue
 
-        data = self.rfile.readline().strip()
-        logger.debug('Received message from %s: %s' % (self.client_address[0], data))
+        count('tcp_connections')
+        logger.debug('Accepted TCP connection from %s' % self.client_address[0])
+        for line in self.rfile:
+            data = line.decode('utf-8', 'replace').strip()
+            if not data:
+                continue
+            count('tcp_lines')
+            try:
+                ingest_queue.put_nowait((self.client_address[0], data))
+            except queue.Full:
+                # Blocking the connection pushes back on the sender
+                count('tcp_blocked')
+                ingest_queue.put((self.client_address[0], data))
+        logger.debug('TCP connection from %s closed' % self.client_address[0])
 
-        # Parsing message
-        ip_matches = ip_regex.match(data)
-        if ip_matches is None:
-            logger.debug('No valid stream found')
-            return 0
 
-        flow_matches = traffic_regex.match(data)
-        if flow_matches is None:
-            logger.debug('No valid TCP/UDP stream found')
-            return 0
+class ACLUDPHandler(socketserver.BaseRequestHandler):
+    """
+    Will queue the ACL log message of a UDP syslog datagram for handling, dropping it if the queue is full
+    """
 
-        stream_type = flow_matches.group(1)
-        stream_direction = ip_matches.group(1)
-        stream_src_ip = ip_matches.group(2)
-        stream_src_port = flow_matches.group(2)
-        stream_dst_ip = ip_matches.group(3)
-        stream_dst_port = flow_matches.group(3)
-        stream_protocol = ip_matches.group(4)
+    def handle(self):
+        global ingest_queue
 
-        logger.debug('Found %s stream: direction %s - source ip %s - source port %s - destination ip %s - destination port %s - protocol %s' % (stream_type, stream_direction, stream_src_ip, stream_src_port, stream_dst_ip, stream_dst_port, stream_protocol))
+        data = self.request[0].decode('utf-8', 'replace').strip()
+        if not data:
+            return
+        count('udp_lines')
+        try:
+            ingest_queue.put_nowait((self.client_address[0], data))
+        except queue.Full:
+            count('udp_dropped')
 
-        if configuration['strictsource']:
-            flow_id = '%s_%s_%s_%s_%s' % (stream_type, stream_src_ip, stream_src_port, stream_dst_ip, stream_dst_port)
-        else:
-            flow_id = '%s_%s_%s_%s' % (stream_type, stream_src_ip, stream_dst_ip, stream_dst_port)
-            stream_src_port = '*'
 
+class ACLTCPServer(socketserver.ThreadingTCPServer):
+    """
+    Threading TCP server which can be restarted right away and does not wait for the open connections on shutdown
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ACLUDPServer(socketserver.UDPServer):
+    """
+    UDP server with a large receive buffer, so bursts of flow log messages are not dropped by the kernel
+    """
+
+    allow_reuse_address = True
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, configuration['udp_buffer_size'])
+        socketserver.UDPServer.server_bind(self)
+
+
+class NetworkMacroIndex(object):
+    """
+    Longest prefix match index of the network macros. The network macros are kept in a map per prefix length, so a lookup takes at most one map lookup per prefix length, starting with the longest. Network macros with a prefix shorter than min_prefix_length are never returned.
+    """
+
+    def __init__(self, min_prefix_length=0):
+        self.min_prefix_length = min_prefix_length
+        self.prefixes = {}
+        self.prefix_lengths = []
+
+    def __len__(self):
+        return sum(len(prefixes) for prefixes in self.prefixes.values())
+
+    @staticmethod
+    def get_network(network_macro):
+        """
+        Returns the IPv4 network of a network macro, or None if it is not a valid IPv4 network
+        """
+
+        try:
+            network = ipaddress.ip_network(str('%s/%s' % (network_macro['address'], network_macro['netmask'])), strict=False)
+        except ValueError:
+            return None
+        if network.version != 4:
+            return None
+        return network
+
+    def add(self, network_macro):
+        network = self.get_network(network_macro)
+        if network is None:
+            logger.debug('Network Macro with IP %s and netmask %s is not a valid IPv4 network, not indexing it' % (network_macro['address'], network_macro['netmask']))
+            return
+        if network.prefixlen not in self.prefixes:
+            self.prefixes[network.prefixlen] = {}
+            self.prefix_lengths = sorted(self.prefixes, reverse=True)
+        self.prefixes[network.prefixlen][int(network.network_address)] = network_macro
+
+    def remove(self, network_macro):
+        network = self.get_network(network_macro)
+        if network is None or self.prefixes.get(network.prefixlen, {}).get(int(network.network_address)) is not network_macro:
+            return
+        del self.prefixes[network.prefixlen][int(network.network_address)]
+        if not self.prefixes[network.prefixlen]:
+            del self.prefixes[network.prefixlen]
+            self.prefix_lengths = sorted(self.prefixes, reverse=True)
+
+    def lookup(self, ip_address):
+        """
+        Returns the most specific network macro containing the IP address, or None
+        """
+
+        address = struct.unpack('!I', socket.inet_aton(ip_address))[0]
+        for prefix_length in self.prefix_lengths:
+            if prefix_length < self.min_prefix_length:
+                return None
+            network_macro = self.prefixes[prefix_length].get(address & (0xFFFFFFFF << (32 - prefix_length)) & 0xFFFFFFFF)
+            if network_macro is not None:
+                return network_macro
+        return None
+
+
+def count(counter, amount=1):
+    """
+    Increments one of the ingestion counters
+    """
+    global counters
+
+    with counters_lock:
+        counters[counter] = counters.get(counter, 0) + amount
+
+
+def log_counters():
+    """
+    Logs the ingestion counters and the queue sizes
+    """
+    global acl_entry_queue, counters, ingest_queue
+
+    with counters_lock:
+        counter_values = ' - '.join('%s %s' % (counter, counters[counter]) for counter in sorted(counters))
+    logger.info('Ingestion counters: %s - ingest queue %s - commit queue %s' % (counter_values, ingest_queue.qsize(), acl_entry_queue.qsize()))
+
+
+def counters_reporter(interval):
+    """
+    Logs the ingestion counters every interval seconds
+    """
+
+    while True:
+        time.sleep(interval)
+        log_counters()
+
+
+def flow_log_worker(ingest_queue):
+    """
+    Handles the queued ACL log messages until it receives None
+    """
+
+    while True:
+        item = ingest_queue.get()
+        if item is None:
+            return
+        client_address, data = item
+        try:
+            handle_flow_log(client_address, data)
+            count('handled')
+        except Exception as e:
+            count('errors')
+            logger.error('Unable to handle message from %s: %s' % (client_address, str(e)))
+
+
+def get_flow_id(stream_type, stream_src_ip, stream_src_port, stream_dst_ip, stream_dst_port):
+    """
+    Returns the ID of a flow, which only contains the source port when strict source ports are used
+    """
+
+    if configuration['strictsource']:
+        return '%s_%s_%s_%s_%s' % (stream_type, stream_src_ip, stream_src_port, stream_dst_ip, stream_dst_port)
+    return '%s_%s_%s_%s' % (stream_type, stream_src_ip, stream_dst_ip, stream_dst_port)
+
+
+def scan_flow_id(data):
+    """
+    Returns the flow ID of an ACL log message with the usual layout using a single search without backtracking, or None if the message has a different layout
+    """
+
+    flow_matches = flow_id_regex.search(data)
+    if flow_matches is None or data.find('(src=', flow_matches.end()) >= 0:
+        return None
+    stream_src_ip, stream_dst_ip, stream_type, stream_src_port, stream_dst_port = flow_matches.groups()
+    return get_flow_id(stream_type, stream_src_ip, stream_src_port, stream_dst_ip, stream_dst_port)
+
+
+def handle_flow_log(client_address, data):
+    """
+    Will handle an ACL log message and queue the creation of an appropriate ACL
+    """
+    global acl_entry_queue, flows, nc_networkmacromap, configuration
+
+    # Most messages are for known flows, those are skipped without running the regular expressions
+    flow_id = scan_flow_id(data)
+    if flow_id is not None and flow_id in flows:
+        count('duplicates')
+        return 0
+
+    logger.debug('Received message from %s: %s' % (client_address, data))
+
+    # Parsing message
+    ip_matches = ip_regex.match(data)
+    if ip_matches is None:
+        logger.debug('No valid stream found')
+        return 0
+
+    flow_matches = traffic_regex.match(data)
+    if flow_matches is None:
+        logger.debug('No valid TCP/UDP stream found')
+        return 0
+
+    stream_type = flow_matches.group(1)
+    stream_direction = ip_matches.group(1)
+    stream_src_ip = ip_matches.group(2)
+    stream_src_port = flow_matches.group(2)
+    stream_dst_ip = ip_matches.group(3)
+    stream_dst_port = flow_matches.group(3)
+    stream_protocol = ip_matches.group(4)
+
+    logger.debug('Found %s stream: direction %s - source ip %s - source port %s - destination ip %s - destination port %s - protocol %s' % (stream_type, stream_direction, stream_src_ip, stream_src_port, stream_dst_ip, stream_dst_port, stream_protocol))
+
+    flow_id = get_flow_id(stream_type, stream_src_ip, stream_src_port, stream_dst_ip, stream_dst_port)
+    if not configuration['strictsource']:
+        stream_src_port = '*'
+
+    with flows_lock:
         if flow_id in flows:
-            logger.info('ACL already exists in the known flows, skipping handling it.')
+            logger.debug('ACL already exists in the known flows, skipping handling it.')
+            count('duplicates')
             return 0
 
-        src_vport = None
-        dst_vport = None
-        src_subnet = None
-        dst_subnet = None
-        src_pg = None
-        dst_pg = None
-        dst_nm = None
-        if stream_src_ip in nc_vportmap:
-            src_vport = nc_vportmap[stream_src_ip]
-            logger.debug('Found source vPort for IP %s with MAC %s' % (stream_src_ip, src_vport['mac']))
-            if configuration['acl_type'] == 'SUBNET' or configuration['acl_type'] == 'ZONE':
-                src_subnet = nc_subnetmap[src_vport['subnet']]
-                logger.debug('Found source subnet for IP %s: %s-%s' % (stream_src_ip, src_subnet['address'], src_subnet['netmask']))
-            if configuration['acl_type'] == 'POLICYGROUP':
-                if src_vport['policygroups'] > 0:
-                    src_pg = src_vport['policygroups'][0]
-                    logger.debug('Found source Policy Group %s for IP %s' % (src_pg['name'], stream_src_ip))
-                else:
-                    logger.error('Source vPort with IP %s does not have a Policy Group assigned, can not create ACL rules' % stream_src_ip)
-                    return 1
-        else:
-            logger.error('Unknown vPort for source IP %s, skipping this flow' % stream_src_ip)
-            return 1
-
-        if stream_dst_ip in nc_vportmap:
-            dst_vport = nc_vportmap[stream_dst_ip]
-            logger.debug('Found destination vPort for IP %s with MAC %s' % (stream_dst_ip, dst_vport['mac']))
-            if configuration['acl_type'] == 'SUBNET' or configuration['acl_type'] == 'ZONE':
-                dst_subnet = nc_subnetmap[dst_vport['subnet']]
-                logger.debug('Found destination subnet for IP %s: %s-%s' % (stream_dst_ip, dst_subnet['address'], dst_subnet['netmask']))
-            if configuration['acl_type'] == 'POLICYGROUP':
-                if dst_vport['policygroups'] > 0:
-                    dst_pg = dst_vport['policygroups'][0]
-                    logger.debug('Found destination Policy Group %s for IP %s' % (dst_pg['name'], stream_dst_ip))
-                else:
-                    logger.error('Destination vPort with IP %s does not have a Policy Group assigned, can not create ACL rules' % stream_src_ip)
-                    return 1
-        elif '%s-255.255.255.255' % stream_dst_ip in nc_networkmacromap:
-            logger.debug('vPort for destination IP %s does not exist, using existing /32 Network Macro' % stream_dst_ip)
-            dst_nm = nc_networkmacromap['%s-255.255.255.255' % stream_dst_ip]
-            logger.debug('Found destination network macro for IP %s' % stream_dst_ip)
-        else:
-            logger.debug('vPort or Network Macro for destination IP %s does not exist, creating a /32 Network Macro' % stream_dst_ip)
-            temp_nm_name = string.replace('%s-255.255.255.255' % stream_dst_ip, '.', '_')
-            temp_nm = vsdk.NUEnterpriseNetwork(
-                name=temp_nm_name,
-                address=stream_dst_ip,
-                netmask='255.255.255.255'
-            )
-            nc_enterprise.create_child(temp_nm)
-            logger.info('Created new Network Macro for destination IP %s' % stream_dst_ip)
-            dst_nm = {
-                'id': temp_nm.id,
-                'address': stream_dst_ip,
-                'netmask': '255.255.255.255'
-            }
-            nc_networkmacromap['%s-255.255.255.255' % stream_dst_ip] = dst_nm
-
-        src_type = None
-        src_id = None
-        if configuration['acl_type'] == 'ZONE':
-            src_type = 'ZONE'
-            src_id = src_subnet['zone']
-        elif configuration['acl_type'] == 'SUBNET':
-            src_type = 'SUBNET'
-            src_id = src_subnet['id']
-        elif configuration['acl_type'] == 'POLICYGROUP':
-            src_type = 'POLICYGROUP'
-            src_id = src_pg['id']
-
-        dst_type = None
-        dst_id = None
-        if dst_vport is not None and configuration['acl_type'] == 'ZONE':
-            dst_type = 'ZONE'
-            dst_id = dst_subnet['zone']
-        elif dst_vport is not None and configuration['acl_type'] == 'SUBNET':
-            dst_type = 'SUBNET'
-            dst_id = dst_subnet['id']
-        elif dst_vport is not None and configuration['acl_type'] == 'POLICYGROUP':
-            dst_type = 'POLICYGROUP'
-            dst_id = dst_pg['id']
-        else:
-            dst_type = 'ENTERPRISE_NETWORK'
-            dst_id = dst_nm['id']
+    src_subnet = None
+    dst_subnet = None
+    src_pg = None
+    dst_pg = None
+    dst_nm = None
+    src_vport = nc_vportmap.get(stream_src_ip)
+    if src_vport is not None:
+        logger.debug('Found source vPort for IP %s with MAC %s' % (stream_src_ip, src_vport['mac']))
+        if configuration['acl_type'] == 'SUBNET' or configuration['acl_type'] == 'ZONE':
+            src_subnet = nc_subnetmap[src_vport['subnet']]
+            logger.debug('Found source subnet for IP %s: %s-%s' % (stream_src_ip, src_subnet['address'], src_subnet['netmask']))
+        if configuration['acl_type'] == 'POLICYGROUP':
+            if len(src_vport['policygroups']) > 0:
+                src_pg = src_vport['policygroups'][0]
+                logger.debug('Found source Policy Group %s for IP %s' % (src_pg['name'], stream_src_ip))
+            else:
+                logger.error('Source vPort with IP %s does not have a Policy Group assigned, can not create ACL rules' % stream_src_ip)
+                return 1
+    else:
+        logger.error('Unknown vPort for source IP %s, skipping this flow' % stream_src_ip)
+        return 1
 
-        stream_protocol = '17'
-        if stream_type == 'tcp':
-            stream_protocol = '6'
+    dst_vport = nc_vportmap.get(stream_dst_ip)
+    if dst_vport is not None:
+        logger.debug('Found destination vPort for IP %s with MAC %s' % (stream_dst_ip, dst_vport['mac']))
+        if configuration['acl_type'] == 'SUBNET' or configuration['acl_type'] == 'ZONE':
+            dst_subnet = nc_subnetmap[dst_vport['subnet']]
+            logger.debug('Found destination subnet for IP %s: %s-%s' % (stream_dst_ip, dst_subnet['address'], dst_subnet['netmask']))
+        if configuration['acl_type'] == 'POLICYGROUP':
+            if len(dst_vport['policygroups']) > 0:
+                dst_pg = dst_vport['policygroups'][0]
+                logger.debug('Found destination Policy Group %s for IP %s' % (dst_pg['name'], stream_dst_ip))
+            else:
+                logger.error('Destination vPort with IP %s does not have a Policy Group assigned, can not create ACL rules' % stream_src_ip)
+                return 1
+    else:
+        with network_macro_lock:
+            dst_nm = nc_networkmacroindex.lookup(stream_dst_ip)
+            if dst_nm is not None:
+                logger.debug('vPort for destination IP %s does not exist, using existing Network Macro %s/%s' % (stream_dst_ip, dst_nm['address'], dst_nm['netmask']))
+            else:
+                logger.debug('vPort or Network Macro for destination IP %s does not exist, a /32 Network Macro will be created by the committer' % stream_dst_ip)
+                dst_nm = add_network_macro(stream_dst_ip, '255.255.255.255')
 
-        logger.debug('Creating new Ingress ACL rule with values: action FORWARD - ether_type 0x0800 - location_type %s - location_id %s - network_type %s - network_id %s - protocol %s - source_port %s - destination_port %s - dscp * - reflexive True - priority %s' % (src_type, src_id, dst_type, dst_id, stream_protocol, stream_src_port, stream_dst_port, configuration['next_priority']))
+    src_type = None
+    src_id = None
+    if configuration['acl_type'] == 'ZONE':
+        src_type = 'ZONE'
+        src_id = src_subnet['zone']
+    elif configuration['acl_type'] == 'SUBNET':
+        src_type = 'SUBNET'
+        src_id = src_subnet['id']
+    elif configuration['acl_type'] == 'POLICYGROUP':
+        src_type = 'POLICYGROUP'
+        src_id = src_pg['id']
 
-        ingress_acl_entry = vsdk.NUIngressACLEntryTemplate(
-            action='FORWARD',
-            description='Learned - %s %s:%s to %s:%s' % (stream_type, stream_src_ip, stream_src_port, stream_dst_ip, stream_dst_port),
-            ether_type='0x0800',
-            location_type=src_type,
-            location_id=src_id,
-            network_type=dst_type,
-            network_id=dst_id,
-            protocol=stream_protocol,
-            source_port=stream_src_port,
-            destination_port=stream_dst_port,
-            dscp='*',
-            reflexive=True,
-            priority=configuration['next_priority']
-        )
+    dst_type = None
+    dst_id = None
+    if dst_vport is not None and configuration['acl_type'] == 'ZONE':
+        dst_type = 'ZONE'
+        dst_id = dst_subnet['zone']
+    elif dst_vport is not None and configuration['acl_type'] == 'SUBNET':
+        dst_type = 'SUBNET'
+        dst_id = dst_subnet['id']
+    elif dst_vport is not None and configuration['acl_type'] == 'POLICYGROUP':
+        dst_type = 'POLICYGROUP'
+        dst_id = dst_pg['id']
+    else:
+        dst_type = 'ENTERPRISE_NETWORK'
+        dst_id = dst_nm['id']
 
-        # For now we work without jobs, way easier...
-        ingress_learning_acl.create_child(ingress_acl_entry, as_async=False)
+    stream_protocol = '17'
+    if stream_type == 'tcp':
+        stream_protocol = '6'
+
+    with flows_lock:
+        if flow_id in flows:
+            logger.debug('ACL already exists in the known flows, skipping handling it.')
+            count('duplicates')
+            return 0
 
         flows[flow_id] = {
             'action': 'FORWARD',
@@ -238,11 +458,832 @@ class ACLTCPHandler(socketserver.StreamRequestHandler):
             'destination_port': stream_dst_port,
             'dscp': '*',
             'reflexive': True,
-            'priority': configuration['next_priority']
+            'priority': reserve_priority(),
+            'id': None
+        }
+
+    # The ACL entry is created by the committer, blocking here if it is falling behind
+    logger.debug('Queueing new Ingress ACL rule for flow %s' % flow_id)
+    acl_entry_queue.put((flow_id, dst_nm))
+    return 0
+
+
+def add_network_macro(address, netmask):
+    """
+    Returns the network macro map entry of a network, adding and indexing an entry without ID if it does not exist yet. Has to be called with the network macro lock held.
+    """
+    global nc_networkmacromap, nc_networkmacroindex
+
+    network_macro_key = '%s-%s' % (address, netmask)
+    if network_macro_key not in nc_networkmacromap:
+        nc_networkmacromap[network_macro_key] = {
+            'id': None,
+            'address': address,
+            'netmask': netmask
         }
+        nc_networkmacroindex.add(nc_networkmacromap[network_macro_key])
+    return nc_networkmacromap[network_macro_key]
+
+
+def create_network_macro(dst_nm):
+    """
+    Creates the network macro of a destination outside the domain if it does not exist yet. The VSD request is made without holding the network macro lock, other workers needing the same network macro wait for the pending creation.
+    """
+    global nc_enterprise, network_macro_creations
+
+    network_macro_key = '%s-%s' % (dst_nm['address'], dst_nm['netmask'])
+    while True:
+        with network_macro_lock:
+            if dst_nm['id'] is not None:
+                return dst_nm['id']
+            creation = network_macro_creations.get(network_macro_key)
+            if creation is None:
+                creation = threading.Event()
+                network_macro_creations[network_macro_key] = creation
+                break
+        # Another worker is creating the network macro, if it fails this worker tries itself
+        logger.debug('Waiting for the pending creation of Network Macro %s' % network_macro_key)
+        creation.wait()
+
+    try:
+        temp_nm = vsdk.NUEnterpriseNetwork(
+            name=network_macro_key.replace('.', '_'),
+            address=dst_nm['address'],
+            netmask=dst_nm['netmask']
+        )
+        nc_enterprise.create_child(temp_nm)
+        logger.info('Created new Network Macro for destination IP %s' % dst_nm['address'])
+        with network_macro_lock:
+            dst_nm['id'] = temp_nm.id
+        return temp_nm.id
+    finally:
+        with network_macro_lock:
+            del network_macro_creations[network_macro_key]
+        creation.set()
+
+
+def commit_flow(queued_flow):
+    """
+    Creates the Ingress ACL entry of a learned flow, retrying failed attempts. If all attempts fail, the flow is forgotten so it can be learned again.
+    """
+    global configuration, flows, ingress_learning_acl
+
+    flow_id, dst_nm = queued_flow
+    flow = flows[flow_id]
+    for attempt in range(configuration['commit_retries'] + 1):
+        try:
+            if dst_nm is not None:
+                flow['network_id'] = create_network_macro(dst_nm)
+
+            logger.debug('Creating new Ingress ACL rule with values: action FORWARD - ether_type 0x0800 - location_type %s - location_id %s - network_type %s - network_id %s - protocol %s - source_port %s - destination_port %s - dscp * - reflexive True - priority %s' % (flow['location_type'], flow['location_id'], flow['network_type'], flow['network_id'], flow['protocol'], flow['source_port'], flow['destination_port'], flow['priority']))
+            ingress_acl_entry = vsdk.NUIngressACLEntryTemplate(
+                action=flow['action'],
+                description=flow['description'],
+                ether_type=flow['ether_type'],
+                location_type=flow['location_type'],
+                location_id=flow['location_id'],
+                network_type=flow['network_type'],
+                network_id=flow['network_id'],
+                protocol=flow['protocol'],
+                source_port=flow['source_port'],
+                destination_port=flow['destination_port'],
+                dscp=flow['dscp'],
+                reflexive=flow['reflexive'],
+                priority=flow['priority']
+            )
+            ingress_learning_acl.create_child(ingress_acl_entry, as_async=False)
+            flow['id'] = ingress_acl_entry.id
+            logger.info('Created Ingress ACL rule for flow %s' % flow_id)
+            return True
+        except Exception as e:
+            logger.warning('Attempt %s to create the Ingress ACL rule for flow %s failed: %s' % (attempt + 1, flow_id, str(e)))
+            if attempt < configuration['commit_retries']:
+                time.sleep(2 ** attempt)
+
+    logger.error('Unable to create the Ingress ACL rule for flow %s, forgetting the flow' % flow_id)
+    with flows_lock:
+        del flows[flow_id]
+    return False
+
+
+def acl_entry_committer(acl_entry_queue, pool):
+    """
+    Takes the queued flows in batches of up to batch_size, waiting at most batch_interval seconds for a batch to fill, and creates the ACL entries of each batch concurrently. The state is saved at most every state_interval seconds. Stops after handling a None item.
+    """
+    global configuration
+
+    last_state_time = time.time()
+    running = True
+    while running:
+        batch = [acl_entry_queue.get()]
+        deadline = time.time() + configuration['batch_interval']
+        while len(batch) < configuration['batch_size'] and batch[-1] is not None:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(acl_entry_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        if batch[-1] is None:
+            running = False
+            batch.pop()
+        if len(batch) == 0:
+            continue
+
+        logger.debug('Committing a batch of %s learned flows, %s flows waiting' % (len(batch), acl_entry_queue.qsize()))
+        results = pool.map(commit_flow, batch)
+        logger.info('Committed a batch of %s learned flows, %s failed' % (len(batch), results.count(False)))
+        if time.time() - last_state_time >= configuration['state_interval']:
+            save_state(configuration['state_file'])
+            last_state_time = time.time()
+
+
+def parse_port_range(port):
+    """
+    Returns the first and last port of a port or port range
+    """
+
+    first_port, _, last_port = str(port).partition('-')
+    return int(first_port), int(last_port or first_port)
+
+
+def format_port_range(port_range):
+    """
+    Returns a port range in the notation of an ACL entry
+    """
+
+    if port_range[0] == port_range[1]:
+        return str(port_range[0])
+    return '%s-%s' % port_range
+
 
+def merge_port_ranges(port_ranges):
+    """
+    Merges overlapping and adjacent port ranges
+    """
+
+    merged = []
+    for first_port, last_port in sorted(port_ranges):
+        if merged and first_port <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last_port))
+        else:
+            merged.append((first_port, last_port))
+    return merged
+
+
+def collapse_networks(networks, prefix_length):
+    """
+    Collapses networks into the covering prefixes without adding any address. Networks longer than prefix_length are then replaced by their supernet of that length if it covers at least two of them.
+    """
+
+    collapsed = list(ipaddress.collapse_addresses(networks))
+    supernets = {}
+    widened = []
+    for network in collapsed:
+        if network.prefixlen > prefix_length:
+            supernets.setdefault(network.supernet(new_prefix=prefix_length), []).append(network)
+        else:
+            widened.append(network)
+    for supernet, members in supernets.items():
+        if len(members) > 1:
+            widened.append(supernet)
+        else:
+            widened.extend(members)
+    return list(ipaddress.collapse_addresses(widened))
+
+
+def compact_atoms(atoms, prefix_length):
+    """
+    Returns the rules covering the atoms, as (group, destination, port range) tuples. The port ranges of each group and destination are merged first, then the network macro destinations of each group and port range are collapsed into covering prefixes.
+    """
+
+    port_ranges = {}
+    for group, destination, port_range in atoms:
+        port_ranges.setdefault((group, destination), []).append(port_range)
+
+    networks = {}
+    rules = set()
+    for (group, destination), group_port_ranges in port_ranges.items():
+        for port_range in merge_port_ranges(group_port_ranges):
+            if destination[0] == 'ENTERPRISE_NETWORK':
+                networks.setdefault((group, port_range), []).append(destination[1])
+            else:
+                rules.add((group, destination, port_range))
+
+    for (group, port_range), group_networks in networks.items():
+        for network in collapse_networks(group_networks, prefix_length):
+            rules.add((group, ('ENTERPRISE_NETWORK', network), port_range))
+    return rules
+
+
+def get_covering_rule(atom, rules_by_group):
+    """
+    Returns the rule of the group of the atom which covers its destination and port range
+    """
+
+    group, destination, port_range = atom
+    for rule in rules_by_group.get(group, []):
+        rule_destination, rule_port_range = rule[1], rule[2]
+        if rule_port_range[0] > port_range[0] or rule_port_range[1] < port_range[1]:
+            continue
+        if destination == rule_destination:
+            return rule
+        if destination[0] == 'ENTERPRISE_NETWORK' and rule_destination[0] == 'ENTERPRISE_NETWORK' and destination[1].prefixlen >= rule_destination[1].prefixlen and destination[1].network_address in rule_destination[1]:
+            return rule
+    return None
+
+
+def get_network_macro_networks():
+    """
+    Returns the IPv4 network of each created network macro by ID, skipping the network macros which are not a valid IPv4 network
+    """
+    global nc_networkmacromap
+
+    network_macro_networks = {}
+    with network_macro_lock:
+        for network_macro in nc_networkmacromap.values():
+            if network_macro['id'] is None:
+                continue
+            network = NetworkMacroIndex.get_network(network_macro)
+            if network is None:
+                logger.debug('Network Macro %s is not a valid IPv4 network, it is not compacted' % network_macro['id'])
+                continue
+            network_macro_networks[network_macro['id']] = network
+    return network_macro_networks
+
+
+def get_acl_entry_atom(acl_entry, network_macro_networks):
+    """
+    Returns the (group, destination, port range) atom of a learned flow or compacted ACL entry, or None if its network macro is unknown
+    """
+
+    group = (acl_entry['location_type'], acl_entry['location_id'], acl_entry['protocol'], acl_entry['source_port'])
+    if acl_entry['network_type'] == 'ENTERPRISE_NETWORK':
+        if acl_entry['network_id'] not in network_macro_networks:
+            return None
+        destination = ('ENTERPRISE_NETWORK', network_macro_networks[acl_entry['network_id']])
+    else:
+        destination = (acl_entry['network_type'], acl_entry['network_id'])
+    return group, destination, parse_port_range(acl_entry['destination_port'])
+
+
+def reserve_priority():
+    """
+    Returns the next free ACL entry priority. Has to be called with the flows lock held.
+    """
+    global configuration
+
+    priority = configuration['next_priority']
+    configuration['next_priority'] += 1
+    while configuration['next_priority'] in reserved_priorities:
         configuration['next_priority'] += 1
-        return 0
+    return priority
+
+
+def describe_location(location_type, location_id):
+    """
+    Returns the policy group name, subnet address or zone ID of an ACL entry location
+    """
+
+    if location_type == 'POLICYGROUP' and location_id in nc_policygroupmap:
+        return '%s %s' % (location_type, nc_policygroupmap[location_id]['name'])
+    if location_type == 'SUBNET' and location_id in nc_subnetmap:
+        return '%s %s/%s' % (location_type, nc_subnetmap[location_id]['address'], nc_subnetmap[location_id]['netmask'])
+    return '%s %s' % (location_type, location_id)
+
+
+def create_compacted_rule(rule):
+    """
+    Creates the Ingress ACL entry of a compacted rule, returns the rule and the created entry, or None if the creation failed
+    """
+    global ingress_learning_acl, nc_networkmacromap
+
+    (location_type, location_id, protocol, source_port), (network_type, network_id), port_range = rule
+    destination_name = describe_location(network_type, network_id)
+    try:
+        if network_type == 'ENTERPRISE_NETWORK':
+            destination_name = str(network_id)
+            with network_macro_lock:
+                dst_nm = add_network_macro(str(network_id.network_address), str(network_id.netmask))
+            network_id = create_network_macro(dst_nm)
+
+        with flows_lock:
+            priority = reserve_priority()
+        compacted_entry = {
+            'action': 'FORWARD',
+            'description': 'Compacted - %s %s to %s:%s' % ('tcp' if str(protocol) == '6' else 'udp', describe_location(location_type, location_id), destination_name, format_port_range(port_range)),
+            'ether_type': '0x0800',
+            'location_type': location_type,
+            'location_id': location_id,
+            'network_type': network_type,
+            'network_id': network_id,
+            'protocol': protocol,
+            'source_port': source_port,
+            'destination_port': format_port_range(port_range),
+            'dscp': '*',
+            'reflexive': True,
+            'priority': priority
+        }
+        ingress_acl_entry = vsdk.NUIngressACLEntryTemplate(**compacted_entry)
+        ingress_learning_acl.create_child(ingress_acl_entry, as_async=False)
+        compacted_entry['id'] = ingress_acl_entry.id
+        logger.debug('Created compacted Ingress ACL rule: %s' % compacted_entry['description'])
+        return rule, compacted_entry
+    except Exception as e:
+        logger.warning('Unable to create the compacted Ingress ACL rule for %s to %s:%s, it is retried at the next compaction: %s' % (describe_location(location_type, location_id), destination_name, format_port_range(port_range), str(e)))
+        return None
+
+
+def delete_acl_entry(acl_entry_id):
+    """
+    Deletes an Ingress ACL entry, returns if the deletion succeeded
+    """
+
+    try:
+        vsdk.NUIngressACLEntryTemplate(id=acl_entry_id).delete()
+        return True
+    except Exception as e:
+        logger.warning('Unable to delete Ingress ACL entry %s, it is retried at the next compaction: %s' % (acl_entry_id, str(e)))
+        return False
+
+
+def compact_rules(pool):
+    """
+    Replaces the learned ACL entries and the compacted ACL entries by the smallest set of compacted entries found, grouping them by source, destination type, protocol and source port, merging the destination ports into ranges and the network macros into covering prefixes. The new entries are created before the entries they replace are deleted, so the allowed traffic is never interrupted.
+    """
+    global compacted_entries, flows
+
+    start_time = time.time()
+    network_macro_networks = get_network_macro_networks()
+
+    # Only the flows of which the ACL entry is created are compacted
+    flow_atoms = {}
+    with flows_lock:
+        for flow_id, flow in flows.items():
+            if flow.get('id') is None or flow.get('compacted'):
+                continue
+            atom = get_acl_entry_atom(flow, network_macro_networks)
+            if atom is not None:
+                flow_atoms.setdefault(atom, []).append(flow_id)
+
+    rules = compact_atoms(list(flow_atoms) + list(compacted_entries), configuration['compact_prefix_length'])
+
+    # A rule which is the entry of a single learned flow stays a learned entry
+    kept_atoms = set(atom for atom in rules if atom in flow_atoms and len(flow_atoms[atom]) == 1 and atom not in compacted_entries)
+    new_rules = [rule for rule in rules if rule not in compacted_entries and rule not in kept_atoms]
+    for result in pool.map(create_compacted_rule, new_rules):
+        if result is not None:
+            compacted_entries[result[0]] = result[1]
+
+    # Deleting the learned entries and the stale compacted entries which are covered by an existing entry of the new rules
+    rules_by_group = {}
+    for rule in compacted_entries:
+        if rule in rules:
+            rules_by_group.setdefault(rule[0], []).append(rule)
+
+    replaced_flow_ids = []
+    for atom, flow_ids in flow_atoms.items():
+        if atom not in kept_atoms and get_covering_rule(atom, rules_by_group) is not None:
+            replaced_flow_ids.extend(flow_ids)
+    replaced_flow_ids = [flow_id for flow_id, deleted in zip(replaced_flow_ids, pool.map(delete_acl_entry, [flows[flow_id]['id'] for flow_id in replaced_flow_ids])) if deleted]
+    with flows_lock:
+        for flow_id in replaced_flow_ids:
+            flows[flow_id]['id'] = None
+            flows[flow_id]['compacted'] = True
+
+    stale_rules = [rule for rule in compacted_entries if rule not in rules and get_covering_rule(rule, rules_by_group) is not None]
+    stale_rules = [rule for rule, deleted in zip(stale_rules, pool.map(delete_acl_entry, [compacted_entries[rule]['id'] for rule in stale_rules])) if deleted]
+    for rule in stale_rules:
+        del compacted_entries[rule]
+
+    if not new_rules and not replaced_flow_ids and not stale_rules:
+        logger.debug('No learned ACL entries to compact')
+        return
+    logger.info('Compacted %s learned and %s compacted ACL entries into %s new compacted entries in %.2f seconds, %s compacted entries in total' % (len(replaced_flow_ids), len(stale_rules), len(new_rules), time.time() - start_time, len(compacted_entries)))
+    save_state(configuration['state_file'])
+
+
+def rule_compactor(interval, pool, stop_event):
+    """
+    Compacts the learned ACL entries every interval seconds until the stop event is set
+    """
+
+    while not stop_event.wait(interval):
+        try:
+            compact_rules(pool)
+        except Exception as e:
+            logger.error('Unable to compact the learned ACL entries: %s' % str(e))
+
+
+def load_state(state_file):
+    """
+    Loads the learned flows and the next priority saved by a previous run
+    """
+
+    if not state_file or not os.path.isfile(state_file):
+        return {'flows': {}, 'next_priority': None}
+
+    logger.debug('Loading state file %s' % state_file)
+    try:
+        with open(state_file, 'r') as state_fh:
+            return json.load(state_fh)
+    except (IOError, ValueError) as e:
+        logger.warning('Unable to load state file %s, ignoring it: %s' % (state_file, str(e)))
+        return {'flows': {}, 'next_priority': None}
+
+
+def save_state(state_file):
+    """
+    Saves the learned flows and the next priority to a temporary file which replaces the state file, so a crash while saving does not corrupt it
+    """
+    global configuration, flows
+
+    if not state_file:
+        return
+
+    with flows_lock:
+        state = {
+            'flows': dict(flows),
+            'next_priority': configuration['next_priority']
+        }
+    logger.debug('Saving state file %s' % state_file)
+    try:
+        with open('%s.tmp' % state_file, 'w') as state_fh:
+            json.dump(state, state_fh)
+            state_fh.flush()
+            os.fsync(state_fh.fileno())
+        # os.replace does not exist on Python 2, where os.rename also replaces the file on POSIX
+        getattr(os, 'replace', os.rename)('%s.tmp' % state_file, state_file)
+    except (IOError, OSError) as e:
+        logger.warning('Unable to save state file %s: %s' % (state_file, str(e)))
+
+
+def load_topology(pool, page_size):
+    """
+    Builds the subnet, policy group, vPort and network macro maps with paged bulk requests for the whole domain, run concurrently on the pool, instead of requests per vPort
+    """
+    global nc_enterprise, nc_domain, nc_subnetmap, nc_zoneids, nc_policygroupmap, nc_vportinfomap, nc_vminterfacemap, nc_networkmacromap
+
+    start_time = time.time()
+    fetchers = {
+        'vports': nc_domain.vports,
+        'vm_interfaces': nc_domain.vm_interfaces,
+        'networkmacros': nc_enterprise.enterprise_networks
+    }
+    if configuration['acl_type'] == 'SUBNET' or configuration['acl_type'] == 'ZONE':
+        fetchers['subnets'] = nc_domain.subnets
+        fetchers['zones'] = nc_domain.zones
+    if configuration['acl_type'] == 'POLICYGROUP':
+        fetchers['policygroups'] = nc_domain.policy_groups
+    topology = dict(zip(fetchers.keys(), pool.map(lambda fetcher: get_all_pages(fetcher, page_size), fetchers.values())))
+
+    # Mapping zones and subnets
+    if configuration['acl_type'] == 'SUBNET' or configuration['acl_type'] == 'ZONE':
+        for nc_zone in topology['zones']:
+            nc_zoneids.add(nc_zone.id)
+        for nc_subnet in topology['subnets']:
+            map_subnet(nc_subnet)
+
+    # Mapping policy groups and their vPort memberships, with one paged request per policy group
+    vport_policygroups = {}
+    if configuration['acl_type'] == 'POLICYGROUP':
+        memberships = pool.map(lambda nc_policygroup: get_all_pages(nc_policygroup.vports, page_size), topology['policygroups'])
+        for nc_policygroup, nc_policygroup_vports in zip(topology['policygroups'], memberships):
+            logger.debug('Found policy group %s with %s vPorts in domain %s' % (nc_policygroup.name, len(nc_policygroup_vports), nc_domain.name))
+            policygroup = map_policy_group(nc_policygroup)
+            for nc_vport in nc_policygroup_vports:
+                vport_policygroups.setdefault(nc_vport.id, []).append(policygroup)
+
+    # Mapping vPorts on the IPs of their VM interfaces
+    for nc_vport in topology['vports']:
+        map_vport(nc_vport, vport_policygroups.get(nc_vport.id, []))
+    for nc_vm_interface in topology['vm_interfaces']:
+        map_vm_interface(nc_vm_interface)
+
+    # Mapping Network Macros
+    for nc_networkmacro in topology['networkmacros']:
+        map_network_macro(nc_networkmacro)
+
+    logger.info('Loaded the topology of domain %s in %.2f seconds: %s vPort IPs, %s subnets, %s policy groups and %s network macros' % (nc_domain.name, time.time() - start_time, len(nc_vportmap), len(nc_subnetmap), len(nc_policygroupmap), len(nc_networkmacromap)))
+
+
+def map_subnet(nc_subnet):
+    """
+    Adds or updates a subnet in the subnet map
+    """
+    global nc_subnetmap
+
+    logger.debug('Found subnet with network %s/%s in domain %s' % (nc_subnet.address, nc_subnet.netmask, nc_domain.name))
+    nc_subnetmap[nc_subnet.id] = {
+        'id': nc_subnet.id,
+        'address': nc_subnet.address,
+        'netmask': nc_subnet.netmask,
+        'zone': nc_subnet.parent_id
+    }
+
+
+def map_policy_group(nc_policygroup):
+    """
+    Adds or updates a policy group in the policy group map and returns it. An existing policy group is updated in place, so the vPorts referencing it see the changes.
+    """
+    global nc_policygroupmap
+
+    if nc_policygroup.id in nc_policygroupmap:
+        nc_policygroupmap[nc_policygroup.id]['name'] = nc_policygroup.name
+    else:
+        nc_policygroupmap[nc_policygroup.id] = {
+            'id': nc_policygroup.id,
+            'name': nc_policygroup.name
+        }
+    return nc_policygroupmap[nc_policygroup.id]
+
+
+def map_vport(nc_vport, policygroups=None):
+    """
+    Adds or updates a vPort in the vPort info map, and updates the IP map entries of its VM interfaces. The policy groups of an existing vPort are only replaced if they are given.
+    """
+    global nc_vportinfomap, nc_vportmap
+
+    if nc_vport.id in nc_vportinfomap:
+        vport = nc_vportinfomap[nc_vport.id]
+        vport['subnet'] = nc_vport.parent_id
+        if policygroups is not None:
+            vport['policygroups'][:] = policygroups
+        for ip_address in vport['ip_addresses']:
+            nc_vportmap[ip_address]['subnet'] = nc_vport.parent_id
+    else:
+        nc_vportinfomap[nc_vport.id] = {
+            'id': nc_vport.id,
+            'subnet': nc_vport.parent_id,
+            'policygroups': policygroups or [],
+            'ip_addresses': set()
+        }
+
+
+def unmap_vport(vport_id):
+    """
+    Removes a vPort and the IP map entries of its VM interfaces
+    """
+    global nc_vportinfomap, nc_vminterfacemap, nc_vportmap
+
+    vport = nc_vportinfomap.pop(vport_id, None)
+    if vport is None:
+        return
+    for ip_address in vport['ip_addresses']:
+        nc_vportmap.pop(ip_address, None)
+    for vm_interface_id in [vm_interface_id for vm_interface_id, vm_interface in nc_vminterfacemap.items() if vm_interface['vport_id'] == vport_id]:
+        del nc_vminterfacemap[vm_interface_id]
+
+
+def map_vm_interface(nc_vm_interface):
+    """
+    Maps the IP of a VM interface on its vPort, replacing the previous IP of the VM interface
+    """
+    global nc_vminterfacemap, nc_vportinfomap, nc_vportmap
+
+    unmap_vm_interface(nc_vm_interface.id)
+    if nc_vm_interface.ip_address is None or nc_vm_interface.vport_id not in nc_vportinfomap:
+        return
+    vport = nc_vportinfomap[nc_vm_interface.vport_id]
+    logger.debug('Found vPort with IP %s and MAC %s in domain %s' % (nc_vm_interface.ip_address, nc_vm_interface.mac, nc_domain.name))
+    nc_vminterfacemap[nc_vm_interface.id] = {
+        'vport_id': vport['id'],
+        'ip_address': nc_vm_interface.ip_address
+    }
+    vport['ip_addresses'].add(nc_vm_interface.ip_address)
+    nc_vportmap[nc_vm_interface.ip_address] = {
+        'id': vport['id'],
+        'mac': nc_vm_interface.mac,
+        'subnet': vport['subnet'],
+        'policygroups': vport['policygroups']
+    }
+
+
+def unmap_vm_interface(vm_interface_id):
+    """
+    Removes the IP map entry of a VM interface
+    """
+    global nc_vminterfacemap, nc_vportinfomap, nc_vportmap
+
+    vm_interface = nc_vminterfacemap.pop(vm_interface_id, None)
+    if vm_interface is None:
+        return
+    nc_vportmap.pop(vm_interface['ip_address'], None)
+    if vm_interface['vport_id'] in nc_vportinfomap:
+        nc_vportinfomap[vm_interface['vport_id']]['ip_addresses'].discard(vm_interface['ip_address'])
+
+
+def map_network_macro(nc_networkmacro):
+    """
+    Adds or updates a network macro in the network macro map. An existing entry is updated in place, so a macro which is waiting to be created by the committer gets the ID of the macro created elsewhere.
+    """
+    global nc_networkmacromap
+
+    logger.debug('Found Network Macro with IP %s and netmask %s for Enterprise %s' % (nc_networkmacro.address, nc_networkmacro.netmask, nc_enterprise.name))
+    with network_macro_lock:
+        unmap_network_macro(nc_networkmacro.id, keep='%s-%s' % (nc_networkmacro.address, nc_networkmacro.netmask))
+        add_network_macro(nc_networkmacro.address, nc_networkmacro.netmask)['id'] = nc_networkmacro.id
+
+
+def unmap_network_macro(network_macro_id, keep=None):
+    """
+    Removes the network macro map and index entries with the given ID, except the one with the keep key. Has to be called with the network macro lock held.
+    """
+    global nc_networkmacromap, nc_networkmacroindex
+
+    for network_macro_key in [network_macro_key for network_macro_key, network_macro in nc_networkmacromap.items() if network_macro['id'] == network_macro_id and network_macro_key != keep]:
+        nc_networkmacroindex.remove(nc_networkmacromap.pop(network_macro_key))
+
+
+def refresh_vport_policy_groups(vport_id):
+    """
+    Fetches the policy groups of a vPort and updates its memberships
+    """
+
+    policygroups = [map_policy_group(nc_policygroup) for nc_policygroup in get_all_pages(vsdk.NUVPort(id=vport_id).policy_groups, configuration['page_size'])]
+    nc_vportinfomap[vport_id]['policygroups'][:] = policygroups
+
+
+def refresh_policy_group_vports(policygroup):
+    """
+    Fetches the vPorts of a policy group and updates the memberships of all vPorts
+    """
+
+    member_ids = set(nc_vport.id for nc_vport in get_all_pages(vsdk.NUPolicyGroup(id=policygroup['id']).vports, configuration['page_size']))
+    for vport_id, vport in nc_vportinfomap.items():
+        is_member = policygroup in vport['policygroups']
+        if vport_id in member_ids and not is_member:
+            vport['policygroups'].append(policygroup)
+        elif vport_id not in member_ids and is_member:
+            vport['policygroups'].remove(policygroup)
+
+
+def handle_vport_event(event_type, nc_vport):
+    """
+    Applies a vPort event, fetching the policy groups of a new or updated vPort
+    """
+    if event_type == 'DELETE':
+        unmap_vport(nc_vport.id)
+    elif nc_vport.domain_id == nc_domain.id:
+        map_vport(nc_vport)
+        if configuration['acl_type'] == 'POLICYGROUP':
+            refresh_vport_policy_groups(nc_vport.id)
+
+
+def handle_vm_interface_event(event_type, nc_vm_interface):
+    """
+    Applies a VM interface event
+    """
+    if event_type == 'DELETE':
+        unmap_vm_interface(nc_vm_interface.id)
+    elif nc_vm_interface.domain_id == nc_domain.id:
+        if nc_vm_interface.vport_id not in nc_vportinfomap:
+            # The VM interface event can arrive before the vPort event
+            nc_vport = vsdk.NUVPort(id=nc_vm_interface.vport_id)
+            nc_vport.fetch()
+            handle_vport_event('CREATE', nc_vport)
+        map_vm_interface(nc_vm_interface)
+
+
+def handle_zone_event(event_type, nc_zone):
+    """
+    Applies a zone event, the zones are only used to recognise the subnets of the domain
+    """
+    if event_type == 'DELETE':
+        nc_zoneids.discard(nc_zone.id)
+    elif nc_zone.parent_id == nc_domain.id:
+        nc_zoneids.add(nc_zone.id)
+
+
+def handle_subnet_event(event_type, nc_subnet):
+    """
+    Applies a subnet event
+    """
+    if event_type == 'DELETE':
+        nc_subnetmap.pop(nc_subnet.id, None)
+    elif nc_subnet.parent_id in nc_zoneids:
+        map_subnet(nc_subnet)
+
+
+def handle_policy_group_event(event_type, nc_policygroup):
+    """
+    Applies a policy group event, fetching the vPorts of a new or updated policy group
+    """
+    if event_type == 'DELETE':
+        policygroup = nc_policygroupmap.pop(nc_policygroup.id, None)
+        if policygroup is not None:
+            for vport in nc_vportinfomap.values():
+                if policygroup in vport['policygroups']:
+                    vport['policygroups'].remove(policygroup)
+    elif nc_policygroup.parent_id == nc_domain.id:
+        refresh_policy_group_vports(map_policy_group(nc_policygroup))
+
+
+def handle_network_macro_event(event_type, nc_networkmacro):
+    """
+    Applies a network macro event
+    """
+    if event_type == 'DELETE':
+        with network_macro_lock:
+            unmap_network_macro(nc_networkmacro.id)
+    elif nc_networkmacro.parent_id == nc_enterprise.id:
+        map_network_macro(nc_networkmacro)
+
+
+push_event_handlers = {
+    'enterprisenetwork': (vsdk.NUEnterpriseNetwork, handle_network_macro_event),
+    'policygroup': (vsdk.NUPolicyGroup, handle_policy_group_event),
+    'subnet': (vsdk.NUSubnet, handle_subnet_event),
+    'vminterface': (vsdk.NUVMInterface, handle_vm_interface_event),
+    'vport': (vsdk.NUVPort, handle_vport_event),
+    'zone': (vsdk.NUZone, handle_zone_event)
+}
+
+
+def did_receive_push(data):
+    """
+    Push center delegate, queues the received events so the push center keeps listening while they are applied
+    """
+    global push_queue
+
+    if data and 'events' in data:
+        push_queue.put(data)
+
+
+def push_event_worker(push_queue):
+    """
+    Applies the queued push center events to the topology maps until it receives None
+    """
+
+    while True:
+        data = push_queue.get()
+        if data is None:
+            return
+        handle_push(data)
+
+
+def handle_push(data):
+    """
+    Applies the create, update and delete events of a push to the topology maps, so new VMs are known without a restart
+    """
+
+    for event in data['events']:
+        if event.get('entityType') not in push_event_handlers:
+            continue
+        entity_class, event_handler = push_event_handlers[event['entityType']]
+        for entity in event.get('entities', []):
+            count('push_events')
+            try:
+                nc_entity = entity_class()
+                nc_entity.from_dict(entity)
+                logger.debug('Received %s event for %s %s' % (event['type'], event['entityType'], nc_entity.id))
+                event_handler(event['type'], nc_entity)
+            except Exception as e:
+                count('push_errors')
+                logger.error('Unable to handle %s event for %s: %s' % (event.get('type'), event['entityType'], str(e)))
+
+
+def load_learned_flows(acl_template, page_size):
+    """
+    Fetches all entries of the learning ACL in pages. Returns the learned flows rebuilt from the learned entries, the compacted entries, the highest learned priority and the priorities of the other entries.
+    """
+
+    learned_flows = {}
+    compacted = []
+    highest_priority = None
+    other_priorities = set()
+    for acl_entry in get_all_pages(acl_template.ingress_acl_entry_templates, page_size):
+        acl_entry_fields = {
+            'action': acl_entry.action,
+            'description': acl_entry.description,
+            'ether_type': acl_entry.ether_type,
+            'location_type': acl_entry.location_type,
+            'location_id': acl_entry.location_id,
+            'network_type': acl_entry.network_type,
+            'network_id': acl_entry.network_id,
+            'protocol': acl_entry.protocol,
+            'source_port': acl_entry.source_port,
+            'destination_port': acl_entry.destination_port,
+            'dscp': acl_entry.dscp,
+            'reflexive': acl_entry.reflexive,
+            'priority': acl_entry.priority,
+            'id': acl_entry.id
+        }
+        description_matches = learned_description_regex.match(acl_entry.description or '')
+        if description_matches is None:
+            other_priorities.add(acl_entry.priority)
+            if (acl_entry.description or '').startswith('Compacted - '):
+                compacted.append(acl_entry_fields)
+            continue
+
+        stream_type, stream_src_ip, stream_src_port, stream_dst_ip, stream_dst_port = description_matches.groups()
+        flow_id = get_flow_id(stream_type, stream_src_ip, stream_src_port, stream_dst_ip, stream_dst_port)
+        learned_flows[flow_id] = acl_entry_fields
+        if highest_priority is None or acl_entry.priority > highest_priority:
+            highest_priority = acl_entry.priority
+    return learned_flows, compacted, highest_priority, other_priorities
 
 
 def get_args():
@@ -251,19 +1292,39 @@ def get_args():
     """
 
     parser = argparse.ArgumentParser(description="Tool which will create ACLs learned from flow logs from the VRS. It will actively listen to incomming syslog connections on port 514.")
+    parser.add_argument('-b', '--batch-size', required=False, help='The maximum amount of learned flows which are created on VSD in one batch (default = 50)', dest='batch_size', type=int, default=50)
+    parser.add_argument('--batch-interval', required=False, help='The maximum amount of seconds to wait for a batch of learned flows to fill up (default = 1)', dest='batch_interval', type=float, default=1.0)
+    parser.add_argument('-c', '--commit-workers', required=False, help='The amount of concurrent workers creating the ACL entries of a batch on VSD (default = 4)', dest='commit_workers', type=int, default=4)
+    parser.add_argument('--commit-queue-size', required=False, help='The maximum amount of learned flows waiting to be created on VSD, handling flow logs pauses when the queue is full (default = 10000)', dest='commit_queue_size', type=int, default=10000)
+    parser.add_argument('--commit-retries', required=False, help='The amount of times the creation of an ACL entry is retried after a failure (default = 3)', dest='commit_retries', type=int, default=3)
+    parser.add_argument('--compact-interval', required=False, help='The amount of seconds between compactions of the learned ACL entries into entries with port ranges and network macro prefixes, 0 disables the compaction (default = 0)', dest='compact_interval', type=int, default=0)
+    parser.add_argument('--compact-prefix-length', required=False, help='The prefix length to which the network macros of compacted entries are widened when it covers at least two of them, 32 only merges macros without allowing extra addresses (default = 32)', dest='compact_prefix_length', type=int, default=32)
     parser.add_argument('-d', '--debug', required=False, help='Enable debug output', dest='debug', action='store_true')
     parser.add_argument('-f', '--first-priority', required=False, help='The priority of the first created rule (will be incremented for each next rule), default is 100', dest='first_priority', type=int, default=100)
+    parser.add_argument('--ingest-queue-size', required=False, help='The maximum amount of received flow log messages waiting to be handled, TCP connections are blocked and UDP messages are dropped when the queue is full (default = 10000)', dest='ingest_queue_size', type=int, default=10000)
+    parser.add_argument('-L', '--listen-address', required=False, help='The address to listen on for flow log messages (default = 0.0.0.0)', dest='listen_address', type=str, default='0.0.0.0')
+    parser.add_argument('--listen-port', required=False, help='The TCP (and UDP) port to listen on for flow log messages (default = 514)', dest='listen_port', type=int, default=514)
+    parser.add_argument('--load-workers', required=False, help='The amount of concurrent requests when loading the topology of the domain at the start (default = 8)', dest='load_workers', type=int, default=8)
     parser.add_argument('-l', '--log-file', required=False, help='File to log to (default = stdout)', dest='logfile', type=str)
+    parser.add_argument('--min-macro-prefix-length', required=False, help='Existing network macros with a shorter prefix are not used as destination of the learned rules, the most specific network macro containing the destination IP is used (default = 24)', dest='min_macro_prefix_length', type=int, default=24)
     parser.add_argument('-D', '--nuage-domain', required=True, help='The domain to investigate and set ACLs on', dest='nuage_domain', type=str)
     parser.add_argument('-E', '--nuage-enterprise', required=True, help='The enterprise with which to connect to the Nuage VSD/SDK host', dest='nuage_enterprise', type=str)
     parser.add_argument('-H', '--nuage-host', required=True, help='The Nuage VSD/SDK endpoint to connect to', dest='nuage_host', type=str)
     parser.add_argument('-P', '--nuage-port', required=False, help='The Nuage VSD/SDK server port to connect to (default = 8443)', dest='nuage_port', type=int, default=8443)
+    parser.add_argument('--no-push-center', required=False, help='Do not follow the changes of the domain through the push center, the topology is then only loaded at the start', dest='no_push_center', action='store_true')
     parser.add_argument('-p', '--nuage-password', required=False, help='The password with which to connect to the Nuage VSD/SDK host. If not specified, the user is prompted at runtime for a password', dest='nuage_password', type=str)
+    parser.add_argument('--page-size', required=False, help='The amount of objects to fetch per request when loading the topology and the learned flows at the start (default = 500)', dest='page_size', type=int, default=500)
+    parser.add_argument('--state-file', required=False, help='File to which the learned flows and the next priority are saved, and from which they are loaded at the start', dest='state_file', type=str)
+    parser.add_argument('--state-interval', required=False, help='The minimum amount of seconds between saving the state file after committing learned flows, it is always saved after a compaction and on shutdown (default = 60)', dest='state_interval', type=int, default=60)
+    parser.add_argument('--stats-interval', required=False, help='The amount of seconds between logging the ingestion counters (default = 60)', dest='stats_interval', type=int, default=60)
+    parser.add_argument('--udp-buffer-size', required=False, help='The receive buffer size in bytes of the UDP socket (default = 4194304)', dest='udp_buffer_size', type=int, default=4194304)
+    parser.add_argument('-U', '--udp', required=False, help='Also listen for flow log messages on UDP', dest='udp', action='store_true')
     parser.add_argument('-u', '--nuage-user', required=True, help='The username with which to connect to the Nuage VSD/SDK host', dest='nuage_username', type=str)
     parser.add_argument('-S', '--disable-SSL-certificate-verification', required=False, help='Disable SSL certificate verification on connect (deprecated)', dest='nosslcheck', action='store_true')
     parser.add_argument('-s', '--strict-source-ports', required=False, help='Use strict source ports, this will set the specific source port instead of the default * setting for Ingress rules.', dest='strictsource', action='store_true')
     parser.add_argument('-t', '--type', required=True, help='On what entity type should the ACLs be applied. Valid responses: POLICYGROUP, ZONE, SUBNET', dest='acl_type', type=str, choices=['POLICYGROUP', 'ZONE', 'SUBNET'])
     parser.add_argument('-v', '--verbose', required=False, help='Enable verbose output', dest='verbose', action='store_true')
+    parser.add_argument('-w', '--workers', required=False, help='The amount of workers handling the received flow log messages (default = 2)', dest='workers', type=int, default=2)
     args = parser.parse_args()
     return args
 
@@ -287,15 +1348,27 @@ def main():
     """
     Main function to handle vcenter vm names and the mapping to a policy group
     """
-    global logger, configuration, nc, nc_enterprise, nc_domain, nc_subnetmap, nc_policygroupmap, nc_vportmap, nc_networkmacromap, ingress_learning_acl, egress_learning_acl
+    global logger, configuration, flows, reserved_priorities, nc, nc_enterprise, nc_domain, nc_subnetmap, nc_policygroupmap, nc_vportmap, nc_networkmacromap, nc_networkmacroindex, ingress_learning_acl, egress_learning_acl, acl_entry_queue, ingest_queue, push_queue
 
     # Handling arguments
     args                = get_args()
+    configuration['batch_size']          = args.batch_size
+    configuration['batch_interval']      = args.batch_interval
+    configuration['commit_workers']      = args.commit_workers
+    configuration['commit_queue_size']   = args.commit_queue_size
+    configuration['commit_retries']      = args.commit_retries
+    configuration['compact_interval']    = args.compact_interval
+    configuration['compact_prefix_length'] = args.compact_prefix_length
     configuration['debug']               = args.debug
     configuration['next_priority']       = args.first_priority
+    configuration['ingest_queue_size']   = args.ingest_queue_size
+    configuration['listen_address']      = args.listen_address
+    configuration['listen_port']         = args.listen_port
+    configuration['load_workers']        = args.load_workers
     configuration['log_file']            = None
     if args.logfile:
         configuration['log_file']        = args.logfile
+    configuration['min_macro_prefix_length'] = args.min_macro_prefix_length
     configuration['nuage_domain']        = args.nuage_domain
     configuration['nuage_enterprise']    = args.nuage_enterprise
     configuration['nuage_host']          = args.nuage_host
@@ -306,8 +1379,18 @@ def main():
     configuration['nuage_username']      = args.nuage_username
     configuration['strictsource']        = args.strictsource
     configuration['nosslcheck']          = args.nosslcheck
+    configuration['page_size']           = args.page_size
+    configuration['push_center']         = not args.no_push_center
+    configuration['state_file']          = None
+    if args.state_file:
+        configuration['state_file']      = args.state_file
+    configuration['state_interval']      = args.state_interval
+    configuration['stats_interval']      = args.stats_interval
+    configuration['udp']                 = args.udp
+    configuration['udp_buffer_size']     = args.udp_buffer_size
     configuration['acl_type']            = args.acl_type
     configuration['verbose']             = args.verbose
+    configuration['workers']             = args.workers
 
     # Logging settings
     if configuration['debug']:
@@ -349,54 +1432,28 @@ def main():
     nc_enterprise = vsdk.NUEnterprise(id=nc_domain.parent_id)
     nc_enterprise.fetch()
 
-    if configuration['acl_type'] == 'SUBNET' or configuration['acl_type'] == 'ZONE':
-        # Mapping subnets
-        logger.debug('Mapping subnets for domain %s' % nc_domain.name)
-        for nc_subnet in nc_domain.subnets.get():
-            logger.debug('Found subnet with network %s/%s in domain %s' % (nc_subnet.address, nc_subnet.netmask, nc_domain.name))
-            nc_subnetmap[nc_subnet.id] = {
-                'id': nc_subnet.id,
-                'address': nc_subnet.address,
-                'netmask': nc_subnet.netmask,
-                'zone': nc_subnet.parent_id
-            }
+    # Starting the push center before loading, so no change is missed, its events are applied after the load
+    if configuration['push_center']:
+        logger.debug('Starting push center')
+        push_queue = queue.Queue()
+        nc.push_center.add_delegate(did_receive_push)
+        nc.push_center.start()
 
-    if configuration['acl_type'] == 'POLICYGROUP':
-        # Mapping policy groups
-        logger.debug('Mapping policy groups for domain %s' % nc_domain.name)
-        for nc_policygroup in nc_domain.policy_groups.get():
-            logger.debug('Found policy group %s in domain %s' % (nc_policygroup.name, nc_domain.name))
-            nc_policygroupmap[nc_policygroup.id] = {
-                'id': nc_policygroup.id,
-                'name': nc_policygroup.name
-            }
-
-    # Mapping vPorts
-    logger.debug('Mapping vPorts for domain %s' % nc_domain.name)
-    for nc_vport in nc_domain.vports.get():
-        logger.debug('Found vPort with IP %s and MAC %s in domain %s' % (nc_vport.vm_interfaces.get_first().ip_address, nc_vport.vm_interfaces.get_first().mac, nc_domain.name))
-        nc_vportmap[nc_vport.vm_interfaces.get_first().ip_address] = {
-            'id': nc_vport.id,
-            'mac': nc_vport.vm_interfaces.get_first().mac,
-            'subnet': nc_vport.parent_id,
-            'policygroups': []
-        }
-        for nc_policygroup in nc_vport.policy_groups.get():
-            logger.debug('Found policy group %s for vPort with %s and MAC %s in domain %s' % (nc_policygroup.name, nc_vport.vm_interfaces.get_first().ip_address, nc_vport.vm_interfaces.get_first().mac, nc_domain.name))
-            nc_vportmap[nc_vport.vm_interfaces.get_first().ip_address]['policygroups'].append({
-                'id': nc_policygroup.id,
-                'name': nc_policygroup.name
-            })
+    # Loading the subnets, policy groups, vPorts and network macros
+    nc_networkmacroindex = NetworkMacroIndex(configuration['min_macro_prefix_length'])
+    logger.debug('Loading the topology of domain %s with %s workers' % (nc_domain.name, configuration['load_workers']))
+    load_pool = ThreadPool(configuration['load_workers'])
+    try:
+        load_topology(load_pool, configuration['page_size'])
+    finally:
+        load_pool.close()
+        load_pool.join()
 
-    # Mapping Network Macros
-    logger.debug('Mapping Network Macros for enterprise %s' % nc_enterprise.name)
-    for nc_networkmacro in nc_enterprise.enterprise_networks.get():
-        logger.debug('Found Network Macro with IP %s and netmask %s for Enterprise %s' % (nc_networkmacro.address, nc_networkmacro.netmask, nc_enterprise.name))
-        nc_networkmacromap['%s-%s' % (nc_networkmacro.address, nc_networkmacro.netmask)] = {
-            'id': nc_networkmacro.id,
-            'address': nc_networkmacro.address,
-            'netmask': nc_networkmacro.netmask
-        }
+    if configuration['push_center']:
+        logger.info('Following the changes of domain %s through the push center, %s events received during the load' % (nc_domain.name, push_queue.qsize()))
+        push_worker = threading.Thread(target=push_event_worker, args=(push_queue,))
+        push_worker.daemon = True
+        push_worker.start()
 
     # Checking if ACL logging rules are present
     ingress_learning_acl = nc_domain.ingress_acl_templates.get_first(filter="name == 'Ingress Learning ACLs'")
@@ -524,16 +1581,102 @@ def main():
         egress_learning_acl.create_child(egress_acl_entry_3, as_async=False)
         logger.info('Egress ACL rules created')
 
-    logger.info('Starting capture server on port 514')
-    capture_server = socketserver.TCPServer(('0.0.0.0', 514), ACLTCPHandler)
+    # Rebuilding the learned flows from the existing learned ACL entries
+    state = load_state(configuration['state_file'])
+    logger.debug('Loading the learned flows from the entries of the Ingress Learning ACLs')
+    flows, compacted, highest_priority, reserved_priorities = load_learned_flows(ingress_learning_acl, configuration['page_size'])
+    logger.info('Loaded %s learned flows and %s compacted entries from the Ingress Learning ACLs' % (len(flows), len(compacted)))
+    network_macro_networks = get_network_macro_networks()
+    for compacted_entry in compacted:
+        atom = get_acl_entry_atom(compacted_entry, network_macro_networks)
+        if atom is not None:
+            compacted_entries[atom] = compacted_entry
+    # The flows replaced by compacted entries are kept, so they are recognised as known flows
+    for flow_id, flow in state['flows'].items():
+        if flow.get('compacted') and flow_id not in flows:
+            flows[flow_id] = flow
+    missing_flows = set(flow_id for flow_id in state['flows'] if flow_id not in flows)
+    if missing_flows:
+        logger.info('%s flows from the state file no longer have an ACL entry, they will be learned again' % len(missing_flows))
+    if highest_priority is not None and highest_priority >= configuration['next_priority']:
+        configuration['next_priority'] = highest_priority + 1
+    if state['next_priority'] is not None and state['next_priority'] > configuration['next_priority']:
+        configuration['next_priority'] = state['next_priority']
+    while configuration['next_priority'] in reserved_priorities:
+        configuration['next_priority'] += 1
+    logger.info('Next learned ACL entry priority is %s' % configuration['next_priority'])
+    save_state(configuration['state_file'])
+
+    # Starting the committer which creates the learned ACL entries in the background
+    logger.debug('Starting ACL entry committer with %s workers' % configuration['commit_workers'])
+    acl_entry_queue = queue.Queue(maxsize=configuration['commit_queue_size'])
+    commit_pool = ThreadPool(configuration['commit_workers'])
+    committer = threading.Thread(target=acl_entry_committer, args=(acl_entry_queue, commit_pool))
+    committer.daemon = True
+    committer.start()
+
+    # Starting the workers handling the received flow log messages
+    logger.debug('Starting %s flow log workers' % configuration['workers'])
+    ingest_queue = queue.Queue(maxsize=configuration['ingest_queue_size'])
+    workers = []
+    for _ in range(configuration['workers']):
+        worker = threading.Thread(target=flow_log_worker, args=(ingest_queue,))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+
+    if configuration['compact_interval'] > 0:
+        logger.debug('Starting rule compactor with an interval of %s seconds' % configuration['compact_interval'])
+        compactor_stop = threading.Event()
+        compactor = threading.Thread(target=rule_compactor, args=(configuration['compact_interval'], commit_pool, compactor_stop))
+        compactor.daemon = True
+        compactor.start()
+
+    reporter = threading.Thread(target=counters_reporter, args=(configuration['stats_interval'],))
+    reporter.daemon = True
+    reporter.start()
+
+    logger.info('Starting TCP capture server on %s:%s' % (configuration['listen_address'], configuration['listen_port']))
+    capture_servers = [ACLTCPServer((configuration['listen_address'], configuration['listen_port']), ACLTCPHandler)]
+    if configuration['udp']:
+        logger.info('Starting UDP capture server on %s:%s' % (configuration['listen_address'], configuration['listen_port']))
+        capture_servers.append(ACLUDPServer((configuration['listen_address'], configuration['listen_port']), ACLUDPHandler))
+
+    for capture_server in capture_servers:
+        server_thread = threading.Thread(target=capture_server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
 
     try: 
-        # Activate the server; this will keep running until you
-        # interrupt the program with Ctrl-C
-        capture_server.serve_forever()
+        # The servers keep running until you interrupt the program with Ctrl-C
+        while True:
+            time.sleep(1)
     except KeyboardInterrupt:
         logger.info('Received interrupt, finishing up')
-        capture_server.shutdown()
+        for capture_server in capture_servers:
+            capture_server.shutdown()
+            capture_server.server_close()
+        if configuration['push_center']:
+            nc.push_center.stop()
+
+    # Handling the messages which are still queued
+    logger.info('Waiting for the workers to handle the %s queued messages' % ingest_queue.qsize())
+    for _ in workers:
+        ingest_queue.put(None)
+    for worker in workers:
+        worker.join()
+    log_counters()
+
+    # Creating the ACL entries of the flows which are still queued
+    logger.info('Waiting for the committer to create the %s queued ACL entries' % acl_entry_queue.qsize())
+    acl_entry_queue.put(None)
+    committer.join()
+    if configuration['compact_interval'] > 0:
+        compactor_stop.set()
+        compactor.join()
+    commit_pool.close()
+    commit_pool.join()
+    save_state(configuration['state_file'])
 
     logger.info('All done!')
     return 1
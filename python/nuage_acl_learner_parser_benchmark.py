@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+nuage_acl_learner_parser_benchmark.py measures how many flow log lines per
+ second nuage_acl_learner.py can parse and deduplicate.
+
+It runs a syslog corpus, either recorded from the VRS's or generated, through
+ two pipelines: the regular expressions first, as the learner used to do for
+ every message, and the field scanning fast path which checks the known flows
+ before falling back to the regular expressions for unseen flows. No VSD
+ connection is needed.
+
+--- Version history ---
+2026-10-18 - 1.0.0 - First version
+
+--- Usage ---
+run 'nuage_acl_learner_parser_benchmark.py -h' for an overview
+
+--- Example ---
+---- Record the flow logs on the learner host and benchmark the recording ----
+tcpdump -A -i any tcp port 514 | grep ACLAUDIT > flows.log
+python nuage_acl_learner_parser_benchmark.py -f flows.log
+"""
+from __future__ import division, print_function
+
+from builtins import range
+import argparse
+import io
+import random
+import time
+
+import nuage_acl_learner
+
+
+def get_args():
+    """
+    Supports the command-line arguments listed below.
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmark of the flow log parsing and deduplication of nuage_acl_learner.py.")
+    parser.add_argument('-f', '--corpus-file', required=False, help='File with recorded flow log lines, if not specified a corpus is generated', dest='corpus_file', type=str)
+    parser.add_argument('-F', '--flows', required=False, help='The amount of distinct flows in the generated corpus (default = 1000)', dest='flows', type=int, default=1000)
+    parser.add_argument('-n', '--lines', required=False, help='The amount of lines in the generated corpus (default = 200000)', dest='lines', type=int, default=200000)
+    parser.add_argument('-r', '--repeat', required=False, help='The amount of runs of each pipeline, the fastest run is reported (default = 3)', dest='repeat', type=int, default=3)
+    parser.add_argument('-s', '--strict-source-ports', required=False, help='Use strict source ports in the flow IDs, like the learner option', dest='strictsource', action='store_true')
+    parser.add_argument('-w', '--write-corpus', required=False, help='Write the generated corpus to this file, so it can be reused', dest='write_corpus', type=str)
+    args = parser.parse_args()
+    return args
+
+
+def generate_corpus(lines, flows):
+    """
+    Returns flow log lines of the given amount of distinct flows, each with a random source port
+    """
+
+    random.seed(0)
+    flow_tuples = []
+    for i in range(flows):
+        flow_tuples.append((
+            random.choice(['tcp', 'udp']),
+            '10.%s.%s.%s' % (i % 4, (i // 4) % 256, random.randrange(1, 255)),
+            '10.%s.%s.%s' % (random.randrange(4), random.randrange(256), random.randrange(1, 255)),
+            random.choice([22, 53, 80, 443, 3306, 8080])
+        ))
+
+    corpus = []
+    for _ in range(lines):
+        stream_type, src_ip, dst_ip, dst_port = random.choice(flow_tuples)
+        corpus.append('Oct 18 10:00:00 vrs-01 ovs-vswitchd: ACLAUDIT(INFO) dir: ingress type: ACL_ACCEPT ipv4(src=%s,dst=%s,proto=%s,tos=0,ttl=64,frag=no),%s(src=%s,dst=%s),tcp_flags(0x2)' % (src_ip, dst_ip, '6' if stream_type == 'tcp' else '17', stream_type, random.randrange(32768, 61000), dst_port))
+    return corpus
+
+
+def regex_pipeline(corpus):
+    """
+    Parses every line with the regular expressions before checking the known flows
+    """
+
+    known_flows = set()
+    for data in corpus:
+        ip_matches = nuage_acl_learner.ip_regex.match(data)
+        if ip_matches is None:
+            continue
+        flow_matches = nuage_acl_learner.traffic_regex.match(data)
+        if flow_matches is None:
+            continue
+        flow_id = nuage_acl_learner.get_flow_id(flow_matches.group(1), ip_matches.group(2), flow_matches.group(2), ip_matches.group(3), flow_matches.group(3))
+        if flow_id in known_flows:
+            continue
+        known_flows.add(flow_id)
+    return len(known_flows)
+
+
+def fast_path_pipeline(corpus):
+    """
+    Checks the known flows with the scanned flow ID first and only runs the regular expressions for unseen flows
+    """
+
+    known_flows = set()
+    for data in corpus:
+        flow_id = nuage_acl_learner.scan_flow_id(data)
+        if flow_id is not None and flow_id in known_flows:
+            continue
+        ip_matches = nuage_acl_learner.ip_regex.match(data)
+        if ip_matches is None:
+            continue
+        flow_matches = nuage_acl_learner.traffic_regex.match(data)
+        if flow_matches is None:
+            continue
+        flow_id = nuage_acl_learner.get_flow_id(flow_matches.group(1), ip_matches.group(2), flow_matches.group(2), ip_matches.group(3), flow_matches.group(3))
+        if flow_id in known_flows:
+            continue
+        known_flows.add(flow_id)
+    return len(known_flows)
+
+
+def main():
+    """
+    Main function running the benchmark
+    """
+
+    # Handling arguments
+    args = get_args()
+    nuage_acl_learner.configuration['strictsource'] = args.strictsource
+
+    if args.corpus_file:
+        with io.open(args.corpus_file, encoding='utf-8', errors='replace') as corpus_file:
+            corpus = [line.strip() for line in corpus_file if line.strip()]
+    else:
+        corpus = generate_corpus(args.lines, args.flows)
+        if args.write_corpus:
+            with io.open(args.write_corpus, 'w', encoding='utf-8') as corpus_file:
+                corpus_file.write(u''.join(u'%s\n' % line for line in corpus))
+
+    print('%s lines, fastest of %s runs' % (len(corpus), args.repeat))
+    for name, pipeline in (('Regular expressions first', regex_pipeline), ('Fast path', fast_path_pipeline)):
+        best_time = None
+        for _ in range(args.repeat):
+            start_time = time.time()
+            flows = pipeline(corpus)
+            run_time = time.time() - start_time
+            if best_time is None or run_time < best_time:
+                best_time = run_time
+        print('%-26s %10.0f lines/s, %s distinct flows' % (name + ':', len(corpus) / best_time, flows))
+    return 0
+
+
+# Start program
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+nuage_acl_learner_replay.py replays a flow log corpus through nuage_acl_learner.py
+ to size the learner before pointing the VRS's at it.
+
+The corpus, either recorded from the VRS's or generated, is sent at the given
+ rate over a local TCP connection to the ACLTCPHandler of the learner, which
+ runs its regular flow log workers and ACL entry committer. The VSD API is
+ replaced by a local stand-in: the domain is built from the IPs in the corpus
+ and loaded with the topology loader of the learner, and the creation of ACL
+ entries and network macros takes the given latency. No VSD connection is
+ needed.
+
+Reported are the handled lines per second, the hit rate of the known flows,
+ the created ACL entries and network macros, and the latency of handling a
+ line, from the moment it is queued by the TCP handler until it is handled.
+
+--- Version history ---
+2026-10-18 - 1.0.0 - First version
+
+--- Usage ---
+run 'nuage_acl_learner_replay.py -h' for an overview
+
+--- Example ---
+---- Replay a recording at 5000 lines per second with a VSD latency of 50 ms ----
+tcpdump -A -i any tcp port 514 | grep ACLAUDIT > flows.log
+python nuage_acl_learner_replay.py -f flows.log -r 5000 --vsd-latency 50
+"""
+from __future__ import division, print_function
+
+from future import standard_library
+standard_library.install_aliases()
+from builtins import object, range, str
+import argparse
+import io
+import ipaddress
+import itertools
+import logging
+from multiprocessing.pool import ThreadPool
+import queue
+import random
+import socket
+import threading
+import time
+
+import nuage_acl_learner
+
+
+class StandInObject(object):
+    """
+    Object with the given attributes, standing in for VSD entities
+    """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class StandInFetcher(object):
+    """
+    Fetcher returning a fixed list of objects in pages
+    """
+
+    def __init__(self, objects):
+        self.objects = objects
+
+    def get(self, filter=None, page=None, page_size=None):
+        if page is None:
+            return self.objects
+        return self.objects[page * page_size:(page + 1) * page_size]
+
+
+class StandInParent(StandInObject):
+    """
+    Parent which creates its children after the VSD latency, and counts them
+    """
+
+    def __init__(self, latency, **kwargs):
+        StandInObject.__init__(self, **kwargs)
+        self.latency = latency
+        self.created = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create_child(self, child, as_async=False):
+        time.sleep(self.latency)
+        with self._lock:
+            child.id = '%s-%s' % (self.id, next(self._ids))
+            self.created += 1
+
+
+class TimedQueue(queue.Queue):
+    """
+    Queue which remembers when each item was queued. The queue time of the last item taken by a thread is kept in last_put_time.
+    """
+
+    def __init__(self, maxsize=0):
+        queue.Queue.__init__(self, maxsize)
+        self.last_put_time = threading.local()
+
+    def _put(self, item):
+        queue.Queue._put(self, (time.time(), item))
+
+    def _get(self):
+        put_time, item = queue.Queue._get(self)
+        self.last_put_time.value = put_time
+        return item
+
+
+def get_args():
+    """
+    Supports the command-line arguments listed below.
+    """
+
+    parser = argparse.ArgumentParser(description="Replay of a flow log corpus through nuage_acl_learner.py against a local stand-in for the VSD API.")
+    parser.add_argument('-b', '--batch-size', required=False, help='The maximum amount of learned flows which are created in one batch (default = 50)', dest='batch_size', type=int, default=50)
+    parser.add_argument('-c', '--commit-workers', required=False, help='The amount of concurrent workers creating the ACL entries of a batch (default = 4)', dest='commit_workers', type=int, default=4)
+    parser.add_argument('-e', '--external', required=False, help='The fraction of the flows in the generated corpus with a destination outside the domain (default = 0.2)', dest='external', type=float, default=0.2)
+    parser.add_argument('-f', '--corpus-file', required=False, help='File with recorded flow log lines, if not specified a corpus is generated', dest='corpus_file', type=str)
+    parser.add_argument('-F', '--flows', required=False, help='The amount of distinct flows in the generated corpus (default = 1000)', dest='flows', type=int, default=1000)
+    parser.add_argument('-N', '--domain-network', required=False, help='The IPs in the corpus which are part of this network are vPorts of the stand-in domain, the others are outside the domain (default = 10.0.0.0/8)', dest='domain_network', type=str, default='10.0.0.0/8')
+    parser.add_argument('-n', '--lines', required=False, help='The amount of lines in the generated corpus (default = 100000)', dest='lines', type=int, default=100000)
+    parser.add_argument('-r', '--rate', required=False, help='The amount of lines per second to send, 0 sends as fast as possible (default = 0)', dest='rate', type=int, default=0)
+    parser.add_argument('-s', '--strict-source-ports', required=False, help='Use strict source ports, like the learner option', dest='strictsource', action='store_true')
+    parser.add_argument('-t', '--type', required=False, help='On what entity type the ACLs are applied, like the learner option (default = POLICYGROUP)', dest='acl_type', type=str, choices=['POLICYGROUP', 'ZONE', 'SUBNET'], default='POLICYGROUP')
+    parser.add_argument('-v', '--verbose', required=False, help='Enable verbose output of the learner', dest='verbose', action='store_true')
+    parser.add_argument('--vsd-latency', required=False, help='The amount of milliseconds the stand-in VSD takes to create an ACL entry or network macro (default = 20)', dest='vsd_latency', type=float, default=20.0)
+    parser.add_argument('-w', '--workers', required=False, help='The amount of workers handling the received flow log messages (default = 2)', dest='workers', type=int, default=2)
+    args = parser.parse_args()
+    return args
+
+
+def generate_corpus(lines, flows, external):
+    """
+    Returns flow log lines of the given amount of distinct flows, each with a random source port, of which the external fraction has a destination outside 10.0.0.0/8
+    """
+
+    random.seed(0)
+    flow_tuples = []
+    for i in range(flows):
+        if random.random() < external:
+            dst_ip = '172.%s.%s.%s' % (random.randrange(16, 32), random.randrange(256), random.randrange(1, 255))
+        else:
+            dst_ip = '10.%s.%s.%s' % (random.randrange(4), random.randrange(16), random.randrange(1, 255))
+        flow_tuples.append((
+            random.choice(['tcp', 'udp']),
+            '10.%s.%s.%s' % (i % 4, (i // 4) % 16, random.randrange(1, 255)),
+            dst_ip,
+            random.choice([22, 53, 80, 443, 3306, 8080])
+        ))
+
+    corpus = []
+    for _ in range(lines):
+        stream_type, src_ip, dst_ip, dst_port = random.choice(flow_tuples)
+        corpus.append('Oct 18 10:00:00 vrs-01 ovs-vswitchd: ACLAUDIT(INFO) dir: ingress type: ACL_ACCEPT ipv4(src=%s,dst=%s,proto=%s,tos=0,ttl=64,frag=no),%s(src=%s,dst=%s),tcp_flags(0x2)' % (src_ip, dst_ip, '6' if stream_type == 'tcp' else '17', stream_type, random.randrange(32768, 61000), dst_port))
+    return corpus
+
+
+def build_stand_in_domain(corpus, domain_network, vsd_latency):
+    """
+    Returns a stand-in domain with a vPort for every IP of the corpus in the domain network, a subnet and policy group per /24 and a zone per /16, and a stand-in enterprise without network macros
+    """
+
+    domain_network = ipaddress.ip_network(str(domain_network))
+    ip_addresses = set()
+    for data in corpus:
+        ip_matches = nuage_acl_learner.ip_regex.match(data)
+        if ip_matches is None:
+            continue
+        for ip_address in ip_matches.group(2, 3):
+            if ipaddress.ip_address(str(ip_address)) in domain_network:
+                ip_addresses.add(ip_address)
+
+    subnets = {}
+    zones = {}
+    policygroup_vports = {}
+    vports = []
+    vm_interfaces = []
+    for i, ip_address in enumerate(sorted(ip_addresses)):
+        subnet_address = ip_address.rsplit('.', 1)[0] + '.0'
+        zone_id = 'zone-%s' % '.'.join(ip_address.split('.')[:2])
+        zones.setdefault(zone_id, StandInObject(id=zone_id, parent_id='domain'))
+        subnet = subnets.setdefault(subnet_address, StandInObject(id='subnet-%s' % subnet_address, address=subnet_address, netmask='255.255.255.0', parent_id=zone_id))
+        vport = StandInObject(id='vport-%s' % i, parent_id=subnet.id)
+        vports.append(vport)
+        vm_interfaces.append(StandInObject(id='vminterface-%s' % i, vport_id=vport.id, ip_address=ip_address, mac='02:00:00:%02x:%02x:%02x' % (i >> 16 & 255, i >> 8 & 255, i & 255)))
+        policygroup_vports.setdefault(subnet_address, []).append(vport)
+
+    policygroups = [StandInObject(id='policygroup-%s' % subnet_address, name='PG %s' % subnet_address, vports=StandInFetcher(members)) for subnet_address, members in sorted(policygroup_vports.items())]
+    domain = StandInParent(
+        latency=vsd_latency,
+        id='domain',
+        name='Replay domain',
+        subnets=StandInFetcher(list(subnets.values())),
+        zones=StandInFetcher(list(zones.values())),
+        policy_groups=StandInFetcher(policygroups),
+        vports=StandInFetcher(vports),
+        vm_interfaces=StandInFetcher(vm_interfaces)
+    )
+    enterprise = StandInParent(latency=vsd_latency, id='enterprise', name='Replay enterprise', enterprise_networks=StandInFetcher([]))
+    return domain, enterprise
+
+
+def send_corpus(address, corpus, rate):
+    """
+    Sends the corpus over a TCP connection, spread over time to the given amount of lines per second
+    """
+
+    connection = socket.create_connection(address)
+    start_time = time.time()
+    chunk_size = 100
+    for chunk_start in range(0, len(corpus), chunk_size):
+        if rate > 0:
+            delay = start_time + chunk_start / rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        connection.sendall(''.join('%s\n' % data for data in corpus[chunk_start:chunk_start + chunk_size]).encode('utf-8'))
+    connection.close()
+
+
+def main():
+    """
+    Main function running the replay
+    """
+
+    # Handling arguments
+    args = get_args()
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.INFO if args.verbose else logging.WARNING)
+    nuage_acl_learner.logger = logging.getLogger('nuage_acl_learner')
+    nuage_acl_learner.configuration.update({
+        'acl_type': args.acl_type,
+        'batch_interval': 1.0,
+        'batch_size': args.batch_size,
+        'commit_retries': 0,
+        'compact_interval': 0,
+        'next_priority': 100,
+        'page_size': 500,
+        'state_file': None,
+        'state_interval': 60,
+        'strictsource': args.strictsource
+    })
+
+    if args.corpus_file:
+        with io.open(args.corpus_file, encoding='utf-8', errors='replace') as corpus_file:
+            corpus = [line.strip() for line in corpus_file if line.strip()]
+    else:
+        corpus = generate_corpus(args.lines, args.flows, args.external)
+
+    # Loading the stand-in domain with the topology loader of the learner
+    vsd_latency = args.vsd_latency / 1000
+    nuage_acl_learner.nc_domain, nuage_acl_learner.nc_enterprise = build_stand_in_domain(corpus, args.domain_network, vsd_latency)
+    nuage_acl_learner.ingress_learning_acl = StandInParent(latency=vsd_latency, id='ingress-learning-acl')
+    nuage_acl_learner.nc_networkmacroindex = nuage_acl_learner.NetworkMacroIndex()
+    load_pool = ThreadPool(8)
+    nuage_acl_learner.load_topology(load_pool, 500)
+    load_pool.close()
+
+    # Starting the committer, the flow log workers and the TCP server of the learner
+    nuage_acl_learner.acl_entry_queue = queue.Queue(maxsize=10000)
+    commit_pool = ThreadPool(args.commit_workers)
+    committer = threading.Thread(target=nuage_acl_learner.acl_entry_committer, args=(nuage_acl_learner.acl_entry_queue, commit_pool))
+    committer.daemon = True
+    committer.start()
+
+    latencies = []
+    ingest_queue = TimedQueue(maxsize=10000)
+    nuage_acl_learner.ingest_queue = ingest_queue
+    handle_flow_log = nuage_acl_learner.handle_flow_log
+
+    def timed_handle_flow_log(client_address, data):
+        try:
+            return handle_flow_log(client_address, data)
+        finally:
+            latencies.append(time.time() - ingest_queue.last_put_time.value)
+
+    nuage_acl_learner.handle_flow_log = timed_handle_flow_log
+    workers = []
+    for _ in range(args.workers):
+        worker = threading.Thread(target=nuage_acl_learner.flow_log_worker, args=(ingest_queue,))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+
+    capture_server = nuage_acl_learner.ACLTCPServer(('127.0.0.1', 0), nuage_acl_learner.ACLTCPHandler)
+    server_thread = threading.Thread(target=capture_server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    # Replaying the corpus and waiting until every line is handled and every ACL entry is created
+    print('Replaying %s lines to %s vPorts at %s, VSD latency %s ms' % (len(corpus), len(nuage_acl_learner.nc_vportmap), '%s lines/s' % args.rate if args.rate > 0 else 'full speed', args.vsd_latency))
+    start_time = time.time()
+    send_corpus(capture_server.server_address, corpus, args.rate)
+    while len(latencies) < len(corpus):
+        time.sleep(0.01)
+    handle_time = time.time() - start_time
+    for _ in workers:
+        ingest_queue.put(None)
+    nuage_acl_learner.acl_entry_queue.put(None)
+    committer.join()
+    commit_time = time.time() - start_time
+    capture_server.shutdown()
+    capture_server.server_close()
+    commit_pool.close()
+
+    latencies.sort()
+    counters = nuage_acl_learner.counters
+    print('Handled lines:        %s in %.2f s, %.0f lines/s' % (counters.get('handled', 0), handle_time, len(corpus) / handle_time))
+    print('Known flow hit rate:  %.1f%% (%s duplicates, %s errors)' % (100.0 * counters.get('duplicates', 0) / len(corpus), counters.get('duplicates', 0), counters.get('errors', 0)))
+    print('Blocked TCP lines:    %s' % counters.get('tcp_blocked', 0))
+    print('ACL entries created:  %s, all created after %.2f s' % (nuage_acl_learner.ingress_learning_acl.created, commit_time))
+    print('Network macros:       %s created' % nuage_acl_learner.nc_enterprise.created)
+    print('Handling latency:     p50 %.2f ms, p99 %.2f ms, max %.2f ms' % (latencies[len(latencies) // 2] * 1000, latencies[int(0.99 * (len(latencies) - 1))] * 1000, latencies[-1] * 1000))
+    return 0
+
+
+# Start program
+if __name__ == "__main__":
+    main()
@@ -9,216 +9,62 @@ The script will try and be intelligent and change the Ether type and Protocols
 The script will not touch null or None values, because there is a difference
  between None and * for instance.
 
+With the stream option, each row is written as NDJSON or CSV as soon as it is
+ gathered, optionally gzip compressed into the output file, so memory usage
+ does not grow with the size of the report.
+
+With a snapshot file, the rows of each VM interface are stored between runs and
+ the policy decisions are only fetched again for VM interfaces which were
+ updated or which use a changed or removed ACL entry template. When ACL entry
+ templates were added, all VM interfaces are fetched again. Policy group
+ membership changes of a vPort are not detected, use the full option after
+ those. The diff option only shows the rows which were added or removed.
+
 --- Author ---
 Philippe Dellaert <philippe.dellaert@nuagenetworks.net>
 
 --- Version history ---
 2017-05-02 - 1.0.0 - First stable release
 2020-07-06 - 1.1.0 - Migrate to v6 API
+2026-10-18 - 1.2.0 - Cache entity name lookups
+2026-10-18 - 1.3.0 - Prefetch ACL entry templates into a stats ID index
+2026-10-18 - 1.4.0 - Fetch policy decisions with a pool of worker threads
+2026-10-18 - 1.5.0 - Look up VMs in a per enterprise UUID index
+2026-10-18 - 1.6.0 - Incremental runs and differential output using a snapshot
+2026-10-18 - 1.7.0 - Stream rows as NDJSON or CSV, optionally gzip compressed
+2026-10-18 - 1.8.0 - Build rows with the shared table driven ACL row builder
 
  --- Usage ---
 run 'shared_domain_vports_acl_analytics.py -h' for an overview
 """
 from __future__ import print_function
 
-from builtins import str
+from future import standard_library
+standard_library.install_aliases()
+from builtins import range, str
 import argparse
 import getpass
 import json
 import logging
+import queue
+import threading
 
 from prettytable import PrettyTable
 from vspk import v6 as vsdk
 
-ether_types = {
-    '0x0800': 'IPv4',
-    '0x0806': 'ARP',
-    '0x0842': 'Wake-on-LAN',
-    '0x22F3': 'IETF TRILL',
-    '0x6003': 'DECnet Phase IV',
-    '0x8035': 'RARP',
-    '0x809B': 'AppleTalk ',
-    '0x80F3': 'AARP',
-    '0x8100': '802.1Q and 802.1aq',
-    '0x8137': 'IPX',
-    '0x8204': 'QNX Qnet',
-    '0x86DD': 'IPv6',
-    '0x8808': 'Ethernet flow control',
-    '0x8819': 'CobraNet',
-    '0x8847': 'MPLS unicast',
-    '0x8848': 'MPLS multicast',
-    '0x8863': 'PPPoE Discovery Stage',
-    '0x8864': 'PPPoE Session Stage',
-    '0x8870': 'Jumbo Frames (proposed)',
-    '0x887B': 'HomePlug 1.0 MME',
-    '0x888E': 'EAP over LAN (IEEE 802.1X)',
-    '0x8892': 'PROFINET Protocol',
-    '0x889A': 'HyperSCSI (SCSI over Ethernet)',
-    '0x88A2': 'ATA over Ethernet',
-    '0x88A4': 'EtherCAT Protocol',
-    '0x88A8': 'Provider Bridging (IEEE 802.1ad) ',
-    '0x88AB': 'Ethernet Powerlink',
-    '0x88CC': 'LLDP',
-    '0x88CD': 'SERCOS III',
-    '0x88E1': 'HomePlug AV MME',
-    '0x88E3': 'Media Redundancy Protocol (IEC62439-2)',
-    '0x88E5': 'MAC security (IEEE 802.1AE)',
-    '0x88E7': 'Provider Backbone Bridges (PBB) (IEEE 802.1ah)',
-    '0x88F7': 'Precision Time Protocol (PTP) over Ethernet (IEEE 1588)',
-    '0x8902': 'IEEE 802.1ag Connectivity Fault Management (CFM) Protocol ',
-    '0x8906': 'FCoE',
-    '0x8914': 'FCoE Initialization Protocol',
-    '0x8915': 'RoCE',
-    '0x891D': 'TTE',
-    '0x892F': 'HSR',
-    '0x9000': 'Ethernet Configuration Testing Protocol'
-}
-
-protocols = {
-    '0': 'HOPOPT',
-    '1': 'ICMP',
-    '2': 'IGMP',
-    '3': 'GGP',
-    '4': 'IPv4',
-    '5': 'ST',
-    '6': 'TCP',
-    '7': 'CBT',
-    '8': 'EGP',
-    '9': 'IGP',
-    '10': 'BBN-RCC-MON',
-    '11': 'NVP-II',
-    '12': 'PUP',
-    '13': 'ARGUS',
-    '14': 'EMCON',
-    '15': 'XNET',
-    '16': 'CHAOS',
-    '17': 'UDP',
-    '18': 'MUX',
-    '19': 'DCN-MEAS',
-    '20': 'HMP',
-    '21': 'PRM',
-    '22': 'XNS-IDP',
-    '23': 'TRUNK-1',
-    '24': 'TRUNK-2',
-    '25': 'LEAF-1',
-    '26': 'LEAF-2',
-    '27': 'RDP',
-    '28': 'IRTP',
-    '29': 'ISO-TP4',
-    '30': 'NETBLT',
-    '31': 'MFE-NSP',
-    '32': 'MERIT-INP',
-    '33': 'DCCP',
-    '34': '3PC',
-    '35': 'IDPR',
-    '36': 'XTP',
-    '37': 'DDP',
-    '38': 'IDPR-CMTP',
-    '39': 'TP++',
-    '40': 'IL',
-    '41': 'IPv6',
-    '42': 'SDRP',
-    '43': 'IPv6-Route',
-    '44': 'IPv6-Frag',
-    '45': 'IDRP',
-    '46': 'RSVP',
-    '47': 'GRE',
-    '48': 'DSR',
-    '49': 'BNA',
-    '50': 'ESP',
-    '51': 'AH',
-    '52': 'I-NLSP',
-    '53': 'SWIPE',
-    '54': 'NARP',
-    '55': 'MOBILE',
-    '56': 'TLSP',
-    '57': 'SKIP',
-    '58': 'IPv6-ICMP',
-    '59': 'IPv6-NoNxt',
-    '60': 'IPv6-Opts',
-    '62': 'CFTP',
-    '64': 'SAT-EXPAK',
-    '65': 'KRYPTOLAN',
-    '66': 'RVD',
-    '67': 'IPPC',
-    '69': 'SAT-MON',
-    '70': 'VISA',
-    '71': 'IPCV',
-    '72': 'CPNX',
-    '73': 'CPHB',
-    '74': 'WSN',
-    '75': 'PVP',
-    '76': 'BR-SAT-MON',
-    '77': 'SUN-ND',
-    '78': 'WB-MON',
-    '79': 'WB-EXPAK',
-    '80': 'ISO-IP',
-    '81': 'VMTP',
-    '82': 'SECURE-VMTP',
-    '83': 'VINES',
-    '84': 'IPTM',
-    '85': 'NSFNET-IGP',
-    '86': 'DGP',
-    '87': 'TCF',
-    '88': 'EIGRP',
-    '89': 'OSPFIGP',
-    '90': 'Sprite-RPC',
-    '91': 'LARP',
-    '92': 'MTP',
-    '93': 'AX.25',
-    '94': 'IPIP',
-    '95': 'MICP',
-    '96': 'SCC-SP',
-    '97': 'ETHERIP',
-    '98': 'ENCAP',
-    '100': 'GMTP',
-    '101': 'IFMP',
-    '102': 'PNNI',
-    '103': 'PIM',
-    '104': 'ARIS',
-    '105': 'SCPS',
-    '106': 'QNX',
-    '107': 'A/N',
-    '108': 'IPComp',
-    '109': 'SNP',
-    '110': 'Compaq-Peer',
-    '111': 'IPX-in-IP',
-    '112': 'VRRP',
-    '113': 'PGM',
-    '115': 'L2TP',
-    '116': 'DDX',
-    '117': 'IATP',
-    '118': 'STP',
-    '119': 'SRP',
-    '120': 'UTI',
-    '121': 'SMP',
-    '122': 'SM',
-    '123': 'PTP',
-    '124': 'ISIS over IPv4',
-    '125': 'FIRE',
-    '126': 'CRTP',
-    '127': 'CRUDP',
-    '128': 'SSCOPMCE',
-    '129': 'IPLT',
-    '130': 'SPS',
-    '131': 'PIPE',
-    '132': 'SCTP',
-    '133': 'FC',
-    '134': 'RSVP-E2E-IGNORE',
-    '135': 'Mobility Header',
-    '136': 'UDPLite',
-    '137': 'MPLS-in-IP',
-    '138': 'manet',
-    '139': 'HIP',
-    '140': 'Shim6',
-    '141': 'WESP',
-    '142': 'ROHC',
-    '255': 'Reserved'
-}
+from acl_analytics_common import ACLEntryTemplateIndex, ACLRowBuilder, EntityResolver, RateLimiter, ReportSnapshot, VMIndex, diff_outputs, ether_types, protocols
+from vspk_examples_common import StreamingOutput, open_output
 
+acl_entry_template_index = None
+acl_row_builder = None
 configuration = {}
+entity_resolver = None
 logger = None
+output_lock = threading.Lock()
 output_parser = None
+rate_limiter = None
+snapshot = None
+stale_template_keys = None
 
 
 def get_args():
@@ -227,15 +73,27 @@ def get_args():
     """
 
     parser = argparse.ArgumentParser(description="Tool to gather statistics on domains, zones, subnets or vports within a certain time frame.")
+    parser.add_argument('--cache-size', required=False, help='The maximum amount of entity names kept in the cache (default = 10000)', dest='cache_size', type=int, default=10000)
+    parser.add_argument('--cache-ttl', required=False, help='The amount of seconds an entity name is kept in the cache (default = 3600)', dest='cache_ttl', type=int, default=3600)
     parser.add_argument('-d', '--debug', required=False, help='Enable debug output', dest='debug', action='store_true')
+    parser.add_argument('-D', '--diff', required=False, help='Only show the rows which were added or removed since the snapshot, requires a snapshot file', dest='diff', action='store_true')
+    parser.add_argument('-f', '--full', required=False, help='Fetch the policy decisions of all VM interfaces, even if they did not change since the snapshot', dest='full', action='store_true')
     parser.add_argument('-j', '--json', required=False, help='Print as JSON, not as a table', dest='json_output', action='store_true')
     parser.add_argument('-l', '--log-file', required=False, help='File to log to (default = stdout)', dest='logfile', type=str)
     parser.add_argument('-E', '--nuage-enterprise', required=True, help='The enterprise with which to connect to the Nuage VSD/SDK host', dest='nuage_enterprise', type=str)
     parser.add_argument('-H', '--nuage-host', required=True, help='The Nuage VSD/SDK endpoint to connect to', dest='nuage_host', type=str)
+    parser.add_argument('-m', '--max-rate', required=False, help='The maximum amount of policy decision requests per second, over all workers (default = no limit)', dest='max_rate', type=float)
+    parser.add_argument('-o', '--output-file', required=False, help='File to write the output to (default = stdout)', dest='output_file', type=str)
     parser.add_argument('-P', '--nuage-port', required=False, help='The Nuage VSD/SDK server port to connect to (default = 8443)', dest='nuage_port', type=int, default=8443)
+    parser.add_argument('--page-size', required=False, help='The amount of objects to fetch per request when prefetching (default = 500)', dest='page_size', type=int, default=500)
     parser.add_argument('-p', '--nuage-password', required=False, help='The password with which to connect to the Nuage VSD/SDK host. If not specified, the user is prompted at runtime for a password', dest='nuage_password', type=str)
+    parser.add_argument('-q', '--queue-size', required=False, help='The maximum amount of VM interfaces waiting for a worker, enumeration pauses when the queue is full (default = 1000)', dest='queue_size', type=int, default=1000)
+    parser.add_argument('-s', '--snapshot', required=False, help='SQLite file in which the rows of each VM interface are stored, only VM interfaces which changed since the previous run are fetched again', dest='snapshot_file', type=str)
+    parser.add_argument('--stream', required=False, help='Stream each row as soon as it is gathered, in NDJSON or CSV format, instead of printing everything at the end', dest='stream_format', type=str, choices=['ndjson', 'csv'])
     parser.add_argument('-u', '--nuage-user', required=True, help='The username with which to connect to the Nuage VSD/SDK host', dest='nuage_username', type=str)
     parser.add_argument('-v', '--verbose', required=False, help='Enable verbose output', dest='verbose', action='store_true')
+    parser.add_argument('-w', '--workers', required=False, help='The amount of concurrent workers fetching policy decisions (default = 1)', dest='workers', type=int, default=1)
+    parser.add_argument('-z', '--gzip', required=False, help='Compress the output file with gzip, requires an output file', dest='gzip', action='store_true')
     args = parser.parse_args()
     return args
 
@@ -246,11 +104,8 @@ def handle_output(output):
     """
     global output_parser
 
-    if output['Ether type'] in list(ether_types.keys()):
-        output['Ether type'] = ether_types[output['Ether type']]
-
-    if output['Protocol'] in list(protocols.keys()):
-        output['Protocol'] = protocols[output['Protocol']]
+    output['Ether type'] = ether_types.get(output['Ether type'], output['Ether type'])
+    output['Protocol'] = protocols.get(output['Protocol'], output['Protocol'])
 
     if output['Source type'] == 'ANY':
         output['Source name'] = '*'
@@ -258,209 +113,154 @@ def handle_output(output):
     if output['Destination type'] == 'ANY':
         output['Source name'] = '*'
 
-    if not configuration['json_output']:
+    if not configuration['json_output'] and configuration['stream_format'] != 'ndjson':
         # Cleanup None values
         for key in list(output.keys()):
             if output[key] is None:
                 output[key] = ''
 
     logger.debug('Saving output to output object')
-    if configuration['json_output']:
-        output_parser.append(output)
+    with output_lock:
+        if configuration['stream_format']:
+            output_parser.write(output)
+        elif configuration['json_output']:
+            output_parser.append(output)
+        else:
+            row = [
+                output['VM Name'],
+                output['Interface MAC'],
+                output['Enterprise'],
+                output['Domain'],
+                output['Domain type'],
+                output['ACL type'],
+                output['Ether type'],
+                output['Protocol'],
+                output['Source type'],
+                output['Source name'],
+                output['Destination type'],
+                output['Destination name'],
+                output['Source port'],
+                output['Destination port'],
+                output['DSCP'],
+                output['Stateful'],
+                output['Action']
+            ]
+            if configuration['diff']:
+                row.insert(0, output['Change'])
+            output_parser.add_row(row)
+
+
+def handle_interface_outputs(vm_interface, outputs, template_keys):
+    """
+    Stores the outputs of a VM interface in the snapshot and handles them, in diff mode only the changes are handled
+    """
+    global configuration, snapshot
+
+    if snapshot is None:
+        for output in outputs:
+            handle_output(output=output)
+        return
+
+    previous_outputs = snapshot.save_interface(vm_interface.id, vm_interface.last_updated_date, template_keys, outputs)
+    if configuration['diff']:
+        for change, output in diff_outputs(previous_outputs, outputs):
+            output['Change'] = change
+            handle_output(output=output)
     else:
-        output_parser.add_row([
-            output['VM Name'],
-            output['Interface MAC'],
-            output['Enterprise'],
-            output['Domain'],
-            output['Domain type'],
-            output['ACL type'],
-            output['Ether type'],
-            output['Protocol'],
-            output['Source type'],
-            output['Source name'],
-            output['Destination type'],
-            output['Destination name'],
-            output['Source port'],
-            output['Destination port'],
-            output['DSCP'],
-            output['Stateful'],
-            output['Action']
-        ])
-
-def handle_vm_interface(vm_interface, enterprise, domain, domain_type, nc):
-    global configuration, logger, output_parser
+        for output in outputs:
+            handle_output(output=output)
+
+
+def handle_vm_interface(vm_interface, enterprise, vm_index, domain, domain_type, nc):
+    global acl_row_builder, configuration, logger, rate_limiter, snapshot, stale_template_keys
+
+    # Reusing the rows from the snapshot if the VM interface did not change
+    if snapshot is not None:
+        snapshot_outputs = snapshot.get_current_outputs(vm_interface.id, vm_interface.last_updated_date, stale_template_keys)
+        if snapshot_outputs is not None:
+            logger.debug('VM interface %s did not change since the snapshot, using the stored rows' % vm_interface.id)
+            if not configuration['diff']:
+                for output in snapshot_outputs:
+                    handle_output(output=output)
+            return
 
     # Gathering ACL rules and handling them
+    if rate_limiter is not None:
+        rate_limiter.wait()
     logger.debug('Gathering VM interface policy decisions')
     policy_decisions = vm_interface.policy_decisions.get_first()
-    ingress_acl_entries = policy_decisions.ingress_acls[0]['entries']
-    egress_acl_entries = policy_decisions.egress_acls[0]['entries']
-    forward_acl_entries = policy_decisions.ingress_adv_fwd[0]['entries']
-    logger.debug('Found {0} ingress ACLs, {1} egress ACLs and {2} forward ACLs'.format(len(ingress_acl_entries), len(egress_acl_entries),
-                                                                                       len(forward_acl_entries)))
-    vm = enterprise.vms.get_first(filter='UUID == "{0:s}"'.format(vm_interface.vmuuid))
-
-    logger.debug('Handling Ingress ACL entries')
-    for entry in ingress_acl_entries:
-        acl_rule = None
-
-        logger.debug('Using minimal information from the policy decision entry itself')
-        output = {
-            'VM Name': vm.name,
-            'Interface MAC': vm_interface.mac,
-            'Enterprise': enterprise.name,
-            'Domain': domain.name,
-            'Domain type': domain_type,
-            'ACL type': 'Ingress',
-            'Ether type': entry['etherType'],
-            'Protocol': entry['protocol'],
-            'Source type': 'VM',
-            'Source name': vm.name,
-            'Destination type': entry['destinationType'],
-            'Destination name': entry['destinationValue'],
-            'Source port': entry['sourcePort'],
-            'Destination port': entry['destPort'],
-            'DSCP': entry['DSCP'],
-            'Stateful': '',
-            'Action': entry['actionDetails']['actionType']
-        }
-
-        if entry['aclTemplateEntryId']:
-            logger.debug('Finding the actual Ingress ACL Template Entry to use its data')
-            # We are using this approach with the Stats ID as the aclTemplateEntryId points to the stats ID of an Ingress/Egress ACL Entry Template in the current version (bug report generated)
-            acl_rule = nc.user.ingress_acl_entry_templates.get_first(filter='statsID == "%s"' % entry['aclTemplateEntryId'])
-
-        if acl_rule:
-            logger.debug('Found a matching Ingress ACL Template Entry: %s' % acl_rule.description)
-            output['Ether type'] = acl_rule.ether_type
-            output['Protocol'] = acl_rule.protocol
-            output['Source type'] = acl_rule.location_type
-            if acl_rule.location_type and nc.user.fetcher_for_rest_name(acl_rule.location_type.lower()) is not None:
-                output['Source name'] = nc.user.fetcher_for_rest_name(acl_rule.location_type.lower()).get_first(
-                    filter='ID == "%s"' % acl_rule.location_id).name
-            output['Destination type'] = acl_rule.network_type
-            if acl_rule.network_type and nc.user.fetcher_for_rest_name(acl_rule.network_type.lower()) is not None:
-                output['Destination name'] = nc.user.fetcher_for_rest_name(acl_rule.network_type.lower()).get_first(
-                    filter='ID == "%s"' % acl_rule.network_id).name
-            output['Source port'] = acl_rule.source_port
-            output['Destination port'] = acl_rule.destination_port
-            output['DSCP'] = acl_rule.dscp
-            output['Stateful'] = acl_rule.stateful
-            output['Action'] = acl_rule.action
-
-        handle_output(output=output)
-
-    logger.debug('Handling Egress ACL entries')
-    for entry in egress_acl_entries:
-        acl_rule = None
-
-        logger.debug('Using minimal information from the policy decision entry itself')
-        output = {
-            'VM Name': vm.name,
-            'Interface MAC': vm_interface.mac,
-            'Enterprise': enterprise.name,
-            'Domain': domain.name,
-            'Domain type': domain_type,
-            'ACL type': 'Egress',
-            'Ether type': entry['etherType'],
-            'Protocol': entry['protocol'],
-            'Source type': 'VM',
-            'Source name': vm.name,
-            'Destination type': entry['destinationType'],
-            'Destination name': entry['destinationValue'],
-            'Source port': entry['sourcePort'],
-            'Destination port': entry['destPort'],
-            'DSCP': entry['DSCP'],
-            'Stateful': '',
-            'Action': entry['actionDetails']['actionType']
-        }
-
-        if entry['aclTemplateEntryId']:
-            logger.debug('Finding the actual Egress ACL Template Entry to use its data')
-            # We are using this approach with the Stats ID as the aclTemplateEntryId points to the stats ID of an Ingress/Egress ACL Entry Template in the current version (bug report generated)
-            acl_rule = nc.user.egress_acl_entry_templates.get_first(filter='statsID == "%s"' % entry['aclTemplateEntryId'])
-
-        if acl_rule:
-            logger.debug('Found a matching Egress ACL Template Entry: %s' % acl_rule.description)
-            output['Ether type'] = acl_rule.ether_type
-            output['Protocol'] = acl_rule.protocol
-            output['Source type'] = acl_rule.location_type
-            if acl_rule.location_type and nc.user.fetcher_for_rest_name(acl_rule.location_type.lower()) is not None:
-                output['Source name'] = nc.user.fetcher_for_rest_name(acl_rule.location_type.lower()).get_first(
-                    filter='ID == "%s"' % acl_rule.location_id).name
-            output['Destination type'] = acl_rule.network_type
-            if acl_rule.network_type and nc.user.fetcher_for_rest_name(acl_rule.network_type.lower()) is not None:
-                output['Destination name'] = nc.user.fetcher_for_rest_name(acl_rule.network_type.lower()).get_first(
-                    filter='ID == "%s"' % acl_rule.network_id).name
-            output['Source port'] = acl_rule.source_port
-            output['Destination port'] = acl_rule.destination_port
-            output['DSCP'] = acl_rule.dscp
-            output['Stateful'] = acl_rule.stateful
-            output['Action'] = acl_rule.action
-
-        handle_output(output=output)
-
-    logger.debug('Handling Redirect policies entries')
-    for entry in forward_acl_entries:
-        acl_rule = None
-
-        logger.debug('Using minimal information from the policy decision entry itself')
-        output = {
-            'VM Name': vm.name,
-            'Interface MAC': vm_interface.mac,
-            'Enterprise': enterprise.name,
-            'Domain': domain.name,
-            'Domain type': domain_type,
-            'ACL type': 'Forward',
-            'Ether type': entry['etherType'],
-            'Protocol': entry['protocol'],
-            'Source type': 'VM',
-            'Source name': vm.name,
-            'Destination type': entry['destinationType'],
-            'Destination name': entry['destinationValue'],
-            'Source port': entry['sourcePort'],
-            'Destination port': entry['destPort'],
-            'DSCP': entry['DSCP'],
-            'Stateful': '',
-            'Action': entry['actionDetails']['actionType']
-        }
-
-        if entry['ingressAdvFwdTemplateEntryId']:
-            logger.debug('Finding the actual Ingress Advanced ACL Template Entry to use its data')
-            # We are using this approach with the Stats ID as the ingressAdvFwdTemplateEntryId points to the stats ID of an Ingress/Egress ACL Entry Template in the current version (bug report generated)
-            acl_rule = nc.user.ingress_adv_fwd_entry_templates.get_first(filter='statsID == "%s"' % entry['ingressAdvFwdTemplateEntryId'])
-
-        if acl_rule:
-            logger.debug('Found a matching Ingress Advanced ACL Template Entry: %s' % acl_rule.description)
-            output['Ether type'] = acl_rule.ether_type
-            output['Protocol'] = acl_rule.protocol
-            output['Source type'] = acl_rule.location_type
-            if acl_rule.location_type and nc.user.fetcher_for_rest_name(acl_rule.location_type.lower()) is not None:
-                output['Source name'] = nc.user.fetcher_for_rest_name(acl_rule.location_type.lower()).get_first(
-                    filter='ID == "%s"' % acl_rule.location_id).name
-            output['Destination type'] = acl_rule.network_type
-            if acl_rule.network_type and nc.user.fetcher_for_rest_name(acl_rule.network_type.lower()) is not None:
-                output['Destination name'] = nc.user.fetcher_for_rest_name(acl_rule.network_type.lower()).get_first(
-                    filter='ID == "%s"' % acl_rule.network_id).name
-            output['Source port'] = acl_rule.source_port
-            output['Destination port'] = acl_rule.destination_port
-            output['DSCP'] = acl_rule.dscp
-            output['Action'] = acl_rule.action
-
-        handle_output(output=output)
+    vm = vm_index.lookup(vm_interface.vmuuid)
+    template_keys = set()
+    outputs = acl_row_builder.build(policy_decisions=policy_decisions, base_fields={
+        'VM Name': vm.name,
+        'Interface MAC': vm_interface.mac,
+        'Enterprise': enterprise.name,
+        'Domain': domain.name,
+        'Domain type': domain_type
+    }, template_keys=template_keys)
+
+    handle_interface_outputs(vm_interface=vm_interface, outputs=outputs, template_keys=template_keys)
+
+
+def try_handle_vm_interface(**kwargs):
+    """
+    Handles a VM interface, logging a failure. The snapshot rows of a VM interface which could not be handled are kept, so they are not reported as removed
+    """
+    global snapshot
+
+    try:
+        handle_vm_interface(**kwargs)
+    except Exception as e:
+        logger.error('Unable to handle VM interface with MAC {0!s}: {1!s}'.format(kwargs['vm_interface'].mac, str(e)))
+        if snapshot is not None:
+            snapshot.keep_interface(kwargs['vm_interface'].id)
+
+
+def policy_decision_worker(work_queue):
+    """
+    Handles the VM interfaces from the work queue until it receives None. The worker keeps running on any error, so the queue never stops being consumed
+    """
+
+    while True:
+        work = work_queue.get()
+        try:
+            if work is None:
+                return
+            try_handle_vm_interface(**work)
+        except Exception as e:
+            logger.error('Unexpected error in a policy decision worker: {0!s}'.format(e))
+        finally:
+            work_queue.task_done()
+
+
+def submit_vm_interface(work_queue, **kwargs):
+    """
+    Puts the VM interface on the work queue, blocking while the queue is full. Without a work queue the VM interface is handled directly
+    """
+
+    if work_queue is None:
+        try_handle_vm_interface(**kwargs)
+    else:
+        work_queue.put(kwargs)
+
 
 def main():
     """
     Main function to gather the information on the VM applied policies
     """
-    global configuration, logger, output_parser
+    global acl_entry_template_index, acl_row_builder, configuration, entity_resolver, logger, output_parser, rate_limiter, snapshot, stale_template_keys
 
     # Handling arguments
     args = get_args()
     configuration = {}
+    configuration['cache_size'] = args.cache_size
+    configuration['cache_ttl'] = args.cache_ttl
     configuration['debug'] = args.debug
+    configuration['diff'] = args.diff
+    configuration['full'] = args.full
+    configuration['gzip'] = args.gzip
     configuration['json_output'] = args.json_output
+    configuration['max_rate'] = args.max_rate
     configuration['log_file'] = None
     if args.logfile:
         configuration['log_file'] = args.logfile
@@ -471,7 +271,17 @@ def main():
     if args.nuage_password:
         configuration['nuage_password'] = args.nuage_password
     configuration['nuage_username'] = args.nuage_username
+    configuration['output_file'] = None
+    if args.output_file:
+        configuration['output_file'] = args.output_file
+    configuration['page_size'] = args.page_size
+    configuration['stream_format'] = args.stream_format
+    configuration['queue_size'] = args.queue_size
+    configuration['snapshot_file'] = None
+    if args.snapshot_file:
+        configuration['snapshot_file'] = args.snapshot_file
     configuration['verbose'] = args.verbose
+    configuration['workers'] = args.workers
 
     # Logging settings
     if configuration['debug']:
@@ -484,6 +294,14 @@ def main():
     logging.basicConfig(filename=configuration['log_file'], format='%(asctime)s %(levelname)s %(message)s', level=log_level)
     logger = logging.getLogger(__name__)
 
+    if configuration['gzip'] and not configuration['output_file']:
+        logger.critical('The gzip option requires an output file')
+        return 1
+
+    if configuration['diff'] and not configuration['snapshot_file']:
+        logger.critical('The diff option requires a snapshot file')
+        return 1
+
     # Getting user password for Nuage connection
     if configuration['nuage_password'] is None:
         logger.debug('No command line Nuage password received, requesting Nuage password from user')
@@ -500,6 +318,25 @@ def main():
         logger.critical('Caught exception: %s' % str(e))
         return 1
 
+    # Setting up the entity name resolver
+    entity_resolver = EntityResolver(nc=nc, max_size=configuration['cache_size'], ttl=configuration['cache_ttl'])
+
+    # Indexing all ACL entry templates by stats ID
+    acl_entry_template_index = ACLEntryTemplateIndex(nc=nc, page_size=configuration['page_size'])
+    acl_entry_template_index.prefetch()
+    acl_row_builder = ACLRowBuilder(acl_entry_template_index=acl_entry_template_index, entity_resolver=entity_resolver)
+
+    # Opening the snapshot and determining which ACL entry templates changed since the previous run
+    if configuration['snapshot_file']:
+        logger.debug('Opening snapshot %s' % configuration['snapshot_file'])
+        snapshot = ReportSnapshot(configuration['snapshot_file'])
+        stale_template_keys = snapshot.compare_templates(acl_entry_template_index.signatures())
+        if configuration['full'] or stale_template_keys is None:
+            logger.info('Fetching the policy decisions of all VM interfaces')
+            stale_template_keys = None
+        else:
+            logger.info('%s ACL entry templates changed or were removed since the snapshot' % len(stale_template_keys))
+
     # Setting output correctly
     output_fields = [
         'VM Name',
@@ -521,17 +358,41 @@ def main():
         'Action'
     ]
 
+    if configuration['diff']:
+        output_fields.insert(0, 'Change')
+
     # Starting output
-    if configuration['json_output']:
+    output_stream = open_output(output_file=configuration['output_file'], compress=configuration['gzip'])
+    if configuration['stream_format']:
+        logger.debug('{0:s} streaming output enabled, not setting up an output table'.format(configuration['stream_format'].upper()))
+        output_parser = StreamingOutput(stream=output_stream, stream_format=configuration['stream_format'], fields=output_fields)
+    elif configuration['json_output']:
         logger.debug('JSON output enabled, not setting up an output table')
         output_parser = []
     else:
         logger.debug('Setting up output table')
         output_parser = PrettyTable(output_fields)
 
+    # Starting the policy decision workers, enumeration feeds them through a bounded queue
+    if configuration['max_rate']:
+        logger.debug('Limiting policy decision requests to {0} per second'.format(configuration['max_rate']))
+        rate_limiter = RateLimiter(max_rate=configuration['max_rate'])
+
+    work_queue = None
+    workers = []
+    if configuration['workers'] > 1:
+        logger.debug('Starting {0} policy decision workers'.format(configuration['workers']))
+        work_queue = queue.Queue(maxsize=configuration['queue_size'])
+        for _ in range(configuration['workers']):
+            worker = threading.Thread(target=policy_decision_worker, args=(work_queue,))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
     # Gathering Enterprises
     for enterprise in nc.user.enterprises.get():
         logger.debug('Handling enterprise {0:s}'.format(enterprise.name))
+        vm_index = VMIndex(enterprise=enterprise, page_size=configuration['page_size'])
 
         # Handling L2 domains
         for l2_domain in enterprise.l2_domains.get():
@@ -539,8 +400,8 @@ def main():
             if l2_domain.associated_shared_network_resource_id:
                 logger.info('L2 domain {0:s} is linked to a Shared Network'.format(l2_domain.name))
                 for vm_interface in l2_domain.vm_interfaces.get():
-                    logger.debug('Handling VM interface with MAC {0:s}'.format(vm_interface.mac))
-                    handle_vm_interface(vm_interface=vm_interface, enterprise=enterprise, domain=l2_domain, domain_type='L2', nc=nc)
+                    logger.debug('Handling VM interface with MAC {0!s}'.format(vm_interface.mac))
+                    submit_vm_interface(work_queue, vm_interface=vm_interface, enterprise=enterprise, vm_index=vm_index, domain=l2_domain, domain_type='L2', nc=nc)
 
         # Handling L3 domains
         for domain in enterprise.domains.get():
@@ -550,14 +411,37 @@ def main():
                 if subnet.associated_shared_network_resource_id:
                     logger.info('Subnet {0:s} is linked to a Shared Network'.format(subnet.name))
                     for vm_interface in subnet.vm_interfaces.get():
-                        logger.debug('Handling VM interface with MAC {0:s}'.format(vm_interface.mac))
-                        handle_vm_interface(vm_interface=vm_interface, enterprise=enterprise, domain=domain, domain_type='L3', nc=nc)
-
-    logger.debug('Printing output')
-    if configuration['json_output']:
-        print(json.dumps(output_parser, sort_keys=True, indent=4))
+                        logger.debug('Handling VM interface with MAC {0!s}'.format(vm_interface.mac))
+                        submit_vm_interface(work_queue, vm_interface=vm_interface, enterprise=enterprise, vm_index=vm_index, domain=domain, domain_type='L3', nc=nc)
+
+    # Stopping the workers once the queue is handled
+    if work_queue is not None:
+        for _ in workers:
+            work_queue.put(None)
+        for worker in workers:
+            worker.join()
+
+    # Handling the VM interfaces which no longer exist
+    if snapshot is not None:
+        for output in snapshot.remove_unseen():
+            if configuration['diff']:
+                output['Change'] = 'Removed'
+                handle_output(output=output)
+        snapshot.close()
+
+    entity_resolver.log_statistics()
+
+    if configuration['stream_format']:
+        logger.info('Streamed {0} rows'.format(output_parser.count))
+    elif configuration['json_output']:
+        logger.debug('Printing output')
+        print(json.dumps(output_parser, sort_keys=True, indent=4), file=output_stream)
     else:
-        print(output_parser.get_string())
+        logger.debug('Printing output')
+        print(output_parser.get_string(), file=output_stream)
+
+    if configuration['output_file']:
+        output_stream.close()
 
     return 0
 
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+vspk_examples_common.py contains the helpers shared by several scripts:
+ get_all_pages is used by acl_analytics_common.py, gather_statistics.py and
+ nuage_acl_learner.py, iterate_all_pages by events_overview.py, open_output
+ and StreamingOutput by vm_policies_overview.py,
+ shared_domain_vports_acl_analytics.py and events_overview.py.
+
+It is not meant to be run on its own, the scripts import it from the same
+ folder.
+
+--- Version history ---
+2026-10-18 - 1.0.0 - Paging and streaming output helpers, moved from acl_analytics_common.py
+2026-10-18 - 1.1.0 - Paging generator with filter and commit options
+"""
+from __future__ import division
+
+from builtins import object
+import csv
+import gzip
+import json
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def iterate_all_pages(fetcher, page_size, filter=None, commit=True):
+    """
+    Yields all the objects of a fetcher, fetching them in pages of page_size.
+    Without commit, the fetched objects are not kept in the fetcher, so memory
+    usage does not grow with the amount of objects.
+    """
+
+    page = 0
+    while True:
+        page_objects = fetcher.get(filter=filter, page=page, page_size=page_size, commit=commit)
+        for page_object in page_objects:
+            yield page_object
+        if len(page_objects) < page_size:
+            return
+        page += 1
+
+
+def get_all_pages(fetcher, page_size, filter=None, commit=True):
+    """
+    Fetches all the objects of a fetcher in pages of page_size
+    """
+
+    return list(iterate_all_pages(fetcher, page_size, filter=filter, commit=commit))
+
+
+def open_output(output_file=None, compress=False):
+    """
+    Opens the output file for writing text, gzip compressed if requested, or
+    returns stdout if no output file is specified
+    """
+
+    if not output_file:
+        return sys.stdout
+    if compress:
+        logger.debug('Writing gzip compressed output to file %s' % output_file)
+        return gzip.open(output_file, 'wt')
+    logger.debug('Writing output to file %s' % output_file)
+    return open(output_file, 'w')
+
+
+class StreamingOutput(object):
+    """
+    Writes each output as soon as it is handled, as newline delimited JSON
+    (NDJSON) or as a CSV row with the fields as header, so memory usage does
+    not grow with the size of the report. Callers writing from multiple threads
+    have to serialise the writes.
+    """
+
+    def __init__(self, stream, stream_format, fields):
+        self.stream = stream
+        self.stream_format = stream_format
+        self.count = 0
+        self._csv_writer = None
+        if stream_format == 'csv':
+            self._csv_writer = csv.DictWriter(stream, fieldnames=fields, extrasaction='ignore')
+            self._csv_writer.writeheader()
+
+    def write(self, output):
+        """
+        Writes a single output and flushes it
+        """
+
+        if self._csv_writer is not None:
+            self._csv_writer.writerow(output)
+        else:
+            self.stream.write('%s\n' % json.dumps(output, sort_keys=True))
+        self.stream.flush()
+        self.count += 1